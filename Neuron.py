@@ -1,13 +1,18 @@
 #from random import *
+import heapq
 import math
 import random
 import time
 
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy
 
-from graphics import *
+from engine import ArrayEngine, BandedConnectivity, decayChanged, _ranges
+from monitor import ProgressReporter, PrintSpikeSink
+from rendering import FrameBuffer, FrameQueue, FrameRasterizer, runRecorded,\
+    runRendered
+
+# matplotlib and graphics (Tk) are imported by the methods that plot or draw,
+# so that simulations start fast and run without a display
 
 
 #%%
@@ -22,6 +27,9 @@ class Neuron(object):
         default initialized to 1; must be greater than zero.
     "refractCount": is the refractory time left since this neuron last
         fired. Must be between 0 and "refractory", inclusive.
+    "recordHistory": if False, spikeTimes and voltageHistory are not kept.
+    "spikeVoltage": the voltage before the reset at the last spike, as in
+        voltageHistory, or None if the neuron has not fired.
     """
 
     def __init__(self, avoltage = 0, athreshold = 1, arefractory = 1, aname=""):
@@ -51,6 +59,8 @@ class Neuron(object):
         self.refractCount = 0
         self.spikeTimes = []
         self.voltageHistory = [avoltage]
+        self.recordHistory = True
+        self.spikeVoltage = None
         self.name = aname
         if self.name=="":
             self.name = str(self)
@@ -75,45 +85,62 @@ class Neuron(object):
         self.voltage += self.sumInputs
         self.sumInputs = 0
         self.refractCount -= 1
-        self.voltageHistory.append(self.voltage)
+        if self.recordHistory:
+            self.voltageHistory.append(self.voltage)
         if(self.refractCount <= 0):
             self.refractCount = 0
             if(self.voltage >= self.threshold):
-                self.spikeTimes.append(currentTau)
+                if self.recordHistory:
+                    self.spikeTimes.append(currentTau)
                 self.AP()
+                self.spikeVoltage = self.voltage
                 self.voltage -= abs(self.threshold)
                 self.refractCount = self.refractory
-                print("AP at "+ str(currentTau) + " at " + self.name)
                 return True
         return False
 
     def getCompleteSpikeTimes(self):
         """builds and returns completeSpikeTimes,
-        which is a list of the spikes at all times
+        which is a list of the spikes at all times, from 0 to the last spike
+        included: 1 at the taus at which this neuron fired, 0 elsewhere
         """
-        maxTauToDisplay = max(self.spikeTimes)
-        self.completeSpikeTimes= []
-        for i in range(maxTauToDisplay):
-            if(i in self.spikeTimes):
-                self.completeSpikeTimes.append(1)
-            else:
-                self.completeSpikeTimes.append(0)
+        complete = numpy.zeros(int(max(self.spikeTimes, default=-1)) + 1,
+                               dtype=int)
+        complete[numpy.asarray(self.spikeTimes, dtype=numpy.int64)] = 1
+        self.completeSpikeTimes = complete.tolist()
         return self.completeSpikeTimes
 
-    def plotSpikes(self):
-        """ using matplotlib.pyplot.plot, plots spikes verses time graph"""
-        self.getCompleteSpikeTimes()
-        b=numpy.ones_like(self.completeSpikeTimes)
+    def plotSpikes(self, source=None):
+        """ using matplotlib.pyplot.plot, plots spikes verses time graph
+        "source": a Recorder or RecordingReader to read the spikes from,
+                instead of spikeTimes
+        """
+        import matplotlib.pyplot
+        if source is None:
+            spikeTimes = self.spikeTimes
+            self.getCompleteSpikeTimes()
+            b=numpy.ones_like(self.completeSpikeTimes)
+        else:
+            spikeTimes = source.spikeTimes(self)
+            b=numpy.ones(int(max(spikeTimes)) + 1 if len(spikeTimes) else 0)
         matplotlib.pyplot.plot(b)
-        matplotlib.pyplot.eventplot(self.spikeTimes)
+        matplotlib.pyplot.eventplot(spikeTimes)
         matplotlib.pyplot.xlabel("time")
         matplotlib.pyplot.title("single neuron raster plot of Neuron "+self.name)
         matplotlib.pyplot.show()
 
 
-    def plotVoltage(self):
-        """ using matplotlib.pyplot.plot, plots voltage verses time graph"""
-        matplotlib.pyplot.plot(self.voltageHistory)
+    def plotVoltage(self, source=None):
+        """ using matplotlib.pyplot.plot, plots voltage verses time graph
+        "source": a Recorder or RecordingReader to read the voltage from,
+                instead of voltageHistory
+        """
+        import matplotlib.pyplot
+        if source is None:
+            matplotlib.pyplot.plot(self.voltageHistory)
+        else:
+            matplotlib.pyplot.plot(source.sampleTimes(),
+                                   source.samplesOf(self))
         matplotlib.pyplot.xlabel("time")
         matplotlib.pyplot.ylabel("Voltage")
         matplotlib.pyplot.title("Voltage/time graph of Neuron "+self.name)
@@ -122,7 +149,9 @@ class Neuron(object):
 class LIFNeuron(Neuron):
     """ Class Invariant:
     Inherits Neuron
-    decayConstant: number that determines the rate of leakiness
+    decayConstant: number that determines the rate of leakiness; not 0
+    decayFactor: 1-(1/decayConstant), the fraction of the voltage kept after
+    one tau; updated whenever decayConstant is set
     """
 
     def __init__(self, avoltage=0, athreshold=1, arefractory=1, adecay=5, aname=""):
@@ -137,9 +166,26 @@ class LIFNeuron(Neuron):
              arefractory=arefractory, aname=aname)
         self.decayConstant= adecay
 
+    @property
+    def decayConstant(self):
+        return self._decayConstant
+
+    @decayConstant.setter
+    def decayConstant(self, adecay):
+        if adecay == 0:
+            raise ValueError("the decayConstant of " + self.name + " must " +
+                             "not be 0: each tau the neuron keeps " +
+                             "1-(1/decayConstant) of its voltage")
+        self._decayConstant = adecay
+        self.decayFactor = 1-(1/adecay)
+        decayChanged(self)
+
     def leak(self, numTauSteps):
         """ calculates the desired leak in the neuron for numTauSteps"""
-        self.voltage= self.voltage*((1-(1/self.decayConstant))**(numTauSteps))
+        if numTauSteps == 1:
+            self.voltage= self.voltage*self.decayFactor
+        else:
+            self.voltage= self.voltage*(self.decayFactor**(numTauSteps))
 
     def check(self, currentTau):
         """ called by simulator
@@ -207,6 +253,8 @@ class Synapse(object):
         """ decrements all of activateFireDelays by 1;
         when one of activateFireDelays is 0, pops it off the list and calls fire
         """
+        if not self.activateFireDelays:
+            return
         self.activateFireDelays = [x-1 for x in self.activateFireDelays]
         count = 0
         while count < len(self.activateFireDelays) and self.activateFireDelays[count]==0:
@@ -215,7 +263,17 @@ class Synapse(object):
         self.activateFireDelays = self.activateFireDelays[count:]
 
     @classmethod
-    def connect(cls, Alist, Blist, weight=1, d=1):
+    def connect(cls, Alist, Blist, weight=1, d=1, store=None):
+        """ connects every neuron of Alist to every neuron of Blist;
+        if "store" (a Connectivity) is given, the edges are added to it in
+        bulk instead of being created as Synapse objects, and store is returned
+        """
+        if store is not None:
+            pre = store.indicesOf(Alist)
+            post = store.indicesOf(Blist)
+            store.addEdges(numpy.repeat(pre, len(post)),
+                           numpy.tile(post, len(pre)), weight, d)
+            return store
         synapseList = []
         for i in Alist:
             for j in Blist:
@@ -223,40 +281,113 @@ class Synapse(object):
         return synapseList
 
     @classmethod
-    def randomConnect(cls, Alist, Blist, weight=1, d=1, probability=0.5):
+    def randomConnect(cls, Alist, Blist, weight=1, d=1, probability=0.5,
+                      store=None, rng=None):
+        """ connects each neuron of Alist to each neuron of Blist with the
+        given probability.
+        "rng": a numpy.random.Generator; if given, the edges are drawn in
+        bulk with numpy (see _samplePairs) instead of with one
+        random.random() per pair, so the network differs from the one the
+        random module would give but depends only on the state of rng
+        """
+        if rng is not None:
+            i, j = _samplePairs(rng, len(Alist), len(Blist), probability)
+            return cls._buildArrays(Alist, Blist, i, j, weight, d, store)
         synapseList = []
         for i in Alist:
             for j in Blist:
                 if(random.random()<probability):
-                    synapseList.append(cls(i,j,weight,d))
-        return synapseList
+                    synapseList.append((i,j,weight))
+        return cls._build(synapseList, d, store)
 
     @classmethod
-    def randomWeightConnect(cls, Alist, Blist, minWeight=-1, maxWeight=1, d=1):
+    def randomWeightConnect(cls, Alist, Blist, minWeight=-1, maxWeight=1, d=1,
+                            store=None, rng=None):
+        """ connects every neuron of Alist to every neuron of Blist with a
+        weight drawn uniformly from [minWeight, maxWeight); see randomConnect
+        for "rng"
+        """
+        if rng is not None:
+            i, j = _samplePairs(rng, len(Alist), len(Blist), 1)
+            weight = (rng.random(len(i)) * (maxWeight-minWeight)) + minWeight
+            return cls._buildArrays(Alist, Blist, i, j, weight, d, store)
         synapseList = []
         for i in Alist:
             for j in Blist:
                 weight= (random.random() * (maxWeight-minWeight)) + minWeight
-                synapseList.append(cls(i,j,weight,d))
-        return synapseList
+                synapseList.append((i,j,weight))
+        return cls._build(synapseList, d, store)
 
     @classmethod
     def randomWeightRandomConnect(cls, Alist, Blist, minWeight= -1, maxWeight= 1,
-                                  d=1, probability= 0.5):
+                                  d=1, probability= 0.5, store=None, rng=None):
+        """ randomConnect with the weights of randomWeightConnect; see
+        randomConnect for "rng"
+        """
+        if rng is not None:
+            i, j = _samplePairs(rng, len(Alist), len(Blist), probability)
+            weight = (rng.random(len(i)) * (maxWeight-minWeight)) + minWeight
+            return cls._buildArrays(Alist, Blist, i, j, weight, d, store)
         synapseList = []
         for i in Alist:
             for j in Blist:
                 if(random.random()< probability):
                     weight= (random.random() * (maxWeight - minWeight)) + minWeight
-                    synapseList.append(cls(i, j, weight, d))
-        return synapseList
+                    synapseList.append((i, j, weight))
+        return cls._build(synapseList, d, store)
 
     @classmethod
     def connectWeightedByDistance(cls, Alist, Blist, minWeight=0, maxWeight=1,
-                                  spread=-1, d=1):
-        synapseList = []
+                                  spread=-1, d=1, store=None, banded=False):
+        """ connects Alist[i] to Blist[j] with a weight that falls with the
+        distance between their positions, both lists being centered on 0;
+        pairs further apart than "spread" (unless it is -1) are not connected.
+        "banded": return a BandedConnectivity that holds one weight per
+        offset j - i instead of one per edge; it needs a spread and is
+        simulated as a convolution (add it with Simulator.addConnectivity);
+        it cannot be combined with a store
+        """
         translate1= -len(Alist)/2
         translate2= -len(Blist)/2
+        if banded:
+            if store is not None:
+                raise ValueError("a banded connectivity is its own store; "
+                                 "do not give one")
+            if spread == -1:
+                raise ValueError("a banded connectivity needs a spread")
+            # distance = |c - (j - i)| with c = translate1 - translate2
+            center = translate1 - translate2
+            offsets = numpy.arange(math.ceil(center - spread),
+                                   math.floor(center + spread) + 1)
+            distance = numpy.abs(center - offsets)
+            weights = ((maxWeight - minWeight)/(distance + 1)) + minWeight
+            return BandedConnectivity(Alist, Blist, offsets[0] if len(offsets)
+                                      else 0, weights, d)
+        if store is not None:
+            if spread == -1:
+                i, j = _samplePairs(None, len(Alist), len(Blist), 1)
+            else:
+                # only the band of j within spread of each i is enumerated:
+                # distance <= spread for ceil(i + c - spread) <= j <=
+                # floor(i + c + spread), with c = translate1 - translate2
+                i = numpy.arange(len(Alist))
+                center = i + (translate1 - translate2)
+                starts = numpy.clip(numpy.ceil(center - spread), 0, len(Blist))
+                stops = numpy.clip(numpy.floor(center + spread) + 1, starts,
+                                   len(Blist))
+                starts = starts.astype(numpy.intp)
+                stops = stops.astype(numpy.intp)
+                i = numpy.repeat(i, stops - starts)
+                j = _ranges(starts, stops)
+            distance = numpy.abs((i + translate1) - (j + translate2))
+            keep = distance <= spread if spread != -1 else\
+                numpy.ones(distance.shape, dtype=bool)
+            weights = ((maxWeight - minWeight)/(distance[keep] + 1)
+                       + minWeight)
+            store.addEdges(store.indicesOf(Alist)[i[keep]],
+                           store.indicesOf(Blist)[j[keep]], weights, d)
+            return store
+        synapseList = []
         for i in range(len(Alist)):
             for j in range(len(Blist)):
                 distance= abs((i + translate1) - (j + translate2))
@@ -265,96 +396,584 @@ class Synapse(object):
                     weight=((maxWeight - minWeight)/(distance + 1)) + minWeight, adelay=d))
         return synapseList
 
+    @classmethod
+    def _build(cls, edgeList, d, store):
+        """ turns a list of (pre, post, weight) into Synapse objects, or adds
+        it to store in one call if store is a Connectivity
+        """
+        if store is None:
+            return [cls(i, j, weight, d) for i, j, weight in edgeList]
+        if edgeList:
+            pre, post, weight = zip(*edgeList)
+            store.addEdges(store.indicesOf(pre), store.indicesOf(post),
+                           weight, d)
+        return store
+
+    @classmethod
+    def _buildArrays(cls, Alist, Blist, i, j, weight, d, store):
+        """ same as _build for the edges Alist[i[k]] -> Blist[j[k]], given as
+        arrays of positions; "weight" is one weight or one per edge
+        """
+        if store is not None:
+            store.addEdges(store.indicesOf(Alist)[i],
+                           store.indicesOf(Blist)[j], weight, d)
+            return store
+        weight = numpy.broadcast_to(weight, i.shape).tolist()
+        return [cls(Alist[a], Blist[b], w, d)
+                for a, b, w in zip(i.tolist(), j.tolist(), weight)]
+
+
+# below this probability, pairs are drawn by geometric skips instead of a mask
+SPARSE_PROBABILITY = 0.05
+
+# number of candidate pairs handled at once when drawing pairs
+PAIR_BLOCK = 1 << 22
+
+
+def _samplePairs(rng, numA, numB, probability):
+    """ Precondition:
+    "rng": a numpy.random.Generator, or None if probability >= 1.
+    returns the int32 arrays (i, j) of the pairs 0 <= i < numA,
+    0 <= j < numB that are kept, each with the given probability, in
+    row-major order.
+    dense probabilities test a block of rows at a time against a Bernoulli
+    mask; sparse ones draw the gaps between kept pairs from a geometric
+    distribution, so the cost follows the number of pairs kept
+    """
+    total = numA * numB
+    pairs = []
+
+    def keep(flat):
+        pairs.append(((flat // numB).astype(numpy.int32),
+                      (flat % numB).astype(numpy.int32)))
+
+    if total == 0 or probability <= 0:
+        pass
+    elif probability >= 1:
+        for start in range(0, total, PAIR_BLOCK):
+            keep(numpy.arange(start, min(total, start + PAIR_BLOCK),
+                              dtype=numpy.int64))
+    elif probability < SPARSE_PROBABILITY:
+        position = -1
+        while True:
+            expected = (total - position) * probability
+            size = int(min(PAIR_BLOCK, expected + 4 * expected ** 0.5 + 16))
+            positions = position + numpy.cumsum(rng.geometric(probability,
+                                                              size))
+            keep(positions[positions < total])
+            if positions[-1] >= total:
+                break
+            position = positions[-1]
+    else:
+        rows = max(1, PAIR_BLOCK // numB)
+        for start in range(0, numA, rows):
+            block = min(rows, numA - start)
+            keep(numpy.flatnonzero(rng.random((block, numB)) < probability)
+                 + start * numB)
+    if not pairs:
+        return (numpy.empty(0, dtype=numpy.int32),
+                numpy.empty(0, dtype=numpy.int32))
+    return (numpy.concatenate([i for i, j in pairs]),
+            numpy.concatenate([j for i, j in pairs]))
+
+
+def _isVectorizable(anObject):
+    """ True if anObject only uses the update rules of Neuron, LIFNeuron,
+    MCPNeuron or Synapse, which the ArrayEngine reproduces
+    """
+    cls = type(anObject)
+    if isinstance(anObject, Neuron):
+        if isinstance(anObject, LIFNeuron):
+            update = (cls.check is LIFNeuron.check and
+                      cls.leak is LIFNeuron.leak)
+        else:
+            update = cls.check is Neuron.check
+        return update and cls.addVoltage is Neuron.addVoltage and\
+            cls.AP is Neuron.AP
+    if isinstance(anObject, Synapse):
+        return (cls.check is Synapse.check and cls.fire is Synapse.fire and
+                cls.activate is Synapse.activate)
+    return False
 
 #%%
+class InputSchedule(object):
+    """ Class Invariant:
+    Timed inputs to neurons, handed out in time order; inputs with equal
+    times come out in the order in which they were added. Times that are
+    whole numbers are kept as ints; an input at any other time is never due.
+    "heap": heap of [time, sequence, neuron, voltage] added one at a time.
+    "runs": list of [times, sequences, neurons, voltages, cursor] added in
+        bulk; each run is sorted by time and entries before cursor are spent.
+    "count": number of inputs added so far, used as the next sequence number.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.runs = []
+        self.count = 0
+
+    def __len__(self):
+        return len(self.heap) + sum(len(run[0]) - run[4] for run in self.runs)
+
+    def append(self, aTime, aNeuron, aVoltage):
+        if aTime % 1 == 0:
+            aTime = int(aTime)
+        heapq.heappush(self.heap, [aTime, self.count, aNeuron, aVoltage])
+        self.count += 1
+
+    def extend(self, times, neurons, voltages):
+        """ Precondition:
+        "times": array of input times in tau, in any order.
+        "neurons": sequence of Neuron instances, one per time.
+        "voltages": one voltage, or an array with one voltage per time.
+        adds all the inputs with one sort
+        """
+        times = numpy.asarray(times)
+        if times.dtype.kind == "f" and numpy.all(times % 1 == 0):
+            times = times.astype(numpy.int64)
+        if len(neurons) != len(times):
+            raise ValueError("times and neurons must have the same length")
+        voltages = numpy.broadcast_to(voltages, times.shape)
+        order = numpy.argsort(times, kind="stable")
+        self.runs.append([times[order], order + self.count,
+                          [neurons[i] for i in order.tolist()],
+                          voltages[order].tolist(), 0])
+        self.count += len(times)
+
+    def nextTime(self):
+        """ returns the first tau at which an input can be due, as an int,
+        or None if there is none
+        """
+        times = [run[0][run[4]] for run in self.runs if run[4] < len(run[0])]
+        if self.heap:
+            times.append(self.heap[0][0])
+        return int(math.ceil(min(times))) if times else None
+
+    def popDue(self, currentTau):
+        """ removes and returns the inputs due at currentTau as a list of
+        (neuron, voltage); inputs due before currentTau are discarded
+        """
+        due = []
+        heap = self.heap
+        while heap and heap[0][0] <= currentTau:
+            aTime, sequence, aNeuron, aVoltage = heapq.heappop(heap)
+            if aTime == currentTau:
+                due.append((sequence, aNeuron, aVoltage))
+        for run in self.runs:
+            times, cursor = run[0], run[4]
+            if cursor < len(times) and times[cursor] <= currentTau:
+                start = cursor + numpy.searchsorted(times[cursor:], currentTau)
+                run[4] = stop = cursor + numpy.searchsorted(
+                    times[cursor:], currentTau, side="right")
+                due.extend(zip(run[1][start:stop].tolist(), run[2][start:stop],
+                               run[3][start:stop]))
+        if any(run[4] == len(run[0]) for run in self.runs):
+            self.runs = [run for run in self.runs if run[4] < len(run[0])]
+        if len(due) > 1:
+            due.sort(key=lambda x: x[0])
+        return [(aNeuron, aVoltage) for sequence, aNeuron, aVoltage in due]
+
+    def popBefore(self, aTime):
+        """ removes and returns the inputs due before aTime as a list of
+        [time, neuron, voltage], in the order popDue would hand them out
+        """
+        entries = self.remaining()
+        self.heap = []
+        self.runs = []
+        due = [entry for entry in entries if entry[0] < aTime]
+        for entry in entries[len(due):]:
+            self.append(*entry)
+        return due
+
+    def remaining(self):
+        """ returns the inputs still to come as a list of [time, neuron,
+        voltage], sorted by time
+        """
+        entries = [(t, s, nrn, v) for t, s, nrn, v in self.heap]
+        for times, sequences, neurons, voltages, cursor in self.runs:
+            entries.extend(zip(times[cursor:].tolist(),
+                               sequences[cursor:].tolist(),
+                               neurons[cursor:], voltages[cursor:]))
+        entries.sort(key=lambda x: (x[0], x[1]))
+        return [[t, nrn, v] for t, s, nrn, v in entries]
+
+
 class Simulator(object):
     """ Class invariant:
         "synapseCheckList": list of synapses to be checked in the next timestep
         "neuronCheckList": list of neurons to be checked in the next timestep
         "tau": minimum timestep. All time is in unit tau
         "finalTau": the last time (in tau) we care about
-        inputArray: 2 dimensional array, dimensions 3*n, that
-        		stores info about when to stimulate which neuron with what voltage
+        "inputSchedule": InputSchedule that stores info about when to
+                stimulate which neuron with what voltage
+        inputArray: read-only tuple of (time, neuron, voltage), a sorted
+                snapshot of the inputs left in inputSchedule. Unlike the list
+                it used to be, it cannot be edited in place: add inputs with
+                appendInput or appendInputs, or assign a whole new list
+        "vectorized": if True, runOneTimeStep advances the network with an
+                ArrayEngine instead of calling check on every object
+        "_onEngine": True while an event-driven run steps the network on
+                the ArrayEngine, whatever vectorized says
+        "engine": the ArrayEngine built from the check lists, or None
+        "connectivityList": list of Connectivity stores whose edges are
+                simulated along with synapseCheckList; they always run on
+                the ArrayEngine
+        "progress": ProgressReporter told about every simulated tau, or None
+        "checkpointer": Checkpointer (see network.py) that saves the network
+                as it runs, or None
+        "profiler": Profiler (see monitor.py) given the timings and counts
+                of every tau, or None
+        "spikeSinks": list of SpikeSinks given the neurons that fire at each
+                tau
+        "recorders": list of Recorders sampled after every simulated tau
+        "recordHistory": value given to the recordHistory of added neurons
+        "startTau": the tau at which main starts; 0 unless the network was
+                loaded from the middle of a run (see network.py)
+        "nextTau": the tau after the last one simulated
     """
-    def __init__(self, t= 1, finalT= 10000000):
+    def __init__(self, t= 1, finalT= 10000000, vectorized=False, verbose=False,
+                 recordHistory=True):
         """ Precondition:
+        "vectorized": run the network on the array engine (see engine.py);
+                every neuron and synapse must be of a type it supports
+        "verbose": print every tau and every action potential; by default
+                nothing is printed while the simulation runs
+        "recordHistory": if False, added neurons do not keep spikeTimes and
+                voltageHistory; use Recorders to choose what is kept
         """
         self.synapseCheckList=[]
         self.neuronCheckList=[]
         self.tau=t
         self.finalTau=finalT
-        self.inputArray= []
+        self.inputSchedule = InputSchedule()
+        self.vectorized = vectorized
+        self._onEngine = False
+        self.engine = None
+        self.connectivityList = []
+        self._carry = None
+        self.progress = None
+        self.checkpointer = None
+        self.profiler = None
+        self.spikeSinks = []
+        self.recorders = []
+        self.recordHistory = recordHistory
+        self.startTau = 0
+        self.nextTau = 0
+        if verbose:
+            self.progress = ProgressReporter(everyTicks=1, write=print)
+            self.spikeSinks.append(PrintSpikeSink())
 
     def addNeuron(self, aNeuron):
+        self.invalidateEngine()
+        if not self.recordHistory:
+            aNeuron.recordHistory = False
         self.neuronCheckList.append(aNeuron)
 
     def addSynapse(self, aSynapse):
+        self.invalidateEngine()
         self.synapseCheckList.append(aSynapse)
 
+    def addRecorder(self, aRecorder):
+        self.recorders.append(aRecorder)
+        return aRecorder
+
+    def addConnectivity(self, aConnectivity):
+        self.invalidateEngine()
+        self.connectivityList.append(aConnectivity)
+
+    def buildEngine(self, currentTau=0):
+        """ packs neuronCheckList and synapseCheckList into an ArrayEngine
+        that continues the simulation at currentTau
+        """
+        for neuron in self.neuronCheckList:
+            if not _isVectorizable(neuron):
+                raise TypeError(type(neuron).__name__ + " overrides the " +
+                                "Neuron update and cannot be vectorized")
+        for synapse in self.synapseCheckList:
+            if not _isVectorizable(synapse):
+                raise TypeError(type(synapse).__name__ + " overrides the " +
+                                "Synapse update and cannot be vectorized")
+        self.engine = ArrayEngine(self.neuronCheckList, self.synapseCheckList,
+                                  currentTau, self.connectivityList,
+                                  self._carry)
+        self._carry = None
+        return self.engine
+
+    def syncObjects(self):
+        """ copies the state of the engine, if any, back into the neurons
+        and synapses, so that their attributes and histories are current
+        """
+        if self.engine is not None:
+            self.engine.sync()
+
+    def usesEngine(self):
+        """ returns True if runOneTimeStep advances the network with the
+        ArrayEngine
+        """
+        return self.vectorized or bool(self.connectivityList) or self._onEngine
+
+    def releaseEngine(self):
+        """ called after a run that needed the engine (event-driven or
+        partitioned): if the simulator does not use it otherwise, syncs and
+        drops it, so that the next run checks the objects again
+        """
+        if not self.usesEngine():
+            self.invalidateEngine()
+
+    def invalidateEngine(self):
+        """ syncs and drops the engine; the next time step rebuilds it """
+        if self.engine is not None:
+            self._carry = self.engine.sync()
+            self.engine = None
+
     def appendInput(self, aTime, aNeuron, aVoltage):
         """ Precondition:
         """
-        self.inputArray.append([aTime, aNeuron, aVoltage])
-        self.inputArray.sort(key = lambda x: x[0])
+        self.inputSchedule.append(aTime, aNeuron, aVoltage)
 
-    def main(self, useDelay = False):
-        """ runs a loop through all instants of tau """
-        for currentTau in range(0,self.finalTau):
-            print(currentTau)
+    def appendInputs(self, times, neurons, voltages):
+        """ Precondition:
+        "times": numpy array of input times in tau, in any order
+        "neurons": list of Neuron instances, one per time
+        "voltages": one voltage, or a numpy array with one voltage per time
+        adds all the inputs at once
+        """
+        self.inputSchedule.extend(times, neurons, voltages)
+
+    @property
+    def inputArray(self):
+        # a tuple, so that code appending to it fails instead of changing
+        # a copy
+        return tuple(tuple(entry) for entry in self.inputSchedule.remaining())
+
+    @inputArray.setter
+    def inputArray(self, anInputArray):
+        self.inputSchedule = InputSchedule()
+        for aTime, aNeuron, aVoltage in sorted(anInputArray,
+                                               key=lambda x: x[0]):
+            self.inputSchedule.append(aTime, aNeuron, aVoltage)
+
+    def main(self, useDelay = False, eventDriven = False, workers = None):
+        """ runs a loop through all instants of tau
+        "eventDriven": run on the ArrayEngine and jump straight over the
+                taus in which there is no input, no synaptic arrival and no
+                neuron that could fire; the skipped leak is applied in closed
+                form, as in LIFNeuron.leak, so the voltages can differ from
+                those of a tau by tau run by a few ULP (see
+                ArrayEngine.skip)
+        "workers": if given, split the neurons into that many shards and
+                simulate them in parallel processes (see parallel.py)
+        """
+        if workers is not None:
+            from parallel import runPartitioned
+            runPartitioned(self, workers, self.startTau)
+            self.finishRun()
+            self.releaseEngine()
+            return
+        if eventDriven:
+            self.runEventDriven(useDelay, self.startTau)
+            return
+        for currentTau in range(self.startTau,self.finalTau):
+            if self.progress is not None:
+                self.progress.update(currentTau, self.finalTau)
             self.runOneTimeStep(currentTau)
+            if self.checkpointer is not None:
+                self.checkpointer.update(self)
             if useDelay:
                 time.sleep(self.tau)
+        self.finishRun()
+
+    def runEventDriven(self, useDelay = False, startTau = 0):
+        """ runs from startTau to finalTau, visiting only the taus at which
+        something can happen (see ArrayEngine.nextEventTau); the taus that
+        are visited are stepped on the ArrayEngine even if the simulator is
+        not vectorized
+        """
+        self._onEngine = True
+        try:
+            self._runEvents(useDelay, startTau)
+        finally:
+            self._onEngine = False
+        self.releaseEngine()
+
+    def _runEvents(self, useDelay, startTau):
+        if self.engine is None:
+            self.buildEngine(startTau)
+        currentTau = startTau
+        while currentTau < self.finalTau:
+            nextInput = self.inputSchedule.nextTime()
+            if nextInput is None:
+                nextInput = self.finalTau
+            nextTau = self.engine.nextEventTau(
+                currentTau, max(currentTau, min(nextInput, self.finalTau)))
+            if nextTau > currentTau:
+                for recorder in self.recorders:
+                    recorder.recordSkip(self, currentTau, nextTau - currentTau)
+                if self.profiler is None:
+                    self.engine.skip(currentTau, nextTau - currentTau)
+                else:
+                    start = time.perf_counter()
+                    self.engine.skip(currentTau, nextTau - currentTau)
+                    self.profiler.tick(
+                        currentTau, (0, 0, 0, 0, time.perf_counter() - start),
+                        (0, 0, 0), nextTau - currentTau)
+                self.nextTau = nextTau
+            else:
+                if self.progress is not None:
+                    self.progress.update(currentTau, self.finalTau)
+                self.runOneTimeStep(currentTau)
+                nextTau = currentTau + 1
+            if self.checkpointer is not None:
+                self.checkpointer.update(self)
+            if useDelay:
+                time.sleep(self.tau * (nextTau - currentTau))
+            currentTau = nextTau
+        self.finishRun()
+
+    def finishRun(self):
+        """ called at the end of a simulation loop: brings the objects up to
+        date and closes the spike sinks
+        """
+        self.syncObjects()
+        for sink in self.spikeSinks:
+            sink.close()
+        for recorder in self.recorders:
+            recorder.flush()
 
     def runOneTimeStep(self, currentTau):
-        count = 0
-        while(count < len(self.inputArray) and\
-              currentTau==self.inputArray[count][0]):
-            self.inputArray[count][1].\
-            addVoltage(self.inputArray[count][2])
-            count += 1
-        self.inputArray = self.inputArray[count:]
+        if self.profiler is not None:
+            return self.runProfiledStep(currentTau)
+        if self.usesEngine():
+            firedNeurons = self.runOneVectorizedStep(currentTau)
+        else:
+            for aNeuron, aVoltage in self.inputSchedule.popDue(currentTau):
+                aNeuron.addVoltage(aVoltage)
 
-        for synapseToCheck in self.synapseCheckList:
-            synapseToCheck.check(currentTau)
+            for synapseToCheck in self.synapseCheckList:
+                synapseToCheck.check(currentTau)
 
-        firedNeurons = []
-        for neuronToCheck in self.neuronCheckList:
-            firedNeurons.append(neuronToCheck.check(currentTau))
+            firedNeurons = []
+            for neuronToCheck in self.neuronCheckList:
+                firedNeurons.append(neuronToCheck.check(currentTau))
+        if self.spikeSinks:
+            self.reportSpikes(currentTau, firedNeurons)
+        for recorder in self.recorders:
+            recorder.record(self, currentTau, firedNeurons)
+        self.nextTau = currentTau + 1
         return firedNeurons
 
-    def rasterPlot(self, aNeuronList):
-        """ show a raster plot """
-        xLocs = []
-        yLocs = []
-        yLoc = 0
-        for neuron in aNeuronList:
-            spikeTimes = neuron.spikeTimes
-            for i in range(len(spikeTimes)):
-                xLocs.append(spikeTimes[i])
-                yLocs.append(yLoc)
-            yLoc += 1
-        matplotlib.pyplot.plot(xLocs,yLocs,'r.')
-        matplotlib.pyplot.axis([0, self.finalTau, 0, yLoc])
+    def runProfiledStep(self, currentTau):
+        """ same as runOneTimeStep, timing each of its phases for profiler """
+        clock = time.perf_counter
+        start = clock()
+        due = self.inputSchedule.popDue(currentTau)
+        if self.usesEngine():
+            if self.engine is None:
+                self.buildEngine(currentTau)
+            engine = self.engine
+            for aNeuron, aVoltage in due:
+                engine.addInput(aNeuron, aVoltage)
+            afterInputs = clock()
+            numEvents = engine.numEvents
+            # step pops the same slot again and finds it empty
+            engine.ring.pop(currentTau, engine.sumInputs)
+            afterSynapses = clock()
+            firedNeurons = engine.step(currentTau)
+            numSpikes = int(numpy.count_nonzero(firedNeurons))
+            numEvents = engine.numEvents - numEvents
+        else:
+            for aNeuron, aVoltage in due:
+                aNeuron.addVoltage(aVoltage)
+            afterInputs = clock()
+            numEvents = 0
+            for synapseToCheck in self.synapseCheckList:
+                numEvents += len(synapseToCheck.activateFireDelays)
+                synapseToCheck.check(currentTau)
+                numEvents -= len(synapseToCheck.activateFireDelays)
+            afterSynapses = clock()
+            firedNeurons = []
+            for neuronToCheck in self.neuronCheckList:
+                firedNeurons.append(neuronToCheck.check(currentTau))
+            numSpikes = sum(firedNeurons)
+        afterNeurons = clock()
+        if self.spikeSinks:
+            self.reportSpikes(currentTau, firedNeurons)
+        for recorder in self.recorders:
+            recorder.record(self, currentTau, firedNeurons)
+        self.nextTau = currentTau + 1
+        self.profiler.tick(currentTau,
+                           (afterInputs - start, afterSynapses - afterInputs,
+                            afterNeurons - afterSynapses,
+                            clock() - afterNeurons, 0),
+                           (numSpikes, numEvents, len(due)))
+        return firedNeurons
+
+    def reportSpikes(self, currentTau, firedNeurons):
+        """ passes the neurons that fired at currentTau to every spike sink """
+        indices = numpy.flatnonzero(firedNeurons)
+        if len(indices):
+            neurons = [self.neuronCheckList[i] for i in indices.tolist()]
+            for sink in self.spikeSinks:
+                sink.spikes(currentTau, neurons)
+
+    def runOneVectorizedStep(self, currentTau):
+        """ same as runOneTimeStep, but advances the whole network in one
+        batched ArrayEngine step; returns a boolean array aligned with
+        neuronCheckList
+        """
+        if self.engine is None:
+            self.buildEngine(currentTau)
+        for aNeuron, aVoltage in self.inputSchedule.popDue(currentTau):
+            self.engine.addInput(aNeuron, aVoltage)
+        return self.engine.step(currentTau)
+
+    def rasterPlot(self, aNeuronList, source=None):
+        """ show a raster plot; large populations are binned (see
+        analysis.rasterPlot)
+        "source": a Recorder or RecordingReader to read the spikes from,
+                instead of the neurons' spikeTimes
+        """
+        import matplotlib.pyplot
+        from analysis import rasterPlot
+        rasterPlot(aNeuronList, self.finalTau, source)
         matplotlib.pyplot.xlabel("Time (tau)")
         matplotlib.pyplot.ylabel("Neurons (index)")
         matplotlib.pyplot.title("Raster Plot")
         matplotlib.pyplot.show()
 
+class _WindowClosed(Exception):
+    """ raised in the simulation thread of GraphicSimulator.main once the
+    window was closed, to end the simulation loop
+    """
+
 class GraphicSimulator(Simulator):
     """Class Invariants:
         Inherits Simulator
         constructList: List of the neurons to be drawn.
         storageList: List of the drawn neurons, and the Circle objects that represent them
+        circles: dict mapping each drawn neuron to its Circle
+        checkedCircles: the Circle of each neuron of neuronCheckList, or None
+        previousNeuronStatusList: boolean array; True for the neurons of
+        neuronCheckList that are shown firing (in red)
         synapseConstList: List of drawn Synapses, and the points that are the
         locations of the Neurons that connect them
+        synapseLines: the Line of each Synapse of synapseConstList
         l: length of the graphics window
         h: Height of the graphics window
         win: the graphics window displayed
         locType: way to arrange points
+        fps: the most frames drawn per second while main runs
+        frames: the FrameBuffer (see rendering.py) the running simulation
+        publishes its spikes to, or None
+        stopped: True once the window was closed; the running simulation
+        then stops at its next time step
 
     """
-    def __init__(self, t= 1, finalT=10000000,l=1000, h=500, locType=""):
+    def __init__(self, t= 1, finalT=10000000,l=1000, h=500, locType="",
+                 vectorized=False, verbose=False, fps=30):
         """Preconditions:
+        "fps": the most frames drawn per second; the simulation does not
+                wait for the display
         """
         self.constructList=[]
         self.h=h
@@ -364,8 +983,14 @@ class GraphicSimulator(Simulator):
         self.storageList.append([])
         self.synapseConstList=[]
         self.locType=locType
-        self.previousNeuronStatusList=[]
-        super(GraphicSimulator, self).__init__(t,finalT)
+        self.circles = {}
+        self.synapseLines = []
+        self.checkedCircles = []
+        self.previousNeuronStatusList=numpy.zeros(0, dtype=bool)
+        self.fps = fps
+        self.frames = None
+        self.stopped = False
+        super(GraphicSimulator, self).__init__(t,finalT,vectorized,verbose)
 
     def addNeuron(self, aNeuron):
         super(GraphicSimulator, self).addNeuron(aNeuron)
@@ -382,18 +1007,34 @@ class GraphicSimulator(Simulator):
 
     def makeG(self):
         """Builds graphical representations of all the Neurons in constructList with Circles,
-        and Synapses in synapseConstList with Lines, stores
-        them in storage List and synapseConstructList[0:1] and displays them
-        on the GraphWin win
+        and Synapses in synapseConstList with Lines (see layout), and displays
+        them on the GraphWin win
         """
-        count = 0
-        count1 = 0
+        from graphics import GraphWin
         self.win=GraphWin("Neurons",self.l,self.h,autoflush=False)
+        self.layout()
+        for circ in self.storageList[1]:
+            circ.draw(self.win)
+        for l in self.synapseLines:
+            l.draw(self.win)
+        self.win.update()
 
-        self.previousNeuronStatusList=[False for i in range(len(self.neuronCheckList))]
+    def layout(self):
+        """Builds the Circles of all the Neurons in constructList, stores
+        them in storageList and circles, and the Lines of the Synapses in
+        synapseConstList, stored in synapseLines, without drawing them
+        """
+        from graphics import Circle, Line
+        count = 0
+        count1 = 0
+        self.storageList = [[], []]
+        self.circles = {}
+        self.synapseLines = []
+        self.previousNeuronStatusList=numpy.zeros(len(self.neuronCheckList),
+                                                  dtype=bool)
 
         for ob in self.constructList:
-            if ob not in self.storageList[0]:
+            if isinstance(ob, list) or ob not in self.circles:
                 count1 += 1
                 a = ob
                 if not isinstance(a,list):
@@ -410,22 +1051,38 @@ class GraphicSimulator(Simulator):
                         r = 3
                     circ = Circle(self.assignLoc(count, count1, GraphicObjectType, len(a), i),r)
                     self.storageList[1].append(circ)
+                    self.circles[a[i]] = circ
         for circ in self.storageList[1]:
             circ.setFill("black")
-            circ.draw(self.win)
+        self.checkedCircles = [self.circles.get(n)
+                               for n in self.neuronCheckList]
         for i in range(len(self.synapseConstList)):
             a=self.synapseConstList[i]
             pre = a.pre
             post = a.post
-            preCoords = self.storageList[1][self.storageList[0].index(pre)].getCenter()
-            postCoords = self.storageList[1][self.storageList[0].index(post)].getCenter()
+            preCoords = self.circles[pre].getCenter()
+            postCoords = self.circles[post].getCenter()
             l = Line(preCoords,postCoords)
             if(a.weight<0):
                 l.setFill("blue")
             else:
                 l.setFill("green")
-            l.draw(self.win)
-        self.win.update()
+            self.synapseLines.append(l)
+
+    def rasterizer(self):
+        """ returns a FrameRasterizer (see rendering.py) of the layout, for
+        the neurons of neuronCheckList
+        """
+        indices = [i for i, c in enumerate(self.checkedCircles)
+                   if c is not None]
+        drawn = [self.checkedCircles[i] for i in indices]
+        centers = [(c.getCenter().getX(), c.getCenter().getY()) for c in drawn]
+        lines = [(l.getP1().getX(), l.getP1().getY(), l.getP2().getX(),
+                  l.getP2().getY()) for l in self.synapseLines]
+        return FrameRasterizer(self.l, self.h, numpy.reshape(centers, (-1, 2)),
+                               [c.getRadius() for c in drawn], lines,
+                               [l.config["fill"] for l in self.synapseLines],
+                               indices=indices)
 
     def assignLoc(self,count, count1, GraphicObjectType, l, i):
         """ Precondition
@@ -433,6 +1090,7 @@ class GraphicSimulator(Simulator):
             (boolean) GraphicObjectType: is this neuron in a neurongroup
             returns the desired coordinate point of an object, based on locType
         """
+        from graphics import Point
         if(self.locType=="linearRandom"):
             x = count*0.3
             y=self.h*random.random()
@@ -450,26 +1108,98 @@ class GraphicSimulator(Simulator):
                 y=self.h*random.random()
         return Point(x*10+20,y+20)
 
-    def main(self):
-        """ runs a loop through all instants of tau """
+    def runOneTimeStep(self, currentTau):
+        if self.stopped:
+            raise _WindowClosed()
+        firedNeurons = super(GraphicSimulator, self).runOneTimeStep(currentTau)
+        if self.frames is not None:
+            self.frames.publish(currentTau, firedNeurons)
+        return firedNeurons
+
+    def main(self, useDelay = True, eventDriven = False, writer = None,
+             ticksPerFrame = 1):
+        """ runs a loop through all instants of tau in a background thread
+        (see Simulator.main), while the window shows the neurons that fired
+        at most fps times per second
+        "useDelay": wait tau seconds after each tau, so that the network
+                runs in real time; if False it runs as fast as it can
+        "writer": if given, nothing is displayed: every frame is rendered
+                without Tk and passed to writer.write as an RGB array (see
+                PngWriter and FfmpegWriter in rendering.py), and writer is
+                closed at the end; the network runs as fast as it can
+        "ticksPerFrame": with a writer, the number of taus in each frame
+        """
+        if writer is not None:
+            self.record(writer, eventDriven, ticksPerFrame)
+            return
         self.makeG()
-        for currentTau in range(0,self.finalTau):
-            print(currentTau)
-            firedNeurons = super(GraphicSimulator, self).runOneTimeStep(currentTau)
-
-            for i,neuronToCheck in enumerate(self.neuronCheckList):
-                hasAP = firedNeurons[i]
-                c = self.storageList[1][self.storageList[0].index(neuronToCheck)]
-                if hasAP and (self.previousNeuronStatusList[i]==False):
-                    c.setFill("red")
-                    c.setOutline("red")
-                    self.previousNeuronStatusList[i]=True
-                elif self.previousNeuronStatusList[i]:
-                    c.setFill("black")
-                    c.setOutline("black")
-                    self.previousNeuronStatusList[i]=False
-                self.win.update()
-            time.sleep(self.tau)
+        self.frames = FrameBuffer(len(self.neuronCheckList))
+        self.stopped = False
+        try:
+            runRendered(lambda: self.runUntilClosed(useDelay, eventDriven),
+                        self.frames, self.drawFrame, self.fps,
+                        self.win.isOpen, self.stop, self.win.update)
+        finally:
+            self.frames = None
+
+    def stop(self):
+        """ makes the running simulation stop at its next time step """
+        self.stopped = True
+
+    def runUntilClosed(self, useDelay = True, eventDriven = False):
+        """ runs Simulator.main until it ends or stop is called; the objects
+        are then brought up to date with the last tau simulated
+        """
+        try:
+            super(GraphicSimulator, self).main(useDelay, eventDriven)
+        except _WindowClosed:
+            self.finishRun()
+
+    def record(self, writer, eventDriven = False, ticksPerFrame = 1):
+        """ runs the simulation, giving writer one frame per ticksPerFrame
+        taus, rendered in this thread while the network runs in another
+        """
+        self.layout()
+        rasterizer = self.rasterizer()
+        self.frames = FrameQueue(len(self.neuronCheckList), self.startTau,
+                                 self.finalTau, ticksPerFrame)
+        try:
+            runRecorded(lambda: super(GraphicSimulator, self).main(
+                            False, eventDriven),
+                        self.frames,
+                        lambda tau, fired:
+                            writer.write(rasterizer.render(fired)))
+        finally:
+            self.frames = None
+            writer.close()
+
+    def drawFrame(self, currentTau, fired):
+        """ shows the neurons of fired in red and the others in black, with
+        one update of the window; only the neurons whose color changes are
+        sent to Tk
+        """
+        changed = fired != self.previousNeuronStatusList
+        self.recolor(numpy.flatnonzero(changed & fired), "red")
+        self.recolor(numpy.flatnonzero(changed & ~fired), "black")
+        self.previousNeuronStatusList = fired
+        self.win.update()
+
+    def recolor(self, indices, color):
+        """ fills and outlines the circles of the neurons of neuronCheckList
+        at indices with color: the circles are given the tag color, which is
+        first taken off the others, and recolored through it in one
+        itemconfigure
+        """
+        circles = [self.checkedCircles[i] for i in indices.tolist()]
+        circles = [c for c in circles if c is not None]
+        if not circles:
+            return
+        for circ in circles:
+            circ.config["fill"] = circ.config["outline"] = color
+        self.win.dtag(color)
+        for circ in circles:
+            self.win.addtag_withtag(color, circ.id)
+        self.win.itemconfigure(color, fill=color, outline=color)
 
 if __name__=='__main__':
     #create graphics simulator for 120 seconds, timestep=0.1 seconds
@@ -2,7 +2,7 @@ from Neuron import Neuron, GraphicSimulator, LIFNeuron, MCPNeuron, Synapse
 
 if __name__ == '__main__':
     # create graphics simulator for 120 seconds, timestep=0.1 seconds
-    sim = GraphicSimulator(t=0.1, finalT=80)
+    sim = GraphicSimulator(t=0.1, finalT=80, vectorized=True)
 
     # create a single Neuron that will receive all inputs, and add it to simulator
 
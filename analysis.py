@@ -0,0 +1,112 @@
+"""Spike analysis and raster plots of large populations.
+
+The spikes of a list of neurons are gathered into two flat numpy arrays,
+the tau and the row (the position of the neuron in the list) of every
+spike, from the neurons' spikeTimes or from a Recorder or RecordingReader.
+Spike matrices and rasters are then built from those arrays with one
+scatter, without a Python loop over the spikes.
+
+rasterPlot draws every spike as a point while there are few enough of them
+to be told apart on the figure; beyond maxPoints it bins the spikes into
+about one cell per pixel of the axes and shows the spike counts as an image.
+"""
+import numpy
+
+# the most spikes rasterPlot draws as points
+MAX_POINTS = 200000
+
+
+def spikeArrays(aNeuronList, source=None):
+    """ Precondition:
+    "aNeuronList": list of Neuron instances.
+    "source": a Recorder or RecordingReader to read the spikes from, instead
+        of the neurons' spikeTimes; neurons it did not record have none.
+    returns (taus, rows): int64 arrays of the tau of every spike and of the
+    position in aNeuronList of the neuron that fired
+    """
+    if source is None:
+        lengths = numpy.fromiter((len(n.spikeTimes) for n in aNeuronList),
+                                 dtype=numpy.int64, count=len(aNeuronList))
+        taus = numpy.fromiter((t for n in aNeuronList for t in n.spikeTimes),
+                              dtype=numpy.int64, count=int(lengths.sum()))
+        rows = numpy.repeat(numpy.arange(len(aNeuronList)), lengths)
+        return taus, rows
+    taus, positions = source.spikes()
+    if hasattr(source, "neurons"):
+        known = dict((n, i) for i, n in enumerate(source.neurons))
+        sourcePositions = [known.get(n, -1) for n in aNeuronList]
+        numPositions = len(source.neurons)
+    else:
+        known = dict((name, i) for i, name in enumerate(source.names))
+        sourcePositions = [known.get(n.name, -1) for n in aNeuronList]
+        numPositions = len(source.names)
+    # row of each position of the source, -1 for the neurons not asked for
+    rowOf = numpy.full(numPositions, -1, dtype=numpy.int64)
+    sourcePositions = numpy.array(sourcePositions, dtype=numpy.int64)
+    mine = sourcePositions >= 0
+    rowOf[sourcePositions[mine]] = numpy.flatnonzero(mine)
+    rows = rowOf[numpy.asarray(positions, dtype=numpy.intp)]
+    keep = rows >= 0
+    return numpy.asarray(taus, dtype=numpy.int64)[keep], rows[keep]
+
+
+def spikeMatrix(aNeuronList, numTaus=None, source=None, binSize=1,
+                sparse=False):
+    """ Precondition:
+    "numTaus": number of taus covered, from 0; by default up to the last
+        spike, included. Later spikes are left out.
+    "binSize": number of taus per column.
+    "sparse": return a scipy.sparse CSR matrix instead of a numpy array.
+    returns the matrix of shape (len(aNeuronList), number of bins) whose
+    entry [i, k] is the number of spikes of aNeuronList[i] in the taus
+    k * binSize to (k + 1) * binSize - 1: a binary matrix when binSize is 1
+    """
+    taus, rows = spikeArrays(aNeuronList, source)
+    if numTaus is None:
+        numTaus = int(taus.max()) + 1 if len(taus) else 0
+    numBins = -(-numTaus // binSize)
+    keep = (taus >= 0) & (taus < numTaus)
+    taus, rows = taus[keep], rows[keep]
+    columns = taus // binSize
+    shape = (len(aNeuronList), numBins)
+    if sparse:
+        import scipy.sparse
+        return scipy.sparse.csr_matrix(
+            (numpy.ones(len(taus), dtype=numpy.int64), (rows, columns)),
+            shape=shape)
+    counts = numpy.bincount(rows * numBins + columns,
+                            minlength=shape[0] * shape[1])
+    return counts.reshape(shape)
+
+
+def rasterPlot(aNeuronList, finalTau, source=None, ax=None,
+               maxPoints=MAX_POINTS):
+    """ Precondition:
+    "finalTau": the last tau shown.
+    "ax": the matplotlib Axes to draw in; by default the current one.
+    "maxPoints": above this many spikes, they are binned into an image of
+        the spike counts with about one cell per pixel of ax.
+    draws the raster of the spikes of aNeuronList, one row per neuron, and
+    returns ax
+    """
+    import matplotlib.pyplot
+    if ax is None:
+        ax = matplotlib.pyplot.gca()
+    taus, rows = spikeArrays(aNeuronList, source)
+    numRows = len(aNeuronList)
+    if len(taus) <= maxPoints:
+        ax.plot(taus, rows, 'r.')
+    else:
+        box = ax.get_window_extent()
+        numColumns = max(1, min(int(finalTau), int(box.width)))
+        numBands = max(1, min(numRows, int(box.height)))
+        columns = numpy.clip(taus * numColumns // max(int(finalTau), 1), 0,
+                             numColumns - 1)
+        bands = rows * numBands // numRows
+        counts = numpy.bincount(bands * numColumns + columns,
+                                minlength=numBands * numColumns)
+        ax.imshow(counts.reshape(numBands, numColumns), aspect="auto",
+                  origin="lower", interpolation="nearest", cmap="Reds",
+                  extent=(0, finalTau, 0, numRows))
+    ax.axis([0, finalTau, 0, numRows])
+    return ax
@@ -0,0 +1,307 @@
+"""Many variants of one network, simulated side by side.
+
+A BatchSimulator takes a Simulator that holds a network and runs numTrials
+copies of it at once: every neuron and synapse array of the ArrayEngine gets
+a leading trial axis, so all the trials advance in one vectorized step per
+tau. Thresholds, refractory periods, decay constants, initial voltages and
+synaptic weights can be set per trial; the topology, the delays and the
+inputs are shared, although an input may carry one voltage per trial.
+
+Each trial goes through exactly the arithmetic of an ArrayEngine run of the
+same network with its parameters, so its spikes and voltages are identical
+to those of a separate Simulator(vectorized=True).
+"""
+import numpy
+
+from engine import BandedConnectivity, DelayRing, _convolveBand, _ranges
+from Neuron import InputSchedule
+
+NEURON_PARAMETERS = ("voltage", "threshold", "refractory", "decayConstant")
+
+
+class BatchEngine(object):
+    """ Class Invariant:
+    "engine": the ArrayEngine whose network every trial shares.
+    "numTrials": number of trials.
+    "voltage", "threshold", "refractory", "refractCount", "sumInputs",
+        "decayFactor": arrays of shape (numTrials, len(engine.neurons)),
+        row t holding the neuron state of trial t.
+    "synWeight": array of shape (numTrials, number of edges).
+    "ring": DelayRing of the input in flight in every trial; neuron i of
+        trial t is post t * len(engine.neurons) + i.
+    "lastTau", "minDelay", "pendingTaus", "pendingTrials", "pendingIndices":
+        as in ArrayEngine, with the trial of every pending spike.
+    "spikeTaus", "spikeTrials", "spikeIndices": lists of arrays of the tau,
+        trial and neuron index of every spike.
+    "history": list of arrays of shape (numTrials, len(historyIndices)), the
+        voltages of the engine's historyIndices neurons at each tau.
+    """
+
+    def __init__(self, engine, numTrials):
+        """ Precondition:
+        "engine": an ArrayEngine; its state and the input it has in flight
+            are the starting point of every trial.
+        "numTrials": positive number of trials.
+        """
+        engine.flush()
+        self.engine = engine
+        self.numTrials = numTrials
+        for name in ("voltage", "threshold", "refractory", "refractCount",
+                     "sumInputs", "decayFactor"):
+            setattr(self, name, numpy.tile(getattr(engine, name),
+                                           (numTrials, 1)))
+        self.synWeight = numpy.tile(engine.synWeight, (numTrials, 1))
+        numNeurons = len(engine.neurons)
+        self.ring = DelayRing(engine.ring.size)
+        taus, keys, posts, weights = engine.ring.pending(engine.lastTau)
+        trials = numpy.repeat(numpy.arange(numTrials), len(taus))
+        self.ring.add(numpy.tile(taus, numTrials), numpy.tile(keys, numTrials),
+                      trials * numNeurons + numpy.tile(posts, numTrials),
+                      numpy.tile(weights, numTrials))
+        self.lastTau = engine.lastTau
+        self.minDelay = engine.minDelay
+        self.pendingTaus = []
+        self.pendingTrials = []
+        self.pendingIndices = []
+        self.spikeTaus = []
+        self.spikeTrials = []
+        self.spikeIndices = []
+        self.history = []
+
+    def setNeuronParameter(self, name, indices, values):
+        """ Precondition:
+        "name": one of NEURON_PARAMETERS.
+        "indices": array of neuron indices in the engine.
+        "values": one value, an array with one value per trial, or an array
+            of shape (numTrials, len(indices)).
+        """
+        if name not in NEURON_PARAMETERS:
+            raise ValueError("cannot set " + repr(name) + "; choose from " +
+                             repr(NEURON_PARAMETERS))
+        values = _perTrial(values)
+        if name == "decayConstant":
+            for i in numpy.asarray(indices).tolist():
+                if not hasattr(self.engine.neurons[i], "decayConstant"):
+                    raise ValueError(self.engine.neurons[i].name +
+                                     " does not leak")
+            self.decayFactor[:, indices] = 1 - (1 / values)
+        else:
+            getattr(self, name)[:, indices] = values
+
+    def setWeight(self, edges, values):
+        """ Precondition:
+        "edges": array of edge indices in the engine.
+        "values": one weight, an array with one weight per trial, or an
+            array of shape (numTrials, len(edges)).
+        """
+        self.synWeight[:, edges] = _perTrial(values)
+
+    def addInput(self, i, aVoltage):
+        """ adds aVoltage, one voltage or one per trial, to the inputs of
+        neuron i for the current step
+        """
+        self.sumInputs[:, i] += aVoltage
+
+    def step(self, currentTau):
+        """ same as ArrayEngine.step for every trial at once; returns a
+        boolean array of shape (numTrials, numChecked)
+        """
+        self.ring.pop(currentTau, self.sumInputs.reshape(-1))
+
+        n = self.engine.numChecked
+        voltage = self.voltage[:, :n]
+        refractCount = self.refractCount[:, :n]
+        voltage *= self.decayFactor[:, :n]
+        voltage += self.sumInputs[:, :n]
+        self.sumInputs[:, :n] = 0
+        refractCount -= 1
+        numpy.maximum(refractCount, 0, out=refractCount)
+        if len(self.engine.historyIndices):
+            self.history.append(voltage[:, self.engine.historyIndices])
+
+        threshold = self.threshold[:, :n]
+        fired = (refractCount == 0) & (voltage >= threshold)
+        firedTrials, firedIndices = numpy.nonzero(fired)
+        if len(firedIndices):
+            voltage[firedTrials, firedIndices] -= numpy.abs(
+                threshold[firedTrials, firedIndices])
+            refractCount[firedTrials, firedIndices] = \
+                self.refractory[firedTrials, firedIndices]
+            taus = numpy.full(len(firedIndices), currentTau)
+            self.spikeTaus.append(taus)
+            self.spikeTrials.append(firedTrials)
+            self.spikeIndices.append(firedIndices)
+            self.pendingTaus.append(taus)
+            self.pendingTrials.append(firedTrials)
+            self.pendingIndices.append(firedIndices)
+        self.lastTau = currentTau
+        if self.pendingTaus and\
+                currentTau + 1 >= self.pendingTaus[0][0] + self.minDelay:
+            self.flush()
+        return fired
+
+    def flush(self):
+        """ schedules all the pending spikes into the delay ring """
+        if not self.pendingTaus:
+            return
+        taus = numpy.concatenate(self.pendingTaus)
+        trials = numpy.concatenate(self.pendingTrials)
+        firedIndices = numpy.concatenate(self.pendingIndices)
+        self.pendingTaus = []
+        self.pendingTrials = []
+        self.pendingIndices = []
+        engine = self.engine
+        starts = engine.indptr[firedIndices]
+        stops = engine.indptr[firedIndices + 1]
+        active = engine.csrEdges[_ranges(starts, stops)]
+        if len(active):
+            counts = stops - starts
+            edgeTrials = numpy.repeat(trials, counts)
+            self.ring.add(numpy.repeat(taus, counts) + engine.synDelay[active],
+                          engine.synKey[active],
+                          edgeTrials * len(engine.neurons) +
+                          engine.synPost[active],
+                          self.synWeight[edgeTrials, active])
+        for b, band in enumerate(engine.bands):
+            for trial in numpy.unique(trials).tolist():
+                mine = trials == trial
+                for tau, posts, weights in _convolveBand(band, taus[mine],
+                                                         firedIndices[mine]):
+                    self.ring.add(numpy.full(len(posts), tau),
+                                  engine.numEdges + b,
+                                  trial * len(engine.neurons) + posts, weights)
+
+    def spikes(self, trial):
+        """ returns (taus, indices) of the spikes of trial, in the order in
+        which they happened
+        """
+        if not self.spikeTaus:
+            return numpy.empty(0, dtype=int), numpy.empty(0, dtype=int)
+        taus = numpy.concatenate(self.spikeTaus)
+        trials = numpy.concatenate(self.spikeTrials)
+        indices = numpy.concatenate(self.spikeIndices)
+        mine = trials == trial
+        return taus[mine], indices[mine]
+
+
+def _perTrial(values):
+    """ turns an array with one value per trial into a column, so that it
+    broadcasts over the neurons or edges of each trial
+    """
+    values = numpy.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values
+
+
+class BatchSimulator(object):
+    """ Class Invariant:
+    "simulator": the Simulator holding the network; it is not run itself.
+    "numTrials": number of copies of the network that are simulated.
+    "finalTau": the last time (in tau) we care about, from simulator.
+    "engine": the BatchEngine holding the state of all the trials.
+    "inputSchedule": InputSchedule of the inputs of every trial; the
+        voltage of an input is one voltage or an array with one per trial.
+    "progress": the simulator's ProgressReporter, or None.
+    """
+
+    def __init__(self, simulator, numTrials):
+        """ Precondition:
+        "simulator": a Simulator whose network the ArrayEngine supports,
+            with its neurons, synapses and inputs added. Its inputs are
+            copied; the simulator keeps them.
+        "numTrials": positive number of copies to simulate.
+        """
+        self.simulator = simulator
+        self.numTrials = numTrials
+        self.finalTau = simulator.finalTau
+        engine = simulator.engine
+        if engine is None:
+            engine = simulator.buildEngine()
+        self.engine = BatchEngine(engine, numTrials)
+        self.inputSchedule = InputSchedule()
+        for aTime, aNeuron, aVoltage in simulator.inputSchedule.remaining():
+            self.inputSchedule.append(aTime, aNeuron, aVoltage)
+        self.progress = simulator.progress
+
+    def setParameter(self, name, aNeuronList, values):
+        """ Precondition:
+        "name": one of "voltage", "threshold", "refractory" and
+            "decayConstant" (LIF neurons only).
+        "aNeuronList": list of Neuron instances of the network.
+        "values": one value, an array with one value per trial, or an array
+            of shape (numTrials, len(aNeuronList)).
+        """
+        indices = [self.engine.engine.index[n] for n in aNeuronList]
+        self.engine.setNeuronParameter(name, indices, values)
+
+    def setWeight(self, aSynapseList, values):
+        """ Precondition:
+        "aSynapseList": list of Synapse instances of the network, or a
+            Connectivity store, meaning all of its edges.
+        "values": one weight, an array with one weight per trial, or an
+            array of shape (numTrials, number of synapses).
+        """
+        engine = self.engine.engine
+        if isinstance(aSynapseList, BandedConnectivity):
+            raise ValueError("the kernel of a BandedConnectivity is shared by "
+                             "every trial")
+        if aSynapseList in engine.connectivity:
+            k = engine.connectivity.index(aSynapseList)
+            offset = engine.storeOffsets[k]
+            edges = numpy.arange(offset, offset + len(aSynapseList.pre))
+        else:
+            position = {s: k for k, s in enumerate(engine.synapses)}
+            edges = [position[s] for s in aSynapseList]
+        self.engine.setWeight(edges, values)
+
+    def appendInput(self, aTime, aNeuron, aVoltage):
+        """ Precondition:
+        "aVoltage": one voltage for every trial, or an array with one
+            voltage per trial.
+        """
+        self.inputSchedule.append(aTime, aNeuron, aVoltage)
+
+    def main(self):
+        """ runs every trial through all instants of tau """
+        engine = self.engine
+        index = engine.engine.index
+        for currentTau in range(engine.lastTau + 1, self.finalTau):
+            if self.progress is not None:
+                self.progress.update(currentTau, self.finalTau)
+            for aNeuron, aVoltage in self.inputSchedule.popDue(currentTau):
+                i = index.get(aNeuron)
+                if i is not None:
+                    engine.addInput(i, aVoltage)
+            engine.step(currentTau)
+        engine.flush()
+
+    def spikeTimes(self, aNeuron, trial):
+        """ returns the list of taus at which aNeuron fired in trial """
+        taus, indices = self.engine.spikes(trial)
+        return taus[indices == self.engine.engine.index[aNeuron]].tolist()
+
+    def spikeCounts(self):
+        """ returns an array of shape (numTrials, numChecked) holding the
+        number of spikes of every checked neuron in every trial
+        """
+        counts = numpy.zeros((self.numTrials, self.engine.engine.numChecked),
+                             dtype=int)
+        if self.engine.spikeTaus:
+            numpy.add.at(counts, (numpy.concatenate(self.engine.spikeTrials),
+                                  numpy.concatenate(self.engine.spikeIndices)),
+                         1)
+        return counts
+
+    def voltageHistory(self, aNeuron, trial):
+        """ returns the voltages of aNeuron in trial at every simulated tau;
+        aNeuron must record its history (see Neuron.recordHistory)
+        """
+        engine = self.engine.engine
+        column = numpy.flatnonzero(engine.historyIndices ==
+                                   engine.index[aNeuron])
+        if not len(column):
+            raise ValueError(aNeuron.name + " does not record its history")
+        if not self.engine.history:
+            return []
+        return numpy.array(self.engine.history)[:, trial, column[0]].tolist()
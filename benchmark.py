@@ -0,0 +1,232 @@
+"""Throughput benchmarks of the simulator on standard networks.
+
+Every case builds one network at a given size and runs it in one mode:
+"object" (Synapse objects, checked one by one), "vectorized" (Connectivity
+stores on the ArrayEngine) or "eventDriven" (the same, run with
+main(eventDriven=True)). The cases are
+
+    sparse       LIF neurons with about FAN_OUT random synapses each, driven
+                 hard enough to keep a large share of them firing
+    sparseQuiet  the same network with rare inputs
+    allToAll     LIF neurons connected all to all with small weights
+    layers       the three distance-weighted layers of Simulation.py
+
+and each result reports the build time, the ticks and synaptic events per
+second of the run and the peak memory traced while building and running.
+
+Run it as a script to write the results as JSON:
+
+    python benchmark.py --sizes 100 1000 --output results.json
+
+With pytest-benchmark, time runNetwork on the networks of buildNetwork,
+e.g. benchmark.pedantic(runNetwork, setup=lambda: ((buildNetwork(
+"sparse", 1000, "vectorized"), "vectorized"), {}), rounds=5).
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+from engine import Connectivity
+from monitor import SpikeSink
+from Neuron import LIFNeuron, MCPNeuron, Neuron, Simulator, Synapse
+
+CASES = ("sparse", "sparseQuiet", "allToAll", "layers")
+MODES = ("object", "vectorized", "eventDriven")
+
+# mean number of synapses leaving each neuron of the sparse cases
+FAN_OUT = 20
+
+# larger networks are not built with one Synapse object per edge
+MAX_OBJECT_SYNAPSES = 100000
+
+# larger networks are not built at all
+MAX_SYNAPSES = 50000000
+
+
+def numSynapses(case, size):
+    """ returns about how many synapses the network of case has at size """
+    if case in ("sparse", "sparseQuiet"):
+        return size * FAN_OUT
+    if case == "allToAll":
+        return size * size
+    # spreads of 12, 0 and 3 positions
+    return (size // 3) * (25 + 1 + 7)
+
+
+def buildNetwork(case, size, mode, finalTau=1000, seed=0):
+    """ Precondition:
+    "case": one of CASES.
+    "size": number of neurons.
+    "mode": one of MODES; "object" builds Synapse objects, the others one
+        Connectivity store per group of edges.
+    returns a Simulator running to finalTau, with its network and inputs
+    """
+    rng = numpy.random.default_rng(seed)
+    simulator = Simulator(finalT=finalTau, vectorized=mode != "object",
+                          recordHistory=False)
+
+    def connect(method, *args, **options):
+        if mode == "object":
+            for synapse in method(*args, **options):
+                simulator.addSynapse(synapse)
+        else:
+            store = Connectivity()
+            method(*args, store=store, **options)
+            simulator.addConnectivity(store)
+
+    if case == "layers":
+        layer = size // 3
+        inputs = [Neuron(aname="input%d" % i) for i in range(layer)]
+        A = [LIFNeuron(athreshold=100, adecay=.5, aname="A%d" % i)
+             for i in range(layer)]
+        B = [MCPNeuron(aname="B%d" % i) for i in range(layer)]
+        for neuron in inputs + A + B:
+            simulator.addNeuron(neuron)
+        connect(Synapse.connectWeightedByDistance, inputs, A, 0, 80, 12)
+        connect(Synapse.connectWeightedByDistance, A, B, 0, 1, 0)
+        connect(Synapse.connectWeightedByDistance, B, A, -3, 0, 3)
+        driven, share, voltage = inputs, 0.1, 1
+    else:
+        neurons = [LIFNeuron(athreshold=1, adecay=5, arefractory=2,
+                             aname="N%d" % i) for i in range(size)]
+        for neuron in neurons:
+            simulator.addNeuron(neuron)
+        if case == "allToAll":
+            connect(Synapse.connect, neurons, neurons, 2.0 / size)
+        else:
+            connect(Synapse.randomWeightRandomConnect, neurons, neurons,
+                    -0.2, 0.5, 1, min(1, FAN_OUT / size), rng=rng)
+        driven = neurons
+        share = 0.001 if case == "sparseQuiet" else 0.1
+        voltage = 1.5
+
+    numInputs = max(1, int(share * len(driven) * finalTau))
+    simulator.appendInputs(rng.integers(0, finalTau, numInputs),
+                           [driven[i] for i in
+                            rng.integers(0, len(driven), numInputs).tolist()],
+                           voltage)
+    return simulator
+
+
+class SpikeCounter(SpikeSink):
+    """ Class Invariant:
+    "numSpikes": number of spikes received.
+    "numEvents": number of Synapse objects activated by them.
+    """
+
+    def __init__(self):
+        self.numSpikes = 0
+        self.numEvents = 0
+
+    def spikes(self, currentTau, neurons):
+        self.numSpikes += len(neurons)
+        for neuron in neurons:
+            self.numEvents += len(neuron.postSynapses)
+
+
+def runNetwork(simulator, mode):
+    """ runs simulator to its finalTau in mode (one of MODES) """
+    simulator.main(eventDriven=mode == "eventDriven")
+
+
+def benchmark(case, size, mode, finalTau=1000, memory=True):
+    """ returns the dict of results of one build and run of case at size
+    in mode; with memory, the peak memory is measured in a second build
+    and run under tracemalloc, which would slow down the timed one
+    """
+    start = time.perf_counter()
+    simulator = buildNetwork(case, size, mode, finalTau)
+    built = time.perf_counter()
+    counter = SpikeCounter()
+    simulator.spikeSinks.append(counter)
+    runNetwork(simulator, mode)
+    done = time.perf_counter()
+    # the engine counts the edges of Connectivity stores itself
+    events = counter.numEvents if simulator.engine is None else\
+        simulator.engine.numEvents
+    result = {"case": case, "size": size, "mode": mode, "finalTau": finalTau,
+              "neurons": len(simulator.neuronCheckList),
+              "synapses": len(simulator.synapseCheckList) +
+              sum(len(store) for store in simulator.connectivityList),
+              "buildSeconds": built - start,
+              "runSeconds": done - built,
+              "ticksPerSecond": finalTau / (done - built),
+              "spikes": counter.numSpikes,
+              "synapticEvents": events,
+              "eventsPerSecond": events / (done - built),
+              "peakMemoryBytes": None}
+    if memory:
+        del simulator
+        tracemalloc.start()
+        try:
+            runNetwork(buildNetwork(case, size, mode, finalTau), mode)
+            result["peakMemoryBytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def runAll(cases=CASES, sizes=(100, 1000), modes=MODES, finalTau=1000,
+           memory=True, log=None):
+    """ returns the results of benchmark for every case, size and mode,
+    leaving out the networks too large for their mode (see MAX_SYNAPSES and
+    MAX_OBJECT_SYNAPSES); "log", if given, is called with each result
+    """
+    results = []
+    for case in cases:
+        for size in sizes:
+            for mode in modes:
+                limit = MAX_OBJECT_SYNAPSES if mode == "object" else\
+                    MAX_SYNAPSES
+                if numSynapses(case, size) > limit:
+                    continue
+                result = benchmark(case, size, mode, finalTau, memory)
+                results.append(result)
+                if log is not None:
+                    log(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--taus", type=int, default=1000,
+                        help="number of taus to simulate")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the traced run that measures peak memory")
+    parser.add_argument("--output", help="JSON file to write the results to; "
+                        "by default they are written to stdout")
+    args = parser.parse_args(argv)
+
+    def log(result):
+        sys.stderr.write("%-12s %7d %-12s %10.1f ticks/s %12.0f events/s "
+                         "build %.3fs\n" % (
+                             result["case"], result["size"], result["mode"],
+                             result["ticksPerSecond"],
+                             result["eventsPerSecond"],
+                             result["buildSeconds"]))
+
+    results = runAll(args.cases, args.sizes, args.modes, args.taus,
+                     not args.no_memory, log)
+    report = {"python": platform.python_version(),
+              "numpy": numpy.__version__,
+              "platform": platform.platform(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "results": results}
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,868 @@
+"""Array-backed engine used by Simulator when it is created with
+vectorized=True.
+
+The engine packs the state of every Neuron and Synapse of a Simulator into
+numpy arrays and advances the whole population in one batched step per tau.
+It reproduces the semantics of Neuron.check, LIFNeuron.check and MCPNeuron:
+inputs and synaptic arrivals are summed, LIF neurons leak for one step, the
+refractory counter is decremented, and neurons at or above threshold fire,
+lose abs(threshold) volts and restart their refractory period.
+
+Synaptic input in flight waits in a DelayRing until its arrival tau. There
+it is added to the inputs of its post neuron one arrival at a time, after
+the external inputs and in the order of the edges (the Synapse objects in
+synapseCheckList order, then the edges of each store), which is the order in
+which Simulator checks its synapses, so the sums are rounded identically.
+
+No spike reaches another neuron sooner than the shortest synaptic delay, so
+the engine collects the spikes of up to minDelay consecutive taus and
+schedules them into the ring in one batch.
+
+When numba is installed, the neuron update of a step runs as one compiled
+loop (see _updateNeurons); otherwise it runs as a sequence of numpy
+operations. Both do the same float operations in the same order, so the
+results are identical. numba is only imported, and the loop compiled, when
+an engine takes its first step, so that importing this module stays cheap.
+"""
+import heapq
+import weakref
+
+import numpy
+
+
+class Connectivity(object):
+    """ Class Invariant:
+    A compact store of synapses, used in place of Synapse objects when a
+    network is too large to hold one Python object per edge.
+    "neurons": list of the Neuron instances the edges refer to.
+    "index": dict mapping each Neuron in "neurons" to its position.
+    "pre", "post": arrays of neuron positions, one entry per edge.
+    "weight": array of edge weights.
+    "delay": array of edge delays in tau; every delay is an integer >= 1.
+    Edges keep the order in which they were added.
+    """
+
+    def __init__(self):
+        self.neurons = []
+        self.index = {}
+        self._chunks = []
+        self._edges = None
+        self._csr = None
+
+    def __len__(self):
+        return sum(len(chunk[0]) for chunk in self._chunks)
+
+    def indicesOf(self, aNeuronList):
+        """ returns the positions of the neurons in aNeuronList, adding the
+        ones this store has not seen before
+        """
+        positions = numpy.empty(len(aNeuronList), dtype=numpy.int32)
+        for i, neuron in enumerate(aNeuronList):
+            position = self.index.get(neuron)
+            if position is None:
+                position = self.index[neuron] = len(self.neurons)
+                self.neurons.append(neuron)
+            positions[i] = position
+        return positions
+
+    def addEdges(self, pre, post, weight=1, delay=1):
+        """ Precondition:
+        "pre", "post": equally long arrays of neuron positions (see indicesOf).
+        "weight": one weight, or an array with one weight per edge.
+        "delay": one delay, or an array with one delay per edge; delays must
+            be integers >= 1.
+        appends the edges pre[k] -> post[k] to the store; int32 pre and post
+        arrays, a float weight array and an int32 delay array are kept as
+        they are, not copied
+        """
+        pre = numpy.asarray(pre, dtype=numpy.int32)
+        post = numpy.asarray(post, dtype=numpy.int32)
+        if pre.shape != post.shape:
+            raise ValueError("pre and post must have the same length")
+        weight = numpy.asarray(weight, dtype=float)
+        if weight.shape != pre.shape:
+            weight = numpy.broadcast_to(weight, pre.shape).copy()
+        delay = numpy.broadcast_to(numpy.asarray(delay), pre.shape)
+        if len(delay) and (delay.min() < 1 or numpy.any(delay % 1 != 0)):
+            raise ValueError("synaptic delays must be integers >= 1")
+        self._chunks.append((pre, post, weight,
+                             delay.astype(numpy.int32, copy=False)))
+        self._edges = None
+        self._csr = None
+
+    def _concatenated(self):
+        if self._edges is None:
+            if self._chunks:
+                self._edges = tuple(numpy.concatenate(a)
+                                    for a in zip(*self._chunks))
+            else:
+                self._edges = (numpy.empty(0, dtype=numpy.int32),
+                               numpy.empty(0, dtype=numpy.int32),
+                               numpy.empty(0),
+                               numpy.empty(0, dtype=numpy.int32))
+            self._chunks = [self._edges] if len(self._edges[0]) else []
+        return self._edges
+
+    @property
+    def pre(self):
+        return self._concatenated()[0]
+
+    @property
+    def post(self):
+        return self._concatenated()[1]
+
+    @property
+    def weight(self):
+        return self._concatenated()[2]
+
+    @property
+    def delay(self):
+        return self._concatenated()[3]
+
+    def csr(self):
+        """ returns (indptr, order): the edges leaving neuron position p are
+        order[indptr[p]:indptr[p+1]], in the order they were added
+        """
+        if self._csr is None:
+            self._csr = _csr(self.pre, len(self.neurons))
+        return self._csr
+
+    def outgoing(self, aNeuron):
+        """ returns (postNeurons, weights, delays) of the edges leaving
+        aNeuron
+        """
+        indptr, order = self.csr()
+        p = self.index[aNeuron]
+        edges = order[indptr[p]:indptr[p + 1]]
+        return ([self.neurons[q] for q in self.post[edges].tolist()],
+                self.weight[edges], self.delay[edges])
+
+
+class BandedConnectivity(object):
+    """ Class Invariant:
+    A store of the edges preNeurons[i] -> postNeurons[j] for every i and j
+    with lowOffset <= j - i < lowOffset + len(kernel), of weight
+    kernel[j - i - lowOffset]: a band around the diagonal whose weight
+    depends only on the offset, held in O(len(kernel)) memory. The engine
+    delivers it as a 1-D convolution of the spikes of preNeurons with kernel,
+    so the input a band brings to a neuron in one tau is added as one sum,
+    not edge by edge as the same edges given as Synapse objects would be.
+    "preNeurons", "postNeurons": lists of Neuron instances, each without
+        duplicates.
+    "neurons": preNeurons followed by the postNeurons not among them.
+    "index": dict mapping each Neuron in "neurons" to its position.
+    "lowOffset": the offset j - i of kernel[0].
+    "kernel": array of the weights of the band, by offset.
+    "delay": delay of every edge in tau, an integer >= 1.
+    pre, post, weight and delay arrays of the explicit edges, in row-major
+    order, are available as for Connectivity; they are built on each access.
+    """
+
+    def __init__(self, preNeurons, postNeurons, lowOffset, kernel, delay=1):
+        if delay < 1 or delay % 1 != 0:
+            raise ValueError("synaptic delays must be integers >= 1")
+        self.preNeurons = list(preNeurons)
+        self.postNeurons = list(postNeurons)
+        self.neurons = []
+        self.index = {}
+        for neuron in self.preNeurons + self.postNeurons:
+            if neuron not in self.index:
+                self.index[neuron] = len(self.neurons)
+                self.neurons.append(neuron)
+        self.lowOffset = int(lowOffset)
+        self.kernel = numpy.asarray(kernel, dtype=float)
+        self.delay = int(delay)
+
+    def _starts(self):
+        """ returns (starts, stops): the band of row i is j in
+        range(starts[i], stops[i])
+        """
+        i = numpy.arange(len(self.preNeurons))
+        starts = numpy.clip(i + self.lowOffset, 0, len(self.postNeurons))
+        stops = numpy.clip(i + self.lowOffset + len(self.kernel), starts,
+                           len(self.postNeurons))
+        return starts, stops
+
+    def __len__(self):
+        starts, stops = self._starts()
+        return int((stops - starts).sum())
+
+    def edges(self):
+        """ returns the explicit (pre, post, weight, delay) arrays of the
+        band, pre and post as positions in "neurons"
+        """
+        starts, stops = self._starts()
+        i = numpy.repeat(numpy.arange(len(self.preNeurons)), stops - starts)
+        j = _ranges(starts, stops)
+        pre = numpy.array([self.index[n] for n in self.preNeurons],
+                          dtype=numpy.int32)
+        post = numpy.array([self.index[n] for n in self.postNeurons],
+                           dtype=numpy.int32)
+        return (pre[i], post[j], self.kernel[j - i - self.lowOffset],
+                numpy.full(len(i), self.delay, dtype=numpy.int32))
+
+    @property
+    def pre(self):
+        return self.edges()[0]
+
+    @property
+    def post(self):
+        return self.edges()[1]
+
+    @property
+    def weight(self):
+        return self.edges()[2]
+
+
+def _csr(pre, numNeurons):
+    """ returns (indptr, order) grouping the edge indices by pre neuron """
+    order = numpy.argsort(pre, kind="stable")
+    indptr = numpy.zeros(numNeurons + 1, dtype=numpy.intp)
+    numpy.cumsum(numpy.bincount(pre, minlength=numNeurons), out=indptr[1:])
+    return indptr, order
+
+
+def _ranges(starts, stops):
+    """ returns the concatenation of range(starts[k], stops[k]) for all k """
+    counts = stops - starts
+    total = int(counts.sum())
+    if total == 0:
+        return numpy.empty(0, dtype=numpy.intp)
+    offsets = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts)
+    return numpy.arange(total, dtype=numpy.intp) + offsets
+
+
+def _updateNeurons(voltage, sumInputs, decayFactor, refractCount, threshold,
+                   refractory, fired, spikeVoltage, record):
+    """ the update of ArrayEngine.advance as one loop over the neurons: leak,
+    input summation, refractory countdown, threshold test and reset.
+    sets fired[i] and spikeVoltage[i] for the neurons that fire, and, if
+    record is not empty, stores in it the voltages before the reset.
+    returns the number of neurons that fired
+    """
+    numFired = 0
+    for i in range(len(voltage)):
+        v = voltage[i] * decayFactor[i]
+        v = v + sumInputs[i]
+        sumInputs[i] = 0
+        r = refractCount[i] - 1
+        if r < 0:
+            r = 0
+        if len(record):
+            record[i] = v
+        fired[i] = r == 0 and v >= threshold[i]
+        if fired[i]:
+            spikeVoltage[i] = v
+            v = v - abs(threshold[i])
+            r = refractory[i]
+            numFired += 1
+        voltage[i] = v
+        refractCount[i] = r
+    return numFired
+
+
+# the compiled neuron update; None until loadKernel is first called, and
+# False if numba is not installed, to use numpy
+kernel = None
+
+
+def loadKernel():
+    """ compiles _updateNeurons with numba into kernel, the first time it is
+    called; returns kernel
+    """
+    global kernel
+    if kernel is None:
+        try:
+            import numba
+        except ImportError:
+            kernel = False
+        else:
+            kernel = numba.njit(cache=True, nogil=True)(_updateNeurons)
+    return kernel
+
+_NO_RECORD = numpy.empty(0)
+
+# powers of the decay factors beyond this many steps are not tabulated
+MAX_LEAK_TABLE = 4096
+
+# every ArrayEngine alive, for decayChanged
+_engines = weakref.WeakSet()
+
+
+def decayChanged(aNeuron):
+    """ called when the decayConstant of aNeuron changes; the engines that
+    hold aNeuron re-read the decay factors of their neurons before their
+    next step, the others are left alone
+    """
+    for engine in list(_engines):
+        if aNeuron in engine.index:
+            engine.decayStale = True
+
+
+def _convolveBand(band, currentTau, firedIndices):
+    """ Precondition:
+    "band": an entry of ArrayEngine.bands; entries of its post that are -1
+        are skipped.
+    "currentTau", "firedIndices": as in ArrayEngine._propagate.
+    returns a list of (arrivalTau, posts, weights) of the input the band
+    delivers: for each tau, the convolution of the spikes of its pre
+    neurons with its kernel
+    """
+    lookup, post, lowOffset, kernel, delay = band
+    positions = lookup[firedIndices]
+    mine = positions >= 0
+    if not mine.any() or not len(kernel):
+        return []
+    positions = positions[mine]
+    taus = numpy.broadcast_to(currentTau, firedIndices.shape)[mine]
+    arrivals = []
+    for tau in numpy.unique(taus).tolist():
+        fired = positions[taus == tau]
+        first = int(fired.min())
+        spikes = numpy.zeros(int(fired.max()) - first + 1)
+        spikes[fired - first] = 1
+        # convolved[m] is the input of post j = m + first + lowOffset
+        convolved = numpy.convolve(spikes, kernel)
+        j = numpy.arange(len(convolved)) + (first + lowOffset)
+        valid = (j >= 0) & (j < len(post))
+        j, convolved = j[valid], convolved[valid]
+        valid = (convolved != 0) & (post[j] >= 0)
+        arrivals.append((tau + delay, post[j[valid]], convolved[valid]))
+    return arrivals
+
+
+class DelayRing(object):
+    """ Class Invariant:
+    The synaptic input still in flight, held per arrival tau in a circular
+    buffer of slots.
+    "size": number of slots; at least the longest delay, so that an arrival
+        never lands on a slot that has not been delivered yet.
+    "slots": list of size lists; slots[tau % size] holds the arrivals due at
+        tau as (keys, posts, weights) arrays: arrival k adds weights[k] to
+        the input of neuron posts[k], and keys[k] is the edge it travelled
+        on (see ArrayEngine), which sets the order of delivery.
+    "arrivals": heap of the taus at which input is due (may hold taus that
+        were already delivered; they are dropped lazily).
+    """
+
+    def __init__(self, size):
+        self.size = max(int(size), 1)
+        self.slots = [[] for _ in range(self.size)]
+        self.arrivals = []
+
+    def add(self, arrivalTaus, keys, posts, weights):
+        """ schedules weights[k] to reach neuron posts[k] at arrivalTaus[k]
+        through the edge keys[k]; several spikes may be in flight on one edge
+        """
+        arrivalTaus = numpy.asarray(arrivalTaus)
+        if not arrivalTaus.size:
+            return
+        keys = numpy.broadcast_to(keys, arrivalTaus.shape)
+        # the arrival taus span less than size taus, so a bincount finds the
+        # distinct ones faster than numpy.unique
+        first = int(arrivalTaus.min())
+        counts = numpy.bincount(arrivalTaus - first)
+        if len(counts) == 1:
+            self.slots[first % self.size].append((keys, posts, weights))
+            heapq.heappush(self.arrivals, first)
+            return
+        order = numpy.argsort(arrivalTaus, kind="stable")
+        stops = numpy.cumsum(counts)
+        for k in numpy.flatnonzero(counts).tolist():
+            mine = order[stops[k] - counts[k]:stops[k]]
+            self.slots[(first + k) % self.size].append(
+                (keys[mine], posts[mine], weights[mine]))
+            heapq.heappush(self.arrivals, first + k)
+
+    def nextArrival(self, currentTau):
+        """ returns the first tau >= currentTau at which input is due, or
+        None
+        """
+        while self.arrivals and self.arrivals[0] < currentTau:
+            heapq.heappop(self.arrivals)
+        return self.arrivals[0] if self.arrivals else None
+
+    def pop(self, currentTau, out):
+        """ adds the input arriving at currentTau to out, one arrival at a
+        time in the order of their keys, and clears its slot
+        """
+        while self.arrivals and self.arrivals[0] <= currentTau:
+            heapq.heappop(self.arrivals)
+        slot = self.slots[currentTau % self.size]
+        if slot:
+            keys, posts, weights = _sortedArrivals(slot)
+            self.slots[currentTau % self.size] = []
+            numpy.add.at(out, posts, weights)
+
+    def pending(self, lastTau):
+        """ returns (arrivalTaus, keys, posts, weights) of everything still
+        in flight after lastTau was delivered, in the order of delivery
+        """
+        taus, keys, posts, weights = [], [], [], []
+        for tau in range(lastTau + 1, lastTau + 1 + self.size):
+            slot = self.slots[tau % self.size]
+            if slot:
+                k, p, w = _sortedArrivals(slot)
+                taus.append(numpy.full(len(k), tau, dtype=numpy.int64))
+                keys.append(k)
+                posts.append(p)
+                weights.append(w)
+        if not taus:
+            return (numpy.empty(0, dtype=numpy.int64),
+                    numpy.empty(0, dtype=numpy.intp),
+                    numpy.empty(0, dtype=numpy.intp), numpy.empty(0))
+        return (numpy.concatenate(taus), numpy.concatenate(keys),
+                numpy.concatenate(posts), numpy.concatenate(weights))
+
+
+def _sortedArrivals(slot):
+    """ returns the (keys, posts, weights) of the arrivals of a DelayRing
+    slot, sorted by key
+    """
+    if len(slot) == 1:
+        keys, posts, weights = slot[0]
+    else:
+        keys, posts, weights = (numpy.concatenate(a) for a in zip(*slot))
+    if len(keys) > 1 and numpy.any(keys[1:] < keys[:-1]):
+        order = numpy.argsort(keys, kind="stable")
+        keys, posts, weights = keys[order], posts[order], weights[order]
+    return keys, posts, weights
+
+
+class ArrayEngine(object):
+    """ Class Invariant:
+    "neurons": list of the Neuron instances packed into the arrays. The first
+        "numChecked" entries are the simulator's neuronCheckList, in order; the
+        rest are neurons only reached through synapses, which accumulate inputs
+        but are never checked.
+    "index": dict mapping each Neuron in "neurons" to its array index.
+    "voltage", "threshold", "refractory", "refractCount", "sumInputs":
+        per-neuron arrays mirroring the Neuron attributes of the same name.
+    "spikeVoltage": per-neuron array of the voltage before the reset at the
+        last spike (see Neuron.spikeVoltage); only the entries of the
+        neurons that fired are meaningful.
+    "decayFactor": per-neuron leak applied each step, the decayFactor of
+        LIF neurons and 1 for neurons that do not leak.
+    "factors", "factorIndex": the distinct decay factors of the checked
+        neurons, and the position of each checked neuron's factor in them.
+    "leakTable": array whose row k holds factors ** k, for multi-step leaks;
+        grown on demand (see leakPowers).
+    "decayStale": True if the decayConstant of one of the neurons changed
+        since decayFactor was read from them (see decayChanged).
+    "synapses": list of the Synapse instances packed into the arrays.
+    "connectivity": list of the Connectivity and BandedConnectivity stores
+        simulated along with the synapses.
+    "synPre", "synPost", "synWeight", "synDelay": per-edge arrays; the
+        Synapse objects come first, followed by the edges of each
+        Connectivity store.
+    "synKey": the key of each edge in the delay ring, its index in the
+        per-edge arrays; the arrivals of bands[b] have the key numEdges + b,
+        after every edge.
+    "numEdges": the number of edges in the per-edge arrays.
+    "storeOffsets": for each store of "connectivity", the index of its first
+        edge in the per-edge arrays, or None for a BandedConnectivity.
+    "bands": list of (lookup, post, lowOffset, kernel, delay), one per
+        BandedConnectivity: lookup[i] is the position in preNeurons of the
+        neuron of index i, or -1, and post[j] the index of postNeurons[j].
+    "indptr", "csrEdges": the edges leaving neuron i are
+        csrEdges[indptr[i]:indptr[i+1]].
+    "ring": the DelayRing holding the input in flight to every neuron.
+        While the engine runs, spikes in flight live here; sync copies those
+        of the Synapse objects back into their activateFireDelays.
+    "lastTau": the last tau that was simulated.
+    "minDelay": the shortest delay of a live edge (1 if there is none).
+    "pendingTaus", "pendingIndices": lists of arrays of the spikes that
+        have not been scheduled into the ring yet; they all fired less than
+        minDelay taus ago, so none of them is due yet.
+    "numEvents": number of edge activations scheduled into the ring so far.
+    "historyIndices": indices of the checked neurons whose recordHistory
+        is True; only they get spikeTimes and voltageHistory.
+    "history": list of voltage arrays of the historyIndices neurons, one per
+        simulated tau, not yet copied back into their voltageHistory.
+    """
+
+    def __init__(self, neurons, synapses, currentTau=0, connectivity=(),
+                 carry=None):
+        """ Precondition:
+        "neurons": list of Neuron instances to be checked every step, without
+            duplicates (normally the simulator's neuronCheckList).
+        "synapses": list of Synapse instances to be checked every step
+            (normally the simulator's synapseCheckList).
+        "currentTau": the next tau that will be simulated. Spikes already in
+            flight in the synapses' activateFireDelays are taken over by the
+            engine and scheduled relative to this tau.
+        "connectivity": list of Connectivity stores whose edges are simulated
+            along with the Synapse objects.
+        "carry": input in flight on the edges of stores, as returned by the
+            sync method of a previous engine, or None.
+        """
+        self.neurons = list(neurons)
+        self.numChecked = len(self.neurons)
+        self.index = {}
+        for i, neuron in enumerate(self.neurons):
+            if neuron in self.index:
+                raise ValueError("Neuron " + neuron.name +
+                                 " is added to the simulator more than once")
+            self.index[neuron] = i
+        self.synapses = list(synapses)
+        self.connectivity = list(connectivity)
+        for neuron in [n for s in self.synapses for n in (s.pre, s.post)] +\
+                [n for store in self.connectivity for n in store.neurons]:
+            if neuron not in self.index:
+                self.index[neuron] = len(self.neurons)
+                self.neurons.append(neuron)
+
+        self.voltage = numpy.array([n.voltage for n in self.neurons],
+                                   dtype=float)
+        self.threshold = numpy.array([n.threshold for n in self.neurons],
+                                     dtype=float)
+        self.refractory = numpy.array([n.refractory for n in self.neurons])
+        self.refractCount = numpy.array([n.refractCount for n in self.neurons],
+                                        dtype=self.refractory.dtype)
+        self.sumInputs = numpy.array([n.sumInputs for n in self.neurons],
+                                     dtype=float)
+        self.spikeVoltage = numpy.zeros(len(self.neurons))
+        self.decayFactor = numpy.empty(len(self.neurons))
+        self.refreshDecay()
+        _engines.add(self)
+
+        pre = [numpy.array([self.index[s.pre] for s in self.synapses],
+                           dtype=numpy.intp)]
+        post = [numpy.array([self.index[s.post] for s in self.synapses],
+                            dtype=numpy.intp)]
+        weight = [numpy.array([s.weight for s in self.synapses], dtype=float)]
+        delay = [numpy.array([s.delay for s in self.synapses], dtype=float)]
+        self.storeOffsets = []
+        self.bands = []
+        offset = len(self.synapses)
+        for store in self.connectivity:
+            if isinstance(store, BandedConnectivity):
+                lookup = numpy.full(len(self.neurons), -1, dtype=numpy.intp)
+                lookup[[self.index[n] for n in store.preNeurons]] =\
+                    numpy.arange(len(store.preNeurons))
+                self.bands.append((lookup, numpy.array(
+                    [self.index[n] for n in store.postNeurons],
+                    dtype=numpy.intp), store.lowOffset, store.kernel,
+                    store.delay))
+                self.storeOffsets.append(None)
+                continue
+            positions = numpy.array([self.index[n] for n in store.neurons],
+                                    dtype=numpy.intp)
+            pre.append(positions[store.pre])
+            post.append(positions[store.post])
+            weight.append(store.weight)
+            delay.append(store.delay)
+            self.storeOffsets.append(offset)
+            offset += len(store.pre)
+        self.synPre = numpy.concatenate(pre)
+        self.numEdges = len(self.synPre)
+        self.synKey = numpy.arange(self.numEdges)
+        self.synPost = numpy.concatenate(post)
+        self.synWeight = numpy.concatenate(weight)
+        # a delay that is not a positive integer never counts down to exactly
+        # 0 in Synapse.check, so such a synapse never fires
+        synDelay = numpy.concatenate(delay)
+        live = (synDelay >= 1) & (synDelay % 1 == 0)
+        self.synDelay = numpy.where(live, synDelay, 0).astype(numpy.intp)
+        liveEdges = numpy.flatnonzero(live)
+        self.indptr, order = _csr(self.synPre[liveEdges], len(self.neurons))
+        self.csrEdges = liveEdges[order]
+        delays = self.synDelay[liveEdges].tolist() +\
+            [band[4] for band in self.bands]
+        self.minDelay = min(delays) if delays else 1
+        self.pendingTaus = []
+        self.pendingIndices = []
+        self.numEvents = 0
+
+        self.lastTau = currentTau - 1
+        flight = [(s, int(x)) for s, synapse in enumerate(self.synapses)
+                  for x in synapse.activateFireDelays if x >= 1 and x % 1 == 0]
+        carry = self._carried(carry or ())
+        size = max([int(self.synDelay.max(initial=1))] +
+                   [band[4] for band in self.bands] + [x for s, x in flight] +
+                   [int(taus.max()) - self.lastTau for taus, k, p, w in carry])
+        self.ring = DelayRing(size)
+        if flight:
+            s, x = numpy.array(flight).T
+            self.ring.add(self.lastTau + x, s, self.synPost[s],
+                          self.synWeight[s])
+        for synapse in self.synapses:
+            synapse.activateFireDelays = []
+        for taus, keys, posts, weights in carry:
+            self.ring.add(taus, keys, posts, weights)
+        recordHistory = numpy.array([n.recordHistory for n in
+                                     self.neurons[:self.numChecked]],
+                                    dtype=bool)
+        self.historyIndices = numpy.flatnonzero(recordHistory)
+        self.allHistory = bool(recordHistory.all())
+        self.history = []
+
+    def _carried(self, carry):
+        """ returns the carry of a previous engine (see sync) as a list of
+        (arrivalTaus, keys, posts, weights) for the delay ring
+        """
+        arrivals = []
+        for store, taus, positions, weights in carry:
+            if not len(taus):
+                continue
+            k = [j for j, s in enumerate(self.connectivity) if s is store]
+            if not k:
+                raise ValueError("input in flight on a store that is not "
+                                 "simulated")
+            offset = self.storeOffsets[k[0]]
+            if offset is None:
+                b = self.storeOffsets[:k[0]].count(None)
+                keys = numpy.full(len(taus), self.numEdges + b)
+                posts = self.bands[b][1][positions]
+            else:
+                keys = offset + numpy.asarray(positions, dtype=numpy.intp)
+                posts = self.synPost[keys]
+            arrivals.append((numpy.asarray(taus, dtype=numpy.int64), keys,
+                             posts, numpy.asarray(weights, dtype=float)))
+        return arrivals
+
+    def refreshDecay(self):
+        """ re-reads the decay factors of the neurons and drops the table of
+        their powers
+        """
+        self.decayFactor[:] = [getattr(n, "decayFactor", 1)
+                               for n in self.neurons]
+        self.factors, self.factorIndex = numpy.unique(
+            self.decayFactor[:self.numChecked], return_inverse=True)
+        self.leakTable = numpy.ones((1, len(self.factors)))
+        self.decayStale = False
+
+    def _checkDecay(self):
+        """ refreshes the decay factors if a decayConstant changed """
+        if self.decayStale:
+            self.refreshDecay()
+
+    def leakPowers(self, steps, indices=slice(None)):
+        """ Precondition:
+        "steps": a whole number of taus, or an array of them; floats are
+            cast to ints.
+        "indices": indices of checked neurons, or a slice of them.
+        returns decayFactor[indices] ** steps, broadcast as numpy would,
+        taken from leakTable
+        """
+        self._checkDecay()
+        steps = numpy.asarray(steps, dtype=numpy.intp)
+        top = int(numpy.max(steps, initial=0))
+        if top >= MAX_LEAK_TABLE:
+            return self.decayFactor[:self.numChecked][indices] ** steps
+        if top >= len(self.leakTable):
+            size = min(MAX_LEAK_TABLE, max(2 * len(self.leakTable), top + 1))
+            self.leakTable = self.factors ** numpy.arange(size)[:, None]
+        return self.leakTable[steps, self.factorIndex[indices]]
+
+    def addInput(self, aNeuron, aVoltage):
+        """ adds aVoltage to the inputs of aNeuron for the current step """
+        i = self.index.get(aNeuron)
+        if i is None:
+            aNeuron.addVoltage(aVoltage)
+        else:
+            self.sumInputs[i] += aVoltage
+
+    def step(self, currentTau):
+        """ Precondition:
+        "currentTau": the tau to simulate; inputs for it must already have
+            been given with addInput.
+        delivers the synaptic arrivals due at currentTau, updates every
+        checked neuron and schedules the spikes of the neurons that fired.
+        returns a boolean array, aligned with the checked neurons, that is
+        True for the neurons that fired
+        """
+        fired, firedIndices = self.advance(currentTau)
+        if len(firedIndices):
+            for i in firedIndices.tolist():
+                neuron = self.neurons[i]
+                if neuron.recordHistory:
+                    neuron.spikeTimes.append(currentTau)
+            self.pendingTaus.append(numpy.full(len(firedIndices), currentTau))
+            self.pendingIndices.append(firedIndices)
+        # the spikes of the first pending tau are due at the next tau at the
+        # earliest
+        if self.pendingTaus and\
+                currentTau + 1 >= self.pendingTaus[0][0] + self.minDelay:
+            self.flush()
+        return fired
+
+    def flush(self):
+        """ schedules all the pending spikes into the delay ring """
+        if self.pendingTaus:
+            taus = numpy.concatenate(self.pendingTaus)
+            firedIndices = numpy.concatenate(self.pendingIndices)
+            self.pendingTaus = []
+            self.pendingIndices = []
+            self._propagate(taus, firedIndices)
+
+    def advance(self, currentTau):
+        """ delivers the synaptic arrivals due at currentTau and updates every
+        checked neuron, without scheduling the spikes of the neurons that
+        fired; returns (fired, firedIndices)
+        """
+        self.ring.pop(currentTau, self.sumInputs)
+        self._checkDecay()
+        if kernel is None:
+            loadKernel()
+        if kernel:
+            return self._advanceKernel(currentTau)
+
+        n = self.numChecked
+        voltage = self.voltage[:n]
+        refractCount = self.refractCount[:n]
+        voltage *= self.decayFactor[:n]
+        voltage += self.sumInputs[:n]
+        self.sumInputs[:n] = 0
+        refractCount -= 1
+        numpy.maximum(refractCount, 0, out=refractCount)
+        if self.allHistory:
+            self.history.append(voltage.copy())
+        elif len(self.historyIndices):
+            self.history.append(voltage[self.historyIndices])
+
+        fired = (refractCount == 0) & (voltage >= self.threshold[:n])
+        firedIndices = numpy.flatnonzero(fired)
+        if len(firedIndices):
+            self.spikeVoltage[firedIndices] = voltage[firedIndices]
+            voltage[firedIndices] -= numpy.abs(self.threshold[firedIndices])
+            refractCount[firedIndices] = self.refractory[firedIndices]
+        self.lastTau = currentTau
+        return fired, firedIndices
+
+    def _advanceKernel(self, currentTau):
+        """ advance with the neuron update done by kernel """
+        n = self.numChecked
+        fired = numpy.empty(n, dtype=bool)
+        record = numpy.empty(n) if len(self.historyIndices) else _NO_RECORD
+        numFired = kernel(self.voltage[:n], self.sumInputs[:n],
+                          self.decayFactor[:n], self.refractCount[:n],
+                          self.threshold[:n], self.refractory[:n], fired,
+                          self.spikeVoltage[:n], record)
+        if self.allHistory:
+            self.history.append(record)
+        elif len(self.historyIndices):
+            self.history.append(record[self.historyIndices])
+        self.lastTau = currentTau
+        if numFired:
+            return fired, numpy.flatnonzero(fired)
+        return fired, numpy.empty(0, dtype=numpy.intp)
+
+    def nextEventTau(self, currentTau, limitTau):
+        """ returns the first tau in [currentTau, limitTau] at which the
+        network can do more than leak: a synaptic arrival, or currentTau
+        itself if some checked neuron could fire without further input.
+        limitTau (normally the next input) is returned if nothing is due
+        before it
+        """
+        self.flush()
+        self._checkDecay()
+        n = self.numChecked
+        voltage = self.voltage[:n]
+        factor = self.decayFactor[:n]
+        # the largest voltage each neuron can reach while it only leaks
+        bound = numpy.where(factor >= 0, numpy.maximum(voltage, 0),
+                            numpy.abs(voltage))
+        bound[(numpy.abs(factor) > 1) & (voltage != 0)] = numpy.inf
+        if numpy.any(bound >= self.threshold[:n]) or\
+                numpy.any(self.sumInputs[:n] != 0):
+            return currentTau
+        arrival = self.ring.nextArrival(currentTau)
+        if arrival is not None and arrival < limitTau:
+            return arrival
+        return limitTau
+
+    def skip(self, currentTau, numTauSteps):
+        """ Precondition:
+        nextEventTau(currentTau, ...) >= currentTau + numTauSteps
+        advances the checked neurons through numTauSteps taus in which they
+        receive no input and cannot fire: the leak is applied in closed form,
+        as LIFNeuron.leak(numTauSteps) does, and the refractory counters run
+        down.
+        decayFactor ** numTauSteps is not rounded like numTauSteps products
+        by decayFactor, so the voltages may differ from those of a step by
+        step run by a few ULP. No neuron can fire while it is skipped, but a
+        later input that brings a voltage within that much of its threshold
+        may fire it in one run and not in the other
+        """
+        numTauSteps = int(numTauSteps)
+        n = self.numChecked
+        voltage = self.voltage[:n]
+        if len(self.historyIndices):
+            h = self.historyIndices
+            steps = numpy.arange(1, numTauSteps + 1)[:, None]
+            self.history.extend(voltage[h] * self.leakPowers(steps, h))
+        voltage *= self.leakPowers(numTauSteps)
+        refractCount = self.refractCount[:n]
+        refractCount -= numTauSteps
+        numpy.maximum(refractCount, 0, out=refractCount)
+        self.lastTau = currentTau + numTauSteps - 1
+
+    def _propagate(self, currentTau, firedIndices):
+        """ schedules the arrival of the spikes of the fired neurons: one
+        gather over the CSR rows of the neurons that fired, accumulated into
+        the delay ring.
+        "currentTau": the tau at which they fired, or an array with one tau
+            per entry of firedIndices, in increasing order
+        """
+        starts = self.indptr[firedIndices]
+        stops = self.indptr[firedIndices + 1]
+        active = self.csrEdges[_ranges(starts, stops)]
+        if len(active):
+            taus = numpy.repeat(currentTau, stops - starts)\
+                if numpy.ndim(currentTau) else currentTau
+            self.ring.add(taus + self.synDelay[active], self.synKey[active],
+                          self.synPost[active], self.synWeight[active])
+            self.numEvents += len(active)
+        for b, band in enumerate(self.bands):
+            for tau, posts, weights in _convolveBand(band, currentTau,
+                                                     firedIndices):
+                self.ring.add(numpy.full(len(posts), tau), self.numEdges + b,
+                              posts, weights)
+                self.numEvents += len(posts)
+
+    def sync(self):
+        """ copies the engine state back into the Neuron and Synapse objects:
+        voltage, sumInputs, refractCount, the voltage history recorded since
+        the last sync, and the spikes in flight on the synapses, in their
+        activateFireDelays.
+        returns the input in flight on the edges of the stores, to be
+        carried over to a new engine, as a list of (store, arrivalTaus,
+        positions, weights): positions are the indices of the edges of a
+        Connectivity and of the post neurons of a BandedConnectivity
+        """
+        self.flush()
+        for neuron, v, s, r in zip(self.neurons, self.voltage.tolist(),
+                                   self.sumInputs.tolist(),
+                                   self.refractCount.tolist()):
+            neuron.voltage = v
+            neuron.sumInputs = s
+            neuron.refractCount = r
+        if self.history:
+            history = numpy.array(self.history).T.tolist()
+            for i, h in zip(self.historyIndices.tolist(), history):
+                self.neurons[i].voltageHistory.extend(h)
+            self.history = []
+        taus, keys, posts, weights = self.ring.pending(self.lastTau)
+        for synapse in self.synapses:
+            synapse.activateFireDelays = []
+        numSynapses = len(self.synapses)
+        for s, tau in zip(keys[keys < numSynapses].tolist(),
+                          taus[keys < numSynapses].tolist()):
+            self.synapses[s].activateFireDelays.append(tau - self.lastTau)
+        carry = []
+        for k, store in enumerate(self.connectivity):
+            offset = self.storeOffsets[k]
+            if offset is None:
+                b = self.storeOffsets[:k].count(None)
+                mine = keys == self.numEdges + b
+                positions = numpy.full(len(self.neurons), -1, dtype=numpy.intp)
+                post = self.bands[b][1]
+                positions[post] = numpy.arange(len(post))
+                positions = positions[posts[mine]]
+            else:
+                mine = (keys >= offset) & (keys < offset + len(store.pre))
+                positions = keys[mine] - offset
+            if mine.any():
+                carry.append((store, taus[mine], positions, weights[mine]))
+        return carry
@@ -0,0 +1,188 @@
+"""Progress reporting and spike sinks for Simulator.
+
+By default a Simulator does no I/O while it runs. A ProgressReporter reports
+the current tau at most every N taus and/or every T seconds, and SpikeSinks
+receive the neurons that fired at each tau. Simulator(verbose=True) restores
+the historical output: every tau and every "AP at ..." line printed.
+
+A Profiler given to Simulator.profiler times the phases of every tau and
+counts the spikes, synaptic events and inputs; without one, the simulation
+loop pays a single attribute test per tau.
+"""
+import csv
+import json
+import logging
+import time
+
+logger = logging.getLogger("Neuron")
+
+
+class ProgressReporter(object):
+    """ Class Invariant:
+    "everyTicks": report once everyTicks taus have passed since the last
+        report, or None.
+    "everySeconds": report once everySeconds seconds have passed since the
+        last report, or None. When both are given, whichever is reached
+        first triggers the report; if both are None, every tau is reported.
+    "level": logging level of the reports.
+    "write": if not None, called with the current tau instead of logging.
+    "lastTau", "lastTime": tau and time.monotonic() of the last report.
+    """
+
+    def __init__(self, everyTicks=None, everySeconds=None, level=logging.INFO,
+                 write=None):
+        self.everyTicks = everyTicks
+        self.everySeconds = everySeconds
+        self.level = level
+        self.write = write
+        self.lastTau = None
+        self.lastTime = time.monotonic()
+        self.startTime = self.lastTime
+
+    def due(self, currentTau, now):
+        """ returns True if a report is due at currentTau, at time now """
+        if self.lastTau is None or\
+                (self.everyTicks is None and self.everySeconds is None):
+            return True
+        return (self.everyTicks is not None and
+                currentTau - self.lastTau >= self.everyTicks) or\
+            (self.everySeconds is not None and
+             now - self.lastTime >= self.everySeconds)
+
+    def update(self, currentTau, finalTau):
+        """ called by Simulator at each tau it simulates """
+        now = time.monotonic()
+        if not self.due(currentTau, now):
+            return
+        if self.write is not None:
+            self.write(currentTau)
+        elif logger.isEnabledFor(self.level):
+            elapsed = now - self.startTime
+            logger.log(self.level, "tau %d/%d (%.1f%%), %.0f tau/s",
+                       currentTau, finalTau,
+                       100 * currentTau / max(finalTau, 1),
+                       currentTau / elapsed if elapsed > 0 else 0)
+        self.lastTau = currentTau
+        self.lastTime = now
+
+
+class SpikeSink(object):
+    """ Receives the spikes of a Simulator. Subclasses override spikes. """
+
+    def spikes(self, currentTau, neurons):
+        """ Precondition:
+        "currentTau": the tau at which the neurons fired.
+        "neurons": non-empty list of the Neuron instances that fired.
+        """
+        pass
+
+    def close(self):
+        """ called when the simulation loop ends """
+        pass
+
+
+class PrintSpikeSink(SpikeSink):
+    """ prints "AP at <tau> at <name>" for every spike, as Neuron.check used
+    to
+    """
+
+    def spikes(self, currentTau, neurons):
+        for neuron in neurons:
+            print("AP at " + str(currentTau) + " at " + neuron.name)
+
+
+class LogSpikeSink(SpikeSink):
+    """ Class Invariant:
+    "level": logging level at which every spike is logged.
+    """
+
+    def __init__(self, level=logging.DEBUG):
+        self.level = level
+
+    def spikes(self, currentTau, neurons):
+        if logger.isEnabledFor(self.level):
+            for neuron in neurons:
+                logger.log(self.level, "AP at %d at %s", currentTau,
+                           neuron.name)
+
+
+class Profiler(object):
+    """ Class Invariant:
+    Cumulative and per-tau timings of the phases of Simulator.runOneTimeStep:
+    "inputs" (handing out the inputs due), "synapses" (checking the Synapse
+    objects, or delivering the engine's synaptic arrivals), "neurons"
+    (checking the neurons; on the engine this includes scheduling the
+    spikes), "output" (spike sinks and recorders) and "skip" (taus jumped
+    over by an event-driven run, one row per jump).
+    "totals": dict mapping each of PHASES to its total seconds and each of
+        COUNTERS to its total count.
+    "numTaus": number of taus profiled, skipped ones included.
+    "keepSeries": if True, "series" holds one row per tau (or jump) with
+        the tau followed by the value of each of COLUMNS.
+    On the engine, "synapseEvents" counts the edges activated when spikes
+    are scheduled, which can be some taus after they fired; Synapse objects
+    count their firings.
+    """
+    PHASES = ("inputs", "synapses", "neurons", "output", "skip")
+    COUNTERS = ("spikes", "synapseEvents", "inputs")
+    COLUMNS = tuple(name + "Seconds" for name in PHASES) + COUNTERS
+
+    def __init__(self, keepSeries=True):
+        self.keepSeries = keepSeries
+        self.totals = dict((name, 0) for name in self.COLUMNS)
+        self.numTaus = 0
+        self.series = []
+
+    def tick(self, currentTau, seconds, counts, numTaus=1):
+        """ Precondition:
+        "seconds": tuple of the seconds spent in each of PHASES.
+        "counts": tuple of the value of each of COUNTERS.
+        records the profile of currentTau, or of the numTaus taus from
+        currentTau on
+        """
+        row = seconds + counts
+        totals = self.totals
+        for name, value in zip(self.COLUMNS, row):
+            totals[name] += value
+        self.numTaus += numTaus
+        if self.keepSeries:
+            self.series.append((currentTau,) + row)
+
+    def summary(self):
+        """ returns a table of the totals of every phase and counter, with
+        their share of the time and their mean per tau
+        """
+        numTaus = max(self.numTaus, 1)
+        seconds = sum(self.totals[name + "Seconds"] for name in self.PHASES)
+        lines = ["%-14s %12s %8s %14s" % ("phase", "seconds", "share",
+                                         "per tau")]
+        for name in self.PHASES:
+            value = self.totals[name + "Seconds"]
+            lines.append("%-14s %12.6f %7.1f%% %14.3e" % (
+                name, value, 100 * value / seconds if seconds else 0,
+                value / numTaus))
+        lines.append("%-14s %12.6f %7.1f%% %14.3e" % (
+            "total", seconds, 100 if seconds else 0, seconds / numTaus))
+        lines.append("")
+        lines.append("%-14s %12s %8s %14s" % ("counter", "total", "",
+                                              "per tau"))
+        for name in self.COUNTERS:
+            lines.append("%-14s %12d %8s %14.3f" % (
+                name, self.totals[name], "", self.totals[name] / numTaus))
+        lines.append("%-14s %12d" % ("taus", self.numTaus))
+        return "\n".join(lines)
+
+    def writeCsv(self, path):
+        """ writes series to path as CSV, one row per tau, with a header """
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("tau",) + self.COLUMNS)
+            writer.writerows(self.series)
+
+    def writeJson(self, path):
+        """ writes the totals, numTaus and series to path as JSON """
+        with open(path, "w") as f:
+            json.dump({"columns": ("tau",) + self.COLUMNS,
+                       "totals": self.totals,
+                       "numTaus": self.numTaus,
+                       "series": self.series}, f)
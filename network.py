@@ -0,0 +1,386 @@
+"""Saving and loading networks in a single binary file.
+
+saveNetwork writes the neurons, synapses, Connectivity stores, pending
+inputs and the spikes in flight of a Simulator to one uncompressed .npz
+file: one array per neuron parameter, synapse field and store, instead of
+one Python object per neuron or edge. loadNetwork rebuilds a Simulator from
+it. By default the synapses come back as one Connectivity store, which is
+much faster to load than Synapse objects; with mmap=True the arrays are
+memory-mapped from the file instead of being read into memory.
+
+A Checkpointer saves the network of a running Simulator every N taus and/or
+every T seconds, and resume continues a run from the last checkpoint with
+exactly the results the run would have had without the interruption.
+
+Only the state of the network is saved: spikeTimes, voltageHistory,
+recorders, spike sinks and progress reporting are not. Neurons are rebuilt
+as instances of their class with the attributes of Neuron (and the
+decayConstant of LIF neurons); other attributes are not saved.
+"""
+import importlib
+import os
+import struct
+import time
+import zipfile
+
+import numpy
+
+from engine import BandedConnectivity, Connectivity
+from Neuron import LIFNeuron, Neuron, Simulator, Synapse
+
+FORMAT_VERSION = 2
+
+CONNECTIVITY, BANDED = 0, 1
+
+
+def _className(aClass):
+    return aClass.__module__ + ":" + aClass.__qualname__
+
+
+def _classNamed(name):
+    module, qualname = name.split(":")
+    anObject = importlib.import_module(module)
+    for part in qualname.split("."):
+        anObject = getattr(anObject, part)
+    return anObject
+
+
+def networkArrays(simulator):
+    """ returns the dict of arrays that saveNetwork writes for simulator """
+    carries = []
+    if simulator.engine is not None:
+        carries.extend(simulator.engine.sync())
+    if simulator._carry is not None:
+        carries.extend(simulator._carry)
+
+    neurons = list(simulator.neuronCheckList)
+    index = dict((n, i) for i, n in enumerate(neurons))
+
+    def indicesOf(aNeuronList):
+        for neuron in aNeuronList:
+            if neuron not in index:
+                index[neuron] = len(neurons)
+                neurons.append(neuron)
+        return numpy.array([index[n] for n in aNeuronList], dtype=numpy.int64)
+
+    synapses = simulator.synapseCheckList
+    arrays = {"format": FORMAT_VERSION,
+              "tau": simulator.tau,
+              "finalTau": simulator.finalTau,
+              "nextTau": simulator.nextTau,
+              "vectorized": simulator.vectorized,
+              "simulatorRecordHistory": simulator.recordHistory,
+              "numChecked": len(simulator.neuronCheckList),
+              "synapsePre": indicesOf([s.pre for s in synapses]),
+              "synapsePost": indicesOf([s.post for s in synapses]),
+              "synapseWeight": numpy.array([s.weight for s in synapses],
+                                           dtype=float),
+              "synapseDelay": numpy.array([s.delay for s in synapses],
+                                          dtype=float),
+              "flightSynapse": numpy.array(
+                  [k for k, s in enumerate(synapses)
+                   for x in s.activateFireDelays], dtype=numpy.int64),
+              "flightDelay": numpy.array(
+                  [x for s in synapses for x in s.activateFireDelays],
+                  dtype=float)}
+    classes = [_className(type(s)) for s in synapses]
+    names = sorted(set(classes))
+    arrays["synapseClasses"] = numpy.array(names, dtype=str)
+    position = dict((name, k) for k, name in enumerate(names))
+    arrays["synapseClass"] = numpy.array([position[c] for c in classes],
+                                         dtype=numpy.int32)
+
+    kinds = []
+    for k, store in enumerate(simulator.connectivityList):
+        prefix = "store%d_" % k
+        if isinstance(store, BandedConnectivity):
+            kinds.append(BANDED)
+            arrays[prefix + "pre"] = indicesOf(store.preNeurons)
+            arrays[prefix + "post"] = indicesOf(store.postNeurons)
+            arrays[prefix + "lowOffset"] = store.lowOffset
+            arrays[prefix + "kernel"] = store.kernel
+            arrays[prefix + "delay"] = store.delay
+        else:
+            kinds.append(CONNECTIVITY)
+            arrays[prefix + "neurons"] = indicesOf(store.neurons)
+            arrays[prefix + "pre"] = store.pre
+            arrays[prefix + "post"] = store.post
+            arrays[prefix + "weight"] = store.weight
+            arrays[prefix + "delay"] = store.delay
+    arrays["storeKind"] = numpy.array(kinds, dtype=numpy.int32)
+
+    # an input whose time is not a whole tau is never due
+    inputs = [entry for entry in simulator.inputSchedule.remaining()
+              if entry[0] % 1 == 0]
+    arrays["inputTime"] = numpy.array([entry[0] for entry in inputs],
+                                      dtype=numpy.int64)
+    arrays["inputNeuron"] = indicesOf([entry[1] for entry in inputs])
+    arrays["inputVoltage"] = numpy.array([entry[2] for entry in inputs],
+                                         dtype=float)
+
+    # the input in flight on the edges of the stores (see ArrayEngine.sync)
+    storeIndex = dict((id(store), k)
+                      for k, store in enumerate(simulator.connectivityList))
+    arrays["carryStore"] = numpy.concatenate(
+        [numpy.full(len(taus), storeIndex[id(store)], dtype=numpy.int64)
+         for store, taus, positions, weights in carries] +
+        [numpy.empty(0, dtype=numpy.int64)])
+    arrays["carryTau"] = numpy.concatenate(
+        [taus for store, taus, positions, weights in carries] +
+        [numpy.empty(0, dtype=numpy.int64)]).astype(numpy.int64)
+    arrays["carryPosition"] = numpy.concatenate(
+        [positions for store, taus, positions, weights in carries] +
+        [numpy.empty(0, dtype=numpy.int64)]).astype(numpy.int64)
+    arrays["carryValue"] = numpy.concatenate(
+        [weights for store, taus, positions, weights in carries] +
+        [numpy.empty(0)])
+
+    # every neuron is known once the synapses, stores and inputs have been
+    # indexed
+    classes = [_className(type(n)) for n in neurons]
+    names = sorted(set(classes))
+    arrays["neuronClasses"] = numpy.array(names, dtype=str)
+    position = dict((name, k) for k, name in enumerate(names))
+    arrays["neuronClass"] = numpy.array([position[c] for c in classes],
+                                        dtype=numpy.int32)
+    arrays["neuronName"] = numpy.array([n.name for n in neurons], dtype=str)
+    for name in ("voltage", "threshold", "refractory", "refractCount",
+                 "sumInputs"):
+        arrays[name] = numpy.array([getattr(n, name) for n in neurons],
+                                   dtype=float)
+    arrays["decayConstant"] = numpy.array(
+        [getattr(n, "decayConstant", numpy.nan) for n in neurons], dtype=float)
+    arrays["recordHistory"] = numpy.array([n.recordHistory for n in neurons],
+                                          dtype=bool)
+    return arrays
+
+
+def saveNetwork(simulator, path):
+    """ Precondition:
+    "simulator": a Simulator; input voltages must be numbers.
+    "path": name of the file to write; it is replaced atomically.
+    writes the network of simulator to path (see networkArrays); the
+    engine, if any, is synced first
+    """
+    arrays = networkArrays(simulator)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        numpy.savez(f, **arrays)
+    os.replace(temporary, path)
+
+
+def readArrays(path, mmap=False):
+    """ returns the dict of the arrays of the .npz file at path; with mmap,
+    the arrays of an uncompressed file are memory maps of it
+    """
+    if not mmap:
+        with numpy.load(path, allow_pickle=False) as data:
+            return dict((name, data[name]) for name in data.files)
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(path + " is compressed and cannot be "
+                                 "memory-mapped")
+            # skip the local file header, whose name and extra fields can
+            # differ in length from those of the central directory
+            f.seek(info.header_offset + 26)
+            nameLength, extraLength = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + nameLength + extraLength)
+            version = numpy.lib.format.read_magic(f)
+            if version == (1, 0):
+                readHeader = numpy.lib.format.read_array_header_1_0
+            else:
+                readHeader = numpy.lib.format.read_array_header_2_0
+            shape, fortran, dtype = readHeader(f)
+            name = info.filename[:-len(".npy")]
+            if dtype.hasobject:
+                raise ValueError(path + " holds Python objects")
+            if numpy.prod(shape) == 0 or shape == ():
+                arrays[name] = numpy.lib.format.read_array(
+                    archive.open(info), allow_pickle=False)
+            else:
+                arrays[name] = numpy.memmap(path, dtype=dtype, mode="r",
+                                            offset=f.tell(), shape=shape,
+                                            order="F" if fortran else "C")
+    return arrays
+
+
+def loadNetwork(path, simulator=None, mmap=False, synapses=False):
+    """ Precondition:
+    "path": a file written by saveNetwork.
+    "simulator": an empty Simulator (or subclass) to load the network into;
+        by default a new Simulator with the saved tau, finalTau and mode.
+    "mmap": memory-map the arrays of the file instead of reading them.
+    "synapses": rebuild the Synapse objects; by default all the synapses
+        become one Connectivity store, and the simulator runs on the engine.
+    returns the simulator. Its startTau is the tau at which the network was
+    saved, so that main continues from there. The spikes in flight on
+    Synapse objects come back in their activateFireDelays, and those on
+    stores as the carry of the engine, which stores always run on, so they
+    are delivered whether or not the simulator is vectorized
+    """
+    arrays = readArrays(path, mmap)
+    if int(arrays["format"]) != FORMAT_VERSION:
+        raise ValueError(path + " has format " + str(int(arrays["format"])))
+    if simulator is None:
+        simulator = Simulator(t=arrays["tau"].item(),
+                              finalT=int(arrays["finalTau"]),
+                              vectorized=bool(arrays["vectorized"]),
+                              recordHistory=bool(
+                                  arrays["simulatorRecordHistory"]))
+    nextTau = int(arrays["nextTau"])
+
+    neurons = []
+    classes = [_classNamed(name) for name in arrays["neuronClasses"].tolist()]
+    decayConstants = arrays["decayConstant"].tolist()
+    for k, name, v, t, r, c, s, h in zip(
+            arrays["neuronClass"].tolist(), arrays["neuronName"].tolist(),
+            arrays["voltage"].tolist(), arrays["threshold"].tolist(),
+            arrays["refractory"].tolist(), arrays["refractCount"].tolist(),
+            arrays["sumInputs"].tolist(), arrays["recordHistory"].tolist()):
+        neuron = classes[k].__new__(classes[k])
+        Neuron.__init__(neuron, avoltage=v, athreshold=t,
+                        arefractory=int(r) if r % 1 == 0 else r, aname=name)
+        if isinstance(neuron, LIFNeuron):
+            neuron.decayConstant = decayConstants[len(neurons)]
+        neuron.refractCount = int(c) if c % 1 == 0 else c
+        neuron.sumInputs = s
+        neuron.recordHistory = h
+        if nextTau > 0:
+            # the saved voltage belongs to the history of the saved run
+            neuron.voltageHistory = []
+        neurons.append(neuron)
+    for neuron in neurons[:int(arrays["numChecked"])]:
+        simulator.addNeuron(neuron)
+
+    pre = arrays["synapsePre"]
+    post = arrays["synapsePost"]
+    weight = arrays["synapseWeight"]
+    delay = arrays["synapseDelay"]
+    flightSynapse = arrays["flightSynapse"]
+    flightDelay = arrays["flightDelay"]
+    carry = []
+    synapseClasses = [_classNamed(name)
+                      for name in arrays["synapseClasses"].tolist()]
+    if synapses:
+        for k, i, j, w, d in zip(arrays["synapseClass"].tolist(), pre.tolist(),
+                                 post.tolist(), weight.tolist(),
+                                 delay.tolist()):
+            simulator.addSynapse(synapseClasses[k](
+                neurons[i], neurons[j], w, int(d) if d % 1 == 0 else d))
+        for k, x in zip(flightSynapse.tolist(), flightDelay.tolist()):
+            simulator.synapseCheckList[k].activateFireDelays.append(
+                int(x) if x % 1 == 0 else x)
+    elif len(pre):
+        if any(aClass is not Synapse for aClass in synapseClasses):
+            raise ValueError("subclasses of Synapse can only be loaded with "
+                             "synapses=True")
+        # synapses whose delay is not a positive integer never fire
+        live = (delay >= 1) & (delay % 1 == 0)
+        store = Connectivity()
+        store.neurons = neurons
+        store.index = dict((n, i) for i, n in enumerate(neurons))
+        store.addEdges(pre[live].astype(numpy.int32),
+                       post[live].astype(numpy.int32), weight[live],
+                       delay[live].astype(numpy.int32))
+        simulator.addConnectivity(store)
+        # the spikes in flight on the synapses become input in flight on
+        # the edges of the store
+        flying = (flightDelay >= 1) & (flightDelay % 1 == 0)
+        flightSynapse = flightSynapse[flying]
+        carry.append((store, nextTau - 1 +
+                      flightDelay[flying].astype(numpy.int64),
+                      (numpy.cumsum(live) - 1)[flightSynapse],
+                      weight[flightSynapse]))
+
+    stores = []
+    for k, kind in enumerate(arrays["storeKind"].tolist()):
+        prefix = "store%d_" % k
+        if kind == BANDED:
+            store = BandedConnectivity(
+                [neurons[i] for i in arrays[prefix + "pre"].tolist()],
+                [neurons[i] for i in arrays[prefix + "post"].tolist()],
+                int(arrays[prefix + "lowOffset"]), arrays[prefix + "kernel"],
+                int(arrays[prefix + "delay"]))
+        else:
+            store = Connectivity()
+            store.indicesOf([neurons[i]
+                             for i in arrays[prefix + "neurons"].tolist()])
+            store.addEdges(arrays[prefix + "pre"], arrays[prefix + "post"],
+                           arrays[prefix + "weight"], arrays[prefix + "delay"])
+        simulator.addConnectivity(store)
+        stores.append(store)
+    carryStore = arrays["carryStore"]
+    for k in numpy.unique(carryStore).tolist():
+        mine = carryStore == k
+        carry.append((stores[k], arrays["carryTau"][mine],
+                      arrays["carryPosition"][mine],
+                      arrays["carryValue"][mine]))
+
+    simulator.appendInputs(arrays["inputTime"].astype(numpy.int64),
+                           [neurons[i]
+                            for i in arrays["inputNeuron"].tolist()],
+                           arrays["inputVoltage"])
+    if carry:
+        simulator._carry = carry
+    simulator.startTau = nextTau
+    simulator.nextTau = nextTau
+    return simulator
+
+
+class Checkpointer(object):
+    """ Class Invariant:
+    Saves the network of a running Simulator to "path" with saveNetwork.
+    "everyTicks": save once at least everyTicks taus have been simulated
+        since the last save, or None.
+    "everySeconds": save once at least everySeconds seconds have passed
+        since the last save, or None. If both are None, nothing is saved.
+    "lastTau", "lastTime": nextTau of the simulator and time.monotonic() at
+        the last save (or at the first update).
+    "numSaved": number of checkpoints written.
+    """
+
+    def __init__(self, path, everyTicks=None, everySeconds=None):
+        self.path = path
+        self.everyTicks = everyTicks
+        self.everySeconds = everySeconds
+        self.lastTau = None
+        self.lastTime = time.monotonic()
+        self.numSaved = 0
+
+    def update(self, simulator):
+        """ called by Simulator after each tau it simulates or skips """
+        if self.lastTau is None:
+            self.lastTau = simulator.startTau
+        if (self.everyTicks is not None and
+                simulator.nextTau - self.lastTau >= self.everyTicks) or\
+                (self.everySeconds is not None and
+                 time.monotonic() - self.lastTime >= self.everySeconds):
+            self.save(simulator)
+
+    def save(self, simulator):
+        """ writes a checkpoint of simulator now """
+        saveNetwork(simulator, self.path)
+        self.lastTau = simulator.nextTau
+        self.lastTime = time.monotonic()
+        self.numSaved += 1
+
+
+def resume(path, simulator=None, useDelay=False, eventDriven=False,
+           checkpointer=None):
+    """ Precondition:
+    "path": a checkpoint, i.e. a file written by saveNetwork.
+    "simulator": see loadNetwork.
+    "useDelay", "eventDriven": passed to Simulator.main; give the ones the
+        interrupted run was started with to get exactly its results.
+    "checkpointer": Checkpointer that keeps saving the resumed run, or None.
+    loads the network of the checkpoint, with its Synapse objects, and runs
+    it from the tau at which it was saved to its finalTau.
+    returns the simulator; its neurons' spikeTimes and voltageHistory only
+    hold what happened after the checkpoint
+    """
+    simulator = loadNetwork(path, simulator, synapses=True)
+    simulator.checkpointer = checkpointer
+    simulator.main(useDelay=useDelay, eventDriven=eventDriven)
+    return simulator
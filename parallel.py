@@ -0,0 +1,272 @@
+"""Multi-process simulation of a network split into shards of neurons.
+
+runPartitioned splits the neurons of a Simulator's ArrayEngine into
+contiguous shards, one per worker process. Each worker owns the state of its
+neurons, the synapses that end on them and their slice of the delay ring.
+No spike reaches another neuron sooner than the shortest synaptic delay, so
+each worker advances its neurons through a window of minDelay taus on its
+own; at the end of the window the workers publish which of their neurons
+fired at each of those taus in a shared-memory array, wait at a barrier,
+and then schedule the arrivals of all the spikes on their own synapses.
+Every neuron is updated by the same code as in ArrayEngine and every arrival
+keeps the key of its edge, so the inputs of each neuron are added in the
+same order and the results are identical to a single-process run.
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+import threading
+
+import numpy
+
+from engine import ArrayEngine, DelayRing, _csr
+
+
+class EngineShard(ArrayEngine):
+    """ Class Invariant:
+    Inherits ArrayEngine, restricted to the neurons lo <= i < hi of a parent
+    engine; it holds no Neuron or Synapse objects.
+    "lo", "hi": the global indices of the neurons of the shard.
+    "numChecked": number of checked neurons in the shard; they come first.
+    "indptr", "csrEdges": CSR rows over the global neuron indices, listing
+        the edges that end in the shard.
+    "synPost": shard-local index of the post neuron of each edge.
+    "synKey": the key of each edge in the parent engine.
+    "bands": the parent's bands, with the post neurons outside the shard
+        set to -1 and the others as shard-local indices.
+    "spikeTaus", "spikeIndices": lists of arrays of the spikes of the shard,
+        as global neuron indices.
+    """
+
+    def __init__(self, engine, lo, hi):
+        self.lo = lo
+        self.hi = hi
+        self.numChecked = max(0, min(engine.numChecked, hi) - lo)
+        for name in ("voltage", "threshold", "refractory", "refractCount",
+                     "sumInputs", "spikeVoltage", "decayFactor"):
+            setattr(self, name, getattr(engine, name)[lo:hi].copy())
+        live = engine.csrEdges
+        posts = engine.synPost[live]
+        edges = live[(posts >= lo) & (posts < hi)]
+        edges.sort()
+        self.synPost = engine.synPost[edges] - lo
+        self.synWeight = engine.synWeight[edges]
+        self.synDelay = engine.synDelay[edges]
+        self.synKey = engine.synKey[edges]
+        self.numEdges = engine.numEdges
+        self.indptr, self.csrEdges = _csr(engine.synPre[edges],
+                                          len(engine.neurons))
+        self.bands = [(lookup, numpy.where((post >= lo) & (post < hi),
+                                           post - lo, -1), lowOffset, kernel,
+                       delay)
+                      for lookup, post, lowOffset, kernel, delay
+                      in engine.bands]
+        self.ring = DelayRing(engine.ring.size)
+        taus, keys, posts, weights = engine.ring.pending(engine.lastTau)
+        mine = (posts >= lo) & (posts < hi)
+        self.ring.add(taus[mine], keys[mine], posts[mine] - lo, weights[mine])
+        self.lastTau = engine.lastTau
+        history = engine.historyIndices
+        history = history[(history >= lo) & (history < hi)] - lo
+        self.historyIndices = history
+        self.allHistory = len(history) == self.numChecked and len(history) > 0
+        self.history = []
+        self.spikeTaus = []
+        self.spikeIndices = []
+        self.numEvents = 0
+
+    def _checkDecay(self):
+        """ the decay factors were copied from the parent engine, which holds
+        the neurons; a shard keeps them for the whole run
+        """
+        pass
+
+
+def _partition(engine, numWorkers):
+    """ returns the bounds of numWorkers contiguous shards of roughly equal
+    cost, counting one per neuron and one per incoming edge
+    """
+    cost = numpy.ones(len(engine.neurons))
+    cost += numpy.bincount(engine.synPost[engine.csrEdges],
+                           minlength=len(engine.neurons))
+    total = numpy.cumsum(cost)
+    cuts = numpy.searchsorted(total, total[-1] * numpy.arange(1, numWorkers)
+                              / numWorkers)
+    return [0] + sorted(set(int(c) for c in cuts)) + [len(engine.neurons)]
+
+
+def _runShard(shard, inputs, startTau, finalTau, window, sharedName,
+              numNeurons, barrier, connection):
+    """ the loop of one worker process; sends the final state of its shard,
+    or the exception that stopped it, through connection
+    """
+    shared = None
+    try:
+        shared = shared_memory.SharedMemory(name=sharedName)
+        # two sets of rows used in turn: a worker can only overwrite a set
+        # after every worker has passed the next barrier, i.e. has finished
+        # reading it
+        firedRows = numpy.ndarray((2, window, numNeurons), dtype=bool,
+                                  buffer=shared.buf)
+        times, indices, voltages = inputs
+        cursor = 0
+        lo = shard.lo
+        n = shard.numChecked
+        for windowStart in range(startTau, finalTau, window):
+            rows = firedRows[((windowStart - startTau) // window) % 2]
+            windowTaus = range(windowStart,
+                               min(windowStart + window, finalTau))
+            for k, currentTau in enumerate(windowTaus):
+                stop = cursor
+                while stop < len(times) and times[stop] == currentTau:
+                    stop += 1
+                if stop > cursor:
+                    numpy.add.at(shard.sumInputs, indices[cursor:stop],
+                                 voltages[cursor:stop])
+                    cursor = stop
+                fired, firedIndices = shard.advance(currentTau)
+                rows[k, lo:lo + n] = fired
+                if len(firedIndices):
+                    shard.spikeTaus.append(numpy.full(len(firedIndices),
+                                                      currentTau))
+                    shard.spikeIndices.append(firedIndices + lo)
+            barrier.wait()
+            k, firedIndices = numpy.nonzero(rows[:len(windowTaus)])
+            if len(firedIndices):
+                shard._propagate(windowStart + k, firedIndices)
+        flight = shard.ring.pending(shard.lastTau)
+        if shard.history:
+            history = numpy.array(shard.history)
+        else:
+            history = numpy.empty((finalTau - startTau,
+                                   len(shard.historyIndices)))
+        connection.send((shard.lo, shard.hi, shard.voltage, shard.refractCount,
+                         shard.sumInputs, flight, history,
+                         numpy.concatenate(shard.spikeTaus +
+                                           [numpy.empty(0, dtype=int)]),
+                         numpy.concatenate(shard.spikeIndices +
+                                           [numpy.empty(0, dtype=int)])))
+    except BaseException as error:
+        barrier.abort()
+        connection.send(error)
+    finally:
+        if shared is not None:
+            shared.close()
+        connection.close()
+
+
+def runPartitioned(simulator, numWorkers, startTau=0):
+    """ Precondition:
+    "simulator": a Simulator whose network the ArrayEngine supports; it
+        must not have Recorders, a checkpointer or a profiler, which need
+        the state at every tau.
+    "numWorkers": number of worker processes (and shards).
+    "startTau": the first tau to simulate.
+    runs the simulator from startTau to finalTau on numWorkers processes,
+    then copies the result back into the simulator's engine and objects
+    """
+    if simulator.recorders:
+        raise ValueError("Recorders are not supported in partitioned runs")
+    if simulator.checkpointer is not None:
+        raise ValueError("checkpoints are not supported in partitioned runs")
+    if simulator.profiler is not None:
+        raise ValueError("profiling is not supported in partitioned runs")
+    engine = simulator.engine
+    if engine is None:
+        engine = simulator.buildEngine(startTau)
+    engine.flush()
+    window = engine.minDelay
+    finalTau = simulator.finalTau
+    if finalTau <= startTau:
+        return
+
+    inputs = [[], [], []]
+    due = simulator.inputSchedule.popBefore(finalTau)
+    for aTime, aNeuron, aVoltage in due:
+        if aTime >= startTau and aTime % 1 == 0:
+            i = engine.index.get(aNeuron)
+            if i is None:
+                aNeuron.addVoltage(aVoltage)
+            else:
+                inputs[0].append(int(aTime))
+                inputs[1].append(i)
+                inputs[2].append(aVoltage)
+    times = numpy.array(inputs[0], dtype=numpy.int64)
+    indices = numpy.array(inputs[1], dtype=numpy.intp)
+    voltages = numpy.array(inputs[2], dtype=float)
+
+    bounds = _partition(engine, numWorkers)
+    context = multiprocessing.get_context()
+    numNeurons = len(engine.neurons)
+    shared = shared_memory.SharedMemory(create=True,
+                                        size=max(1, 2 * window * numNeurons))
+    try:
+        numpy.ndarray((2, window, numNeurons), dtype=bool,
+                      buffer=shared.buf)[:] = False
+        barrier = context.Barrier(len(bounds) - 1)
+        processes = []
+        connections = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            shard = EngineShard(engine, lo, hi)
+            mine = (indices >= lo) & (indices < hi)
+            receive, send = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_runShard,
+                args=(shard, (times[mine], indices[mine] - lo, voltages[mine]),
+                      startTau, finalTau, window, shared.name, numNeurons,
+                      barrier, send))
+            process.start()
+            send.close()
+            processes.append(process)
+            connections.append(receive)
+        results = [connection.recv() for connection in connections]
+        for process in processes:
+            process.join()
+    finally:
+        shared.close()
+        shared.unlink()
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        # the first error that is not a worker released by barrier.abort()
+        causes = [e for e in errors
+                  if not isinstance(e, threading.BrokenBarrierError)]
+        raise RuntimeError("a worker process failed") from \
+            (causes or errors)[0]
+
+    lastTau = finalTau - 1
+    spikeTaus = []
+    spikeIndices = []
+    histories = []
+    engine.ring = DelayRing(engine.ring.size)
+    for lo, hi, voltage, refractCount, sumInputs, flight, history, taus, fired\
+            in results:
+        engine.voltage[lo:hi] = voltage
+        engine.refractCount[lo:hi] = refractCount
+        engine.sumInputs[lo:hi] = sumInputs
+        arrivalTaus, keys, posts, weights = flight
+        engine.ring.add(arrivalTaus, keys, posts + lo, weights)
+        histories.append(history)
+        spikeTaus.append(taus)
+        spikeIndices.append(fired)
+    engine.lastTau = lastTau
+    simulator.nextTau = finalTau
+    if len(engine.historyIndices):
+        engine.history.extend(numpy.hstack(histories))
+
+    taus = numpy.concatenate(spikeTaus)
+    fired = numpy.concatenate(spikeIndices)
+    order = numpy.lexsort((fired, taus))
+    taus, fired = taus[order].tolist(), fired[order].tolist()
+    for currentTau, i in zip(taus, fired):
+        neuron = engine.neurons[i]
+        if neuron.recordHistory:
+            neuron.spikeTimes.append(currentTau)
+    if simulator.spikeSinks:
+        start = 0
+        while start < len(taus):
+            stop = start
+            while stop < len(taus) and taus[stop] == taus[start]:
+                stop += 1
+            neurons = [engine.neurons[i] for i in fired[start:stop]]
+            for sink in simulator.spikeSinks:
+                sink.spikes(taus[start], neurons)
+            start = stop
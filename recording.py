@@ -0,0 +1,385 @@
+"""Preallocated recording of chosen neurons and variables for Simulator.
+
+A Recorder samples the selected variables of the selected neurons every
+"every" taus into numpy arrays sized from the simulator's finalTau, and keeps
+the spikes of those neurons as (tau, neuron) pairs. Neurons that are not
+selected are never touched. Together with Simulator(recordHistory=False),
+which stops the per-neuron voltageHistory and spikeTimes lists, it bounds
+the memory of a run to what is actually asked for.
+
+A StreamingRecorder does the same but flushes full buffers to a directory of
+chunked .npy files described by index.json, so that its memory stays bounded
+however long the run is; RecordingReader reads such a directory back through
+memory maps.
+"""
+import json
+import os
+
+import numpy
+
+VARIABLES = ("voltage", "refractCount")
+
+
+class Recorder(object):
+    """ Class Invariant:
+    "neurons": list of the recorded Neuron instances; all of them must be in
+        the simulator's neuronCheckList.
+    "variables": tuple of the recorded variables, taken from VARIABLES.
+    "every": a sample is taken at every tau that is a multiple of every.
+    "recordSpikes": if True, the spikes of the neurons are kept.
+    "numSamples": number of samples taken so far.
+    "times": array of the tau of each sample; only the first numSamples
+        entries are valid.
+    "data": dict mapping each variable to an array of shape
+        (capacity, len(neurons)); row k holds sample k. At a spike, the
+        voltage is the one before the reset, as in voltageHistory.
+    "numSpikes": number of spikes kept so far.
+    "spikeTaus", "spikeNeurons": arrays of the tau and the position in
+        "neurons" of each spike; only the first numSpikes entries are valid.
+    """
+
+    def __init__(self, neurons, variables=("voltage",), every=1,
+                 recordSpikes=True):
+        """ Precondition:
+        "neurons": list of Neuron instances to record.
+        "variables": names of the variables to sample, from VARIABLES.
+        "every": positive integer, the decimation of the samples.
+        "recordSpikes": whether to keep the spikes of the neurons.
+        """
+        for variable in variables:
+            if variable not in VARIABLES:
+                raise ValueError("cannot record " + repr(variable) +
+                                 "; choose from " + repr(VARIABLES))
+        if every < 1 or every % 1 != 0:
+            raise ValueError("every must be a positive integer")
+        self.neurons = list(neurons)
+        self.variables = tuple(variables)
+        self.every = int(every)
+        self.recordSpikes = recordSpikes
+        self.numSamples = 0
+        self.times = None
+        self.data = None
+        self.numSpikes = 0
+        self.spikeTaus = numpy.empty(1024, dtype=numpy.int64)
+        self.spikeNeurons = numpy.empty(1024, dtype=numpy.intp)
+        self._positions = None
+        self._checkList = None
+        self._checkLength = 0
+
+    def allocate(self, startTau, finalTau):
+        """ preallocates room for every sample from startTau to finalTau """
+        first = -(-startTau // self.every) * self.every
+        capacity = max(0, -(-(finalTau - first) // self.every)) + 1
+        self.times = numpy.empty(capacity, dtype=numpy.int64)
+        self.data = dict((variable, numpy.empty((capacity, len(self.neurons))))
+                         for variable in self.variables)
+        self.numSamples = 0
+
+    def _grow(self):
+        capacity = 2 * len(self.times)
+        times = numpy.empty(capacity, dtype=numpy.int64)
+        times[:self.numSamples] = self.times[:self.numSamples]
+        self.times = times
+        for variable, values in self.data.items():
+            grown = numpy.empty((capacity, len(self.neurons)))
+            grown[:self.numSamples] = values[:self.numSamples]
+            self.data[variable] = grown
+
+    def positionsIn(self, neuronCheckList):
+        """ returns the positions of the recorded neurons in neuronCheckList,
+        which are also their indices in an ArrayEngine
+        """
+        if self._checkList is not neuronCheckList or\
+                len(self._positions) != len(self.neurons) or\
+                self._checkLength != len(neuronCheckList):
+            index = dict((n, i) for i, n in enumerate(neuronCheckList))
+            missing = [n.name for n in self.neurons if n not in index]
+            if missing:
+                raise ValueError("recorded neurons are not checked by the "
+                                 "simulator: " + ", ".join(missing))
+            self._positions = numpy.array([index[n] for n in self.neurons],
+                                          dtype=numpy.intp)
+            self._checkList = neuronCheckList
+            self._checkLength = len(neuronCheckList)
+        return self._positions
+
+    def record(self, simulator, currentTau, firedNeurons):
+        """ called by Simulator after every simulated tau """
+        if self.recordSpikes:
+            positions = self.positionsIn(simulator.neuronCheckList)
+            fired = numpy.flatnonzero(numpy.asarray(firedNeurons)[positions])
+            if len(fired):
+                self._addSpikes(currentTau, fired)
+        if currentTau % self.every == 0 and self.variables:
+            if self.data is None:
+                self.allocate(currentTau, simulator.finalTau)
+            if self.numSamples == len(self.times):
+                self._makeRoom()
+            row = self.numSamples
+            self.times[row] = currentTau
+            engine = simulator.engine
+            positions = self.positionsIn(simulator.neuronCheckList)
+            if engine is not None:
+                for variable in self.variables:
+                    self.data[variable][row] = \
+                        getattr(engine, variable)[positions]
+            else:
+                for variable in self.variables:
+                    self.data[variable][row] = [getattr(n, variable)
+                                                for n in self.neurons]
+            if "voltage" in self.variables:
+                # a neuron that fired is sampled before its reset, as in
+                # voltageHistory
+                fired = numpy.flatnonzero(
+                    numpy.asarray(firedNeurons, dtype=bool)[positions])
+                if len(fired) and engine is not None:
+                    self.data["voltage"][row, fired] = \
+                        engine.spikeVoltage[positions[fired]]
+                elif len(fired):
+                    self.data["voltage"][row, fired] = [
+                        self.neurons[k].spikeVoltage for k in fired.tolist()]
+            self.numSamples += 1
+
+    def recordSkip(self, simulator, currentTau, numTauSteps):
+        """ called by Simulator before its engine skips numTauSteps silent
+        taus from currentTau on; samples them in closed form
+        """
+        first = -(-currentTau // self.every) * self.every
+        taus = numpy.arange(first, currentTau + numTauSteps, self.every)
+        if len(taus) == 0 or not self.variables:
+            return
+        if self.data is None:
+            self.allocate(currentTau, simulator.finalTau)
+        engine = simulator.engine
+        positions = self.positionsIn(simulator.neuronCheckList)
+        steps = (taus - currentTau + 1)[:, None]
+        values = {}
+        for variable in self.variables:
+            if variable == "voltage":
+                values[variable] = engine.voltage[positions] *\
+                    engine.leakPowers(steps, positions)
+            else:
+                values[variable] = numpy.maximum(
+                    engine.refractCount[positions] - steps, 0)
+        start = 0
+        while start < len(taus):
+            if self.numSamples == len(self.times):
+                self._makeRoom()
+            stop = min(len(taus), start + len(self.times) - self.numSamples)
+            rows = slice(self.numSamples, self.numSamples + stop - start)
+            self.times[rows] = taus[start:stop]
+            for variable in self.variables:
+                self.data[variable][rows] = values[variable][start:stop]
+            self.numSamples += stop - start
+            start = stop
+
+    def _makeRoom(self):
+        """ called when the sample buffers are full """
+        self._grow()
+
+    def flush(self):
+        """ called by Simulator when a simulation loop ends """
+        pass
+
+    def _addSpikes(self, currentTau, positions):
+        end = self.numSpikes + len(positions)
+        if end > len(self.spikeTaus):
+            capacity = max(2 * len(self.spikeTaus), end)
+            self.spikeTaus = numpy.resize(self.spikeTaus, capacity)
+            self.spikeNeurons = numpy.resize(self.spikeNeurons, capacity)
+        self.spikeTaus[self.numSpikes:end] = currentTau
+        self.spikeNeurons[self.numSpikes:end] = positions
+        self.numSpikes = end
+
+    def sampleTimes(self):
+        """ returns the tau of every sample taken """
+        if self.times is None:
+            return numpy.empty(0, dtype=numpy.int64)
+        return self.times[:self.numSamples]
+
+    def samples(self, variable="voltage"):
+        """ returns an array of shape (numSamples, len(neurons)) """
+        if self.data is None:
+            return numpy.empty((0, len(self.neurons)))
+        return self.data[variable][:self.numSamples]
+
+    def spikes(self):
+        """ returns (taus, positions) of every spike kept, in time order """
+        return (self.spikeTaus[:self.numSpikes],
+                self.spikeNeurons[:self.numSpikes])
+
+    def positionOf(self, aNeuron):
+        """ returns the position of aNeuron in "neurons" """
+        return self.neurons.index(aNeuron)
+
+    def samplesOf(self, aNeuron, variable="voltage"):
+        """ returns the samples of one variable of aNeuron """
+        return self.samples(variable)[:, self.positionOf(aNeuron)]
+
+    def spikeTimes(self, aNeuron):
+        """ returns the array of taus at which aNeuron fired """
+        taus, positions = self.spikes()
+        return taus[positions == self.positionOf(aNeuron)]
+
+
+class StreamingRecorder(Recorder):
+    """ Class Invariant:
+    Inherits Recorder; the buffers only hold what has not been flushed yet.
+    "path": directory holding the chunk files and index.json.
+    "chunkSize": number of samples per chunk file.
+    "spikeChunkSize": number of spikes per spike chunk file.
+    "index": the content of index.json: the neuron names, the variables,
+        "every", and the lists of sample and spike chunks written so far.
+    """
+
+    def __init__(self, path, neurons, variables=("voltage",), every=1,
+                 recordSpikes=True, chunkSize=4096, spikeChunkSize=1 << 20):
+        """ Precondition:
+        "path": directory to write to; it is created if needed, and the
+            index.json of any previous recording in it is overwritten.
+        "chunkSize", "spikeChunkSize": positive integers bounding the
+            samples and spikes held in memory.
+        see Recorder for the other arguments
+        """
+        super(StreamingRecorder, self).__init__(neurons, variables, every,
+                                                recordSpikes)
+        self.path = path
+        self.chunkSize = int(chunkSize)
+        self.spikeChunkSize = int(spikeChunkSize)
+        os.makedirs(path, exist_ok=True)
+        self.index = {"neurons": [n.name for n in self.neurons],
+                      "variables": list(self.variables), "every": self.every,
+                      "sampleChunks": [], "spikeChunks": []}
+        self._writeIndex()
+
+    def allocate(self, startTau, finalTau):
+        self.times = numpy.empty(self.chunkSize, dtype=numpy.int64)
+        self.data = dict((variable, numpy.empty((self.chunkSize,
+                                                 len(self.neurons))))
+                         for variable in self.variables)
+        self.numSamples = 0
+
+    def _makeRoom(self):
+        self._flushSamples()
+
+    def _addSpikes(self, currentTau, positions):
+        super(StreamingRecorder, self)._addSpikes(currentTau, positions)
+        if self.numSpikes >= self.spikeChunkSize:
+            self._flushSpikes()
+
+    def _flushSamples(self):
+        if self.numSamples == 0:
+            return
+        k = len(self.index["sampleChunks"])
+        chunk = {"times": "times_%05d.npy" % k, "rows": self.numSamples,
+                 "firstTau": int(self.times[0]),
+                 "lastTau": int(self.times[self.numSamples - 1])}
+        numpy.save(os.path.join(self.path, chunk["times"]),
+                   self.times[:self.numSamples])
+        for variable in self.variables:
+            chunk[variable] = "%s_%05d.npy" % (variable, k)
+            numpy.save(os.path.join(self.path, chunk[variable]),
+                       self.data[variable][:self.numSamples])
+        self.index["sampleChunks"].append(chunk)
+        self.numSamples = 0
+        self._writeIndex()
+
+    def _flushSpikes(self):
+        if self.numSpikes == 0:
+            return
+        k = len(self.index["spikeChunks"])
+        chunk = {"spikes": "spikes_%05d.npy" % k, "count": self.numSpikes}
+        numpy.save(os.path.join(self.path, chunk["spikes"]),
+                   numpy.stack(self.spikes()))
+        self.index["spikeChunks"].append(chunk)
+        self.numSpikes = 0
+        self._writeIndex()
+
+    def _writeIndex(self):
+        temporary = os.path.join(self.path, "index.json.tmp")
+        with open(temporary, "w") as f:
+            json.dump(self.index, f)
+        os.replace(temporary, os.path.join(self.path, "index.json"))
+
+    def flush(self):
+        """ writes everything still buffered to disk """
+        self._flushSamples()
+        self._flushSpikes()
+
+    def reader(self):
+        """ flushes and returns a RecordingReader over the recording """
+        self.flush()
+        return RecordingReader(self.path)
+
+
+class RecordingReader(object):
+    """ Class Invariant:
+    Reads a directory written by a StreamingRecorder. Chunks are opened as
+    memory maps, so only the parts that are used are read from disk.
+    Neurons are looked up by name, or by position in "names".
+    "path": the directory.
+    "names": list of the names of the recorded neurons.
+    "variables", "every": as given to the StreamingRecorder.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.names = self.index["neurons"]
+        self.variables = tuple(self.index["variables"])
+        self.every = self.index["every"]
+        self._positions = dict((name, i) for i, name in enumerate(self.names))
+
+    def _load(self, filename):
+        return numpy.load(os.path.join(self.path, filename), mmap_mode="r")
+
+    def positionOf(self, aNeuron):
+        """ returns the position of aNeuron, given as a Neuron or a
+        position
+        """
+        if isinstance(aNeuron, (int, numpy.integer)):
+            return int(aNeuron)
+        return self._positions[aNeuron.name]
+
+    def sampleTimes(self):
+        return numpy.concatenate([self._load(c["times"])
+                                  for c in self.index["sampleChunks"]] +
+                                 [numpy.empty(0, dtype=numpy.int64)])
+
+    def sampleChunks(self, variable="voltage"):
+        """ yields (times, samples) memory maps, one pair per chunk """
+        for chunk in self.index["sampleChunks"]:
+            yield self._load(chunk["times"]), self._load(chunk[variable])
+
+    def samples(self, variable="voltage"):
+        """ returns all the samples of a variable; this reads them all """
+        return numpy.concatenate([s for t, s in self.sampleChunks(variable)] +
+                                 [numpy.empty((0, len(self.names)))])
+
+    def samplesOf(self, aNeuron, variable="voltage"):
+        """ returns the samples of one variable of aNeuron, reading only its
+        column from each chunk
+        """
+        p = self.positionOf(aNeuron)
+        return numpy.concatenate([s[:, p] for t, s in
+                                  self.sampleChunks(variable)] +
+                                 [numpy.empty(0)])
+
+    def spikes(self):
+        """ returns (taus, positions) of every recorded spike, in time
+        order
+        """
+        chunks = [self._load(c["spikes"]) for c in self.index["spikeChunks"]]
+        if not chunks:
+            return (numpy.empty(0, dtype=numpy.int64),
+                    numpy.empty(0, dtype=numpy.intp))
+        spikes = numpy.concatenate(chunks, axis=1)
+        return spikes[0], spikes[1]
+
+    def spikeTimes(self, aNeuron):
+        """ returns the array of taus at which aNeuron fired """
+        p = self.positionOf(aNeuron)
+        taus = [c[0][c[1] == p] for c in
+                (self._load(c["spikes"]) for c in self.index["spikeChunks"])]
+        return numpy.concatenate(taus + [numpy.empty(0, dtype=numpy.int64)])
@@ -0,0 +1,353 @@
+"""Live rendering of a running simulation.
+
+The simulation runs at its own pace in a background thread and publishes the
+neurons that fire at every tau to a FrameBuffer. The renderer, in the
+calling thread (Tk must only be used from the thread that created it), takes
+at most fps frames per second from the buffer: each frame shows every neuron
+that fired since the previous one, so frames that could not be drawn in time
+are merged rather than queued, and no spike is lost from the display.
+
+Without a display, a FrameQueue hands every frame over in order instead, and
+a FrameRasterizer draws them with numpy into RGB arrays that a PngWriter
+saves as a PNG sequence or an FfmpegWriter pipes to a local ffmpeg encoder.
+"""
+import queue
+import subprocess
+import threading
+import time
+
+import numpy
+
+
+class FrameBuffer(object):
+    """ Class Invariant:
+    Hands the spikes of a simulation over from the thread that runs it to
+    the thread that renders it.
+    "fired": boolean array; fired[i] is True if neuron i fired since the
+        last frame was taken.
+    "tau": the last tau published, or None if nothing was published since
+        the last frame was taken.
+    "finished": True once the simulation has ended.
+    "numPublished", "numTaken": number of taus published and of frames
+        taken; their difference is the number of taus merged into frames.
+    """
+
+    def __init__(self, numNeurons):
+        self.fired = numpy.zeros(numNeurons, dtype=bool)
+        self.tau = None
+        self.finished = False
+        self.numPublished = 0
+        self.numTaken = 0
+        self._lock = threading.Lock()
+
+    def publish(self, currentTau, firedNeurons):
+        """ Precondition:
+        "firedNeurons": sequence of booleans aligned with the neurons, as
+            returned by Simulator.runOneTimeStep.
+        """
+        with self._lock:
+            self.fired |= numpy.asarray(firedNeurons, dtype=bool)
+            self.tau = currentTau
+            self.numPublished += 1
+
+    def finish(self):
+        with self._lock:
+            self.finished = True
+
+    def take(self):
+        """ returns (tau, fired) for a new frame, fired being the neurons
+        that fired since the last frame, or None if no tau was published
+        since then
+        """
+        with self._lock:
+            if self.tau is None:
+                return None
+            frame = (self.tau, self.fired.copy())
+            self.fired[:] = False
+            self.tau = None
+            self.numTaken += 1
+            return frame
+
+
+def runRendered(simulate, frames, draw, fps=30, isOpen=None, stop=None,
+                idle=None):
+    """ Precondition:
+    "simulate": callable running the whole simulation and publishing every
+        tau to frames; it is called in a new thread.
+    "frames": the FrameBuffer simulate publishes to; it is finished when
+        simulate returns.
+    "draw": callable given (tau, fired) of each frame to show.
+    "fps": the most frames drawn per second.
+    "isOpen": callable returning False once the display was closed, after
+        which nothing more is drawn, or None.
+    "stop": callable called once when the display is closed, which must
+        make simulate return soon, or None.
+    "idle": callable called up to fps times per second when there is no
+        new frame to draw, so that the display keeps handling its events
+        (and isOpen sees it closed) while nothing is published, or None.
+    renders the frames of simulate while it runs and returns when it has
+    ended and its last frame was drawn; an exception raised by simulate is
+    raised again here
+    """
+    errors = []
+
+    def run():
+        try:
+            simulate()
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            frames.finish()
+
+    thread = threading.Thread(target=run, name="simulation", daemon=True)
+    thread.start()
+    period = 1.0 / fps
+    nextFrame = time.monotonic()
+    closed = False
+    while True:
+        finished = frames.finished
+        if not closed and isOpen is not None and not isOpen():
+            closed = True
+            if stop is not None:
+                stop()
+        if not closed:
+            frame = frames.take()
+            if frame is not None:
+                draw(*frame)
+            elif idle is not None:
+                idle()
+        if finished:
+            break
+        nextFrame = max(nextFrame + period, time.monotonic())
+        time.sleep(max(0, nextFrame - time.monotonic()))
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+class FrameQueue(object):
+    """ Class Invariant:
+    Hands the spikes of a simulation over to a renderer that must not drop
+    frames, such as a video writer: frame k shows the neurons that fired in
+    the taus startTau + k * ticksPerFrame <= tau < startTau + (k + 1) *
+    ticksPerFrame, whether or not they were simulated (event-driven runs
+    skip taus). The simulation waits when maxFrames frames are queued.
+    "fired": boolean array of the neurons that fired in the current frame.
+    "frame": index of the current frame.
+    "numFrames": number of frames from startTau to finalTau.
+    "finished": True once the simulation has ended.
+    """
+
+    def __init__(self, numNeurons, startTau, finalTau, ticksPerFrame=1,
+                 maxFrames=64):
+        self.fired = numpy.zeros(numNeurons, dtype=bool)
+        self.startTau = startTau
+        self.ticksPerFrame = ticksPerFrame
+        self.frame = 0
+        self.numFrames = -(-(finalTau - startTau) // ticksPerFrame)
+        self.finished = False
+        self._queue = queue.Queue(maxFrames)
+
+    def _advanceTo(self, frame):
+        while self.frame < frame:
+            self._queue.put((self.startTau + self.frame * self.ticksPerFrame,
+                             self.fired))
+            self.fired = numpy.zeros(len(self.fired), dtype=bool)
+            self.frame += 1
+
+    def publish(self, currentTau, firedNeurons):
+        """ see FrameBuffer.publish """
+        self._advanceTo((currentTau - self.startTau) // self.ticksPerFrame)
+        self.fired |= numpy.asarray(firedNeurons, dtype=bool)
+
+    def finish(self):
+        """ queues the frames left up to finalTau, then the end marker """
+        self._advanceTo(self.numFrames)
+        self.finished = True
+        self._queue.put(None)
+
+    def take(self):
+        """ returns (tau, fired) of the next frame, tau being its first tau,
+        waiting for it if need be, or None once every frame was taken
+        """
+        return self._queue.get()
+
+
+def runRecorded(simulate, frames, draw):
+    """ Precondition:
+    "simulate": callable running the whole simulation and publishing every
+        tau to frames; it is called in a new thread.
+    "frames": the FrameQueue simulate publishes to.
+    "draw": callable given (tau, fired) of each frame, in order.
+    draws every frame of simulate while it runs; see runRendered
+    """
+    errors = []
+
+    def run():
+        try:
+            simulate()
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            frames.finish()
+
+    thread = threading.Thread(target=run, name="simulation", daemon=True)
+    thread.start()
+    try:
+        frame = frames.take()
+        while frame is not None:
+            draw(*frame)
+            frame = frames.take()
+    finally:
+        if thread.is_alive():
+            # let the simulation run to its end instead of blocking it
+            while frames.take() is not None:
+                pass
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+# the RGB of the Tk colors GraphicSimulator draws with
+COLORS = {"white": (255, 255, 255), "black": (0, 0, 0), "red": (255, 0, 0),
+          "green": (0, 128, 0), "blue": (0, 0, 255)}
+
+
+class FrameRasterizer(object):
+    """ Class Invariant:
+    Draws the frames of a network layout into RGB arrays without a display.
+    "background": array of shape (height, width, 3), the image of the
+        synapse lines, drawn once.
+    "label": int array of shape (height, width); label[y, x] is the index of
+        the neuron whose circle shows at pixel (x, y), or -1. As on the
+        canvas of GraphicSimulator, lines are drawn over the circles.
+    "colors": array of shape (2, 3), the RGB of a resting and a firing
+        neuron.
+    """
+
+    def __init__(self, width, height, centers, radii, lines=(),
+                 lineColors=(), background="white", resting="black",
+                 firing="red", indices=None):
+        """ Precondition:
+        "centers": array of shape (numCircles, 2) of circle centers in
+            pixels.
+        "radii": array of numCircles circle radii in pixels.
+        "indices": array of the index of the neuron of each circle in the
+            fired arrays given to render; by default circle k shows neuron k.
+        "lines": array of shape (numLines, 4) of line ends x1, y1, x2, y2.
+        "lineColors": one color name of COLORS per line.
+        """
+        self.background = numpy.empty((height, width, 3), dtype=numpy.uint8)
+        self.background[:] = COLORS[background]
+        self.label = numpy.full((height, width), -1, dtype=numpy.int32)
+        centers = numpy.rint(numpy.asarray(centers, dtype=float)).astype(int)
+        radii = numpy.asarray(radii)
+        for radius in numpy.unique(radii).tolist():
+            r = int(numpy.ceil(radius))
+            dy, dx = numpy.mgrid[-r:r + 1, -r:r + 1]
+            inside = dx ** 2 + dy ** 2 <= radius ** 2
+            neurons = numpy.flatnonzero(radii == radius)
+            x = (centers[neurons, 0][:, None] + dx[inside]).ravel()
+            y = (centers[neurons, 1][:, None] + dy[inside]).ravel()
+            index = numpy.repeat(neurons, inside.sum())
+            keep = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            # later circles are drawn over earlier ones, as on a canvas
+            numpy.maximum.at(self.label, (y[keep], x[keep]), index[keep])
+        lines = numpy.asarray(lines, dtype=float).reshape(-1, 4)
+        for color in sorted(set(lineColors)):
+            mine = numpy.array([c == color for c in lineColors], dtype=bool)
+            x, y = _linePixels(lines[mine])
+            keep = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            self.background[y[keep], x[keep]] = COLORS[color]
+            self.label[y[keep], x[keep]] = -1
+        if indices is not None:
+            covered = self.label >= 0
+            self.label[covered] = numpy.asarray(indices)[self.label[covered]]
+        self._covered = numpy.nonzero(self.label >= 0)
+        self._coveredLabel = self.label[self._covered]
+        self.colors = numpy.array([COLORS[resting], COLORS[firing]],
+                                  dtype=numpy.uint8)
+
+    def render(self, fired):
+        """ returns the RGB frame, of shape (height, width, 3), showing the
+        neurons of the boolean array fired as firing
+        """
+        frame = self.background.copy()
+        frame[self._covered] = self.colors[
+            numpy.asarray(fired, dtype=numpy.intp)[self._coveredLabel]]
+        return frame
+
+
+def _linePixels(lines):
+    """ returns the (x, y) pixel arrays of the segments of lines, sampled
+    at least once per pixel along their longer axis
+    """
+    if not len(lines):
+        return numpy.empty(0, dtype=int), numpy.empty(0, dtype=int)
+    x1, y1, x2, y2 = lines.T
+    steps = numpy.maximum(numpy.abs(x2 - x1), numpy.abs(y2 - y1))
+    steps = numpy.ceil(steps).astype(int) + 1
+    line = numpy.repeat(numpy.arange(len(lines)), steps)
+    # position of each sample along its line, from 0 to 1
+    offsets = numpy.arange(len(line)) - numpy.repeat(numpy.cumsum(steps) -
+                                                     steps, steps)
+    t = offsets / numpy.maximum(steps[line] - 1, 1)
+    x = numpy.rint(x1[line] + t * (x2 - x1)[line]).astype(int)
+    y = numpy.rint(y1[line] + t * (y2 - y1)[line]).astype(int)
+    return x, y
+
+
+class PngWriter(object):
+    """ Class Invariant:
+    Writes frames as a PNG sequence with Pillow.
+    "pattern": file name of frame k, as pattern % k, e.g. "frame%06d.png".
+    "numWritten": number of frames written.
+    """
+
+    def __init__(self, pattern):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise ImportError("PngWriter needs Pillow (pip install Pillow)")
+        self._image = Image
+        self.pattern = pattern
+        self.numWritten = 0
+
+    def write(self, frame):
+        self._image.fromarray(frame).save(self.pattern % self.numWritten)
+        self.numWritten += 1
+
+    def close(self):
+        pass
+
+
+class FfmpegWriter(object):
+    """ Class Invariant:
+    Pipes raw RGB frames into an ffmpeg process that encodes them to "path".
+    "numWritten": number of frames written.
+    """
+
+    def __init__(self, path, width, height, fps=30, ffmpeg="ffmpeg",
+                 options=("-pix_fmt", "yuv420p")):
+        """ Precondition:
+        "options": output options given to ffmpeg before path.
+        """
+        self.path = path
+        self.numWritten = 0
+        self.process = subprocess.Popen(
+            [ffmpeg, "-loglevel", "error", "-y", "-f", "rawvideo",
+             "-pix_fmt", "rgb24", "-s", "%dx%d" % (width, height),
+             "-r", str(fps), "-i", "-",
+             # yuv420p needs an even width and height
+             "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"] + list(options) + [path],
+            stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(numpy.ascontiguousarray(frame).tobytes())
+        self.numWritten += 1
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait():
+            raise RuntimeError("ffmpeg failed with code %d" %
+                               self.process.returncode)
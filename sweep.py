@@ -0,0 +1,178 @@
+"""Parameter sweeps over a process pool, with an on-disk result cache.
+
+sweep calls a network builder once for every point of a parameter grid,
+runs the simulators it returns on a concurrent.futures process pool and
+returns one compact summary per run: the spike count, the first spike and
+the firing rate of every checked neuron.
+
+With a cacheDir, every summary is stored under the hash of the network that
+was built and of the options it is run with (see runKey). A run whose key is
+already in the cache is not simulated again, whichever builder and
+parameters produced the network.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import itertools
+import json
+import os
+import re
+
+import numpy
+
+from network import networkArrays
+from recording import Recorder
+
+# bump when the content of a summary changes, so that old entries are ignored
+SUMMARY_VERSION = 1
+
+# the name a Neuron gets when none is given: str of the object, which holds
+# its memory address
+_AUTO_NAME = re.compile(r"<[\w.]+ object at 0x[0-9a-fA-F]+>\Z")
+
+
+def parameterGrid(grid):
+    """ Precondition:
+    "grid": dict mapping each parameter name to a list of values, or a list
+        of dicts that are returned as they are.
+    returns the list of dicts of every combination of the values, the last
+    parameter (in sorted order) varying fastest
+    """
+    if not isinstance(grid, dict):
+        return [dict(params) for params in grid]
+    names = sorted(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def networkDigest(simulator):
+    """ returns the sha256 hex digest of the content of the network of
+    simulator, i.e. of every array saveNetwork would write for it (see
+    network.networkArrays): tau, finalTau, the mode it runs in, the class,
+    name, parameters and state of every neuron, every synapse and store with
+    the neurons it joins, the inputs still to come and the input in flight.
+    Neurons without a name of their own are known by their position and
+    class only, so that rebuilding them gives the same digest.
+    The engine, if any, is synced first
+    """
+    digest = hashlib.sha256()
+    arrays = networkArrays(simulator)
+    arrays["neuronName"] = numpy.array(
+        ["" if _AUTO_NAME.match(name) else name
+         for name in arrays["neuronName"].tolist()], dtype=str)
+    for name in sorted(arrays):
+        array = numpy.ascontiguousarray(arrays[name])
+        digest.update(json.dumps([name, array.dtype.str,
+                                  array.shape]).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _plain(value):
+    """ json default: numpy scalars and arrays as numbers and lists, so that
+    they hash like the Python numbers they stand for; anything else by repr
+    """
+    if isinstance(value, (numpy.generic, numpy.ndarray)):
+        return value.tolist()
+    return repr(value)
+
+
+def runKey(simulator, options):
+    """ returns the cache key of running simulator with the dict of
+    options given to its main
+    """
+    digest = hashlib.sha256()
+    digest.update(networkDigest(simulator).encode())
+    digest.update(json.dumps(options, sort_keys=True, default=_plain).encode())
+    digest.update(str(SUMMARY_VERSION).encode())
+    return digest.hexdigest()
+
+
+def summarize(simulator, recorder):
+    """ Precondition:
+    "recorder": a Recorder of simulator.neuronCheckList, in order, that kept
+        the spikes of the run.
+    returns a dict with, for every checked neuron in order, its "names",
+    "spikeCounts", "firstSpikes" (tau of its first spike, or None) and
+    "rates" (spikes per unit of time, i.e. per finalTau * tau)
+    """
+    taus, positions = recorder.spikes()
+    numNeurons = len(recorder.neurons)
+    counts = numpy.bincount(positions, minlength=numNeurons)
+    first = numpy.full(numNeurons, -1, dtype=numpy.int64)
+    # spikes are in time order, so the last write of each position is the
+    # first spike when the arrays are reversed
+    first[positions[::-1]] = taus[::-1]
+    duration = simulator.finalTau * simulator.tau
+    return {"names": [n.name for n in recorder.neurons],
+            "spikeCounts": counts.tolist(),
+            "firstSpikes": [None if t < 0 else t for t in first.tolist()],
+            "rates": (counts / duration if duration else
+                      numpy.zeros(numNeurons)).tolist(),
+            "finalTau": simulator.finalTau,
+            "tau": simulator.tau}
+
+
+def _cachePath(cacheDir, key):
+    return os.path.join(cacheDir, key[:2], key + ".json")
+
+
+def runOne(build, params, cacheDir=None, eventDriven=False):
+    """ Precondition:
+    "build": callable returning a ready-to-run Simulator when called with
+        the parameters as keyword arguments.
+    "params": dict of parameters for build.
+    "cacheDir": directory of the result cache, or None.
+    "eventDriven": passed to Simulator.main.
+    builds and runs one simulator, or reads its summary from the cache.
+    returns the summary (see summarize), with its "params", its "key" and
+    whether it came "cached"
+    """
+    simulator = build(**params)
+    key = runKey(simulator, {"eventDriven": eventDriven})
+    if cacheDir is not None:
+        path = _cachePath(cacheDir, key)
+        if os.path.exists(path):
+            with open(path) as f:
+                summary = json.load(f)
+            # the cached run may have had other automatic names
+            summary["names"] = [n.name for n in simulator.neuronCheckList]
+            summary["params"] = params
+            summary["cached"] = True
+            return summary
+    recorder = simulator.addRecorder(Recorder(simulator.neuronCheckList,
+                                              variables=()))
+    simulator.main(eventDriven=eventDriven)
+    summary = summarize(simulator, recorder)
+    summary["params"] = params
+    summary["key"] = key
+    if cacheDir is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = path + ".%d.tmp" % os.getpid()
+        with open(temporary, "w") as f:
+            json.dump(summary, f, default=_plain)
+        os.replace(temporary, path)
+    summary["cached"] = False
+    return summary
+
+
+def sweep(build, grid, cacheDir=None, workers=None, eventDriven=False):
+    """ Precondition:
+    "build": callable returning a ready-to-run Simulator when called with
+        the parameters of one run as keyword arguments; with more than one
+        worker it must be picklable, i.e. defined at module level.
+    "grid": the parameter grid, see parameterGrid.
+    "cacheDir": directory of the result cache, or None for no cache.
+    "workers": number of worker processes; None uses one per CPU, and 1
+        runs everything in this process.
+    "eventDriven": passed to Simulator.main.
+    returns the list of summaries (see runOne), in the order of
+    parameterGrid(grid)
+    """
+    runs = parameterGrid(grid)
+    if workers == 1:
+        return [runOne(build, params, cacheDir, eventDriven)
+                for params in runs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(runOne, build, params, cacheDir, eventDriven)
+                   for params in runs]
+        return [future.result() for future in futures]
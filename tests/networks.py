@@ -0,0 +1,60 @@
+"""Seeded random networks shared by the tests."""
+import numpy
+
+from engine import Connectivity
+from Neuron import LIFNeuron, MCPNeuron, Neuron, Simulator, Synapse
+
+
+def randomNetwork(seed, vectorized=False, store=False, finalTau=80,
+                  numNeurons=30, numSynapses=200, numInputs=120,
+                  recordHistory=True):
+    """ returns (simulator, neurons): a mix of Neuron, LIFNeuron and
+    MCPNeuron instances joined by random synapses of delay 1 to 4, as
+    Synapse objects or, with store, as one Connectivity, and random inputs
+    """
+    rng = numpy.random.default_rng(seed)
+    simulator = Simulator(finalT=finalTau, vectorized=vectorized,
+                          recordHistory=recordHistory)
+    neurons = []
+    for i in range(numNeurons):
+        threshold = float(rng.uniform(0.5, 2))
+        refractory = int(rng.integers(1, 4))
+        name = "N%d" % i
+        if i % 3 == 0:
+            neuron = Neuron(athreshold=threshold, arefractory=refractory,
+                            aname=name)
+        elif i % 3 == 1:
+            neuron = LIFNeuron(athreshold=threshold, arefractory=refractory,
+                               adecay=float(rng.uniform(1.5, 10)), aname=name)
+        else:
+            neuron = MCPNeuron(athreshold=threshold, arefractory=refractory,
+                               aname=name)
+        neurons.append(neuron)
+        simulator.addNeuron(neuron)
+    pre = rng.integers(0, numNeurons, numSynapses)
+    post = rng.integers(0, numNeurons, numSynapses)
+    weight = rng.uniform(-0.6, 1.0, numSynapses)
+    delay = rng.integers(1, 5, numSynapses)
+    if store:
+        connectivity = Connectivity()
+        positions = connectivity.indicesOf(neurons)
+        connectivity.addEdges(positions[pre], positions[post], weight, delay)
+        simulator.addConnectivity(connectivity)
+    else:
+        for i, j, w, d in zip(pre.tolist(), post.tolist(), weight.tolist(),
+                              delay.tolist()):
+            simulator.addSynapse(Synapse(neurons[i], neurons[j], w, d))
+    times = rng.integers(0, finalTau, numInputs)
+    targets = rng.integers(0, numNeurons, numInputs)
+    voltages = rng.uniform(0, 1.5, numInputs)
+    for t, i, v in zip(times.tolist(), targets.tolist(), voltages.tolist()):
+        simulator.appendInput(t, neurons[i], v)
+    return simulator, neurons
+
+
+def spikes(neurons):
+    return [list(n.spikeTimes) for n in neurons]
+
+
+def voltages(neurons):
+    return [list(n.voltageHistory) for n in neurons]
@@ -0,0 +1,88 @@
+import numpy
+import pytest
+
+from analysis import rasterPlot, spikeArrays, spikeMatrix
+from recording import Recorder, StreamingRecorder
+from networks import randomNetwork, spikes
+
+
+def naiveMatrix(spikeLists, numTaus, binSize):
+    """ spikeMatrix of neurons with the given spikeTimes, one spike at a
+    time
+    """
+    matrix = numpy.zeros((len(spikeLists), -(-numTaus // binSize)),
+                         dtype=int)
+    for i, spikeTimes in enumerate(spikeLists):
+        for tau in spikeTimes:
+            if tau < numTaus:
+                matrix[i, tau // binSize] += 1
+    return matrix
+
+
+def test_spike_matrix_of_spike_times():
+    simulator, neurons = randomNetwork(0)
+    simulator.main()
+    last = max(max(n.spikeTimes, default=0) for n in neurons)
+    assert spikeMatrix(neurons).shape == (len(neurons), last + 1)
+    assert numpy.array_equal(spikeMatrix(neurons),
+                             naiveMatrix(spikes(neurons), last + 1, 1))
+    for numTaus in (1, 37, 80, 100):
+        for binSize in (1, 3, 7, 80):
+            assert numpy.array_equal(
+                spikeMatrix(neurons, numTaus, binSize=binSize),
+                naiveMatrix(spikes(neurons), numTaus, binSize))
+    chosen = neurons[5:0:-2]
+    assert numpy.array_equal(spikeMatrix(chosen, 80, binSize=4),
+                             naiveMatrix(spikes(chosen), 80, 4))
+    assert spikeMatrix([], 10).shape == (0, 10)
+
+
+def test_spike_arrays_of_recordings(tmp_path):
+    simulator, neurons = randomNetwork(1)
+    recorded = neurons[::2]
+    recorder = simulator.addRecorder(Recorder(recorded, variables=()))
+    streaming = simulator.addRecorder(StreamingRecorder(
+        str(tmp_path / "recording"), recorded, variables=(),
+        spikeChunkSize=16))
+    simulator.main()
+    reader = streaming.reader()
+    chosen = neurons[:10]
+    # the neurons that were not recorded have no spikes
+    expected = naiveMatrix([n.spikeTimes if n in recorded else []
+                            for n in chosen], 80, 5)
+    for source in (recorder, reader):
+        assert numpy.array_equal(spikeMatrix(chosen, 80, source, 5),
+                                 expected)
+        taus, rows = spikeArrays(chosen, source)
+        assert taus.dtype == rows.dtype == numpy.int64
+        assert sorted(zip(taus.tolist(), rows.tolist())) == \
+            sorted((t, i) for i, n in enumerate(chosen) if n in recorded
+                   for t in n.spikeTimes)
+
+
+def test_sparse_spike_matrix():
+    pytest.importorskip("scipy.sparse")
+    simulator, neurons = randomNetwork(2)
+    simulator.main()
+    for binSize in (1, 6):
+        matrix = spikeMatrix(neurons, 80, binSize=binSize, sparse=True)
+        assert numpy.array_equal(matrix.toarray(),
+                                 naiveMatrix(spikes(neurons), 80, binSize))
+
+
+def test_raster_plot_points_and_image():
+    matplotlib = pytest.importorskip("matplotlib")
+    matplotlib.use("Agg")
+    import matplotlib.pyplot
+    simulator, neurons = randomNetwork(3)
+    simulator.main()
+    numSpikes = sum(len(n.spikeTimes) for n in neurons)
+    figure, ax = matplotlib.pyplot.subplots()
+    rasterPlot(neurons, 80, ax=ax)
+    points = ax.lines[0].get_xydata()
+    assert len(points) == numSpikes and not ax.images
+    figure, ax = matplotlib.pyplot.subplots()
+    rasterPlot(neurons, 80, ax=ax, maxPoints=numSpikes - 1)
+    assert not ax.lines and len(ax.images) == 1
+    assert ax.images[0].get_array().sum() == numSpikes
+    matplotlib.pyplot.close("all")
@@ -0,0 +1,31 @@
+import json
+
+import benchmark
+
+
+def test_every_case_runs_in_every_mode():
+    for case in benchmark.CASES:
+        results = [benchmark.benchmark(case, 30, mode, finalTau=50,
+                                       memory=False)
+                   for mode in benchmark.MODES]
+        for result in results:
+            assert result["case"] == case and result["finalTau"] == 50
+            assert result["neurons"] == 30
+            assert result["synapses"] > 0
+            assert result["ticksPerSecond"] > 0
+            assert result["peakMemoryBytes"] is None
+        # the three modes simulate the same network
+        assert len(set(r["synapses"] for r in results)) == 1
+        assert len(set(r["spikes"] for r in results)) == 1
+        assert results[0]["spikes"] > 0
+
+
+def test_script_writes_json(tmp_path):
+    path = str(tmp_path / "results.json")
+    benchmark.main(["--cases", "sparse", "--sizes", "20", "--taus", "20",
+                    "--output", path])
+    with open(path) as f:
+        report = json.load(f)
+    assert [(r["case"], r["size"], r["mode"]) for r in report["results"]] \
+        == [("sparse", 20, mode) for mode in benchmark.MODES]
+    assert all(r["peakMemoryBytes"] > 0 for r in report["results"])
@@ -0,0 +1,112 @@
+import numpy
+
+import Neuron
+from engine import Connectivity
+from Neuron import Synapse, _samplePairs
+
+# on either side of SPARSE_PROBABILITY, and far from it
+PROBABILITIES = (0.002, 0.01, Neuron.SPARSE_PROBABILITY * 0.98,
+                 Neuron.SPARSE_PROBABILITY, 0.3, 0.9)
+
+
+def assertValidPairs(i, j, numA, numB):
+    assert i.dtype == j.dtype == numpy.int32
+    assert numpy.all((i >= 0) & (i < numA) & (j >= 0) & (j < numB))
+    flat = i.astype(numpy.int64) * numB + j
+    # row-major order, and no pair twice
+    assert numpy.all(numpy.diff(flat) > 0)
+
+
+def test_sample_pairs_density_and_order():
+    numA, numB = 400, 500
+    for probability in PROBABILITIES:
+        i, j = _samplePairs(numpy.random.default_rng(1), numA, numB,
+                            probability)
+        assertValidPairs(i, j, numA, numB)
+        expected = numA * numB * probability
+        spread = (expected * (1 - probability)) ** 0.5
+        assert abs(len(i) - expected) < 5 * spread
+
+
+def test_sample_pairs_edge_probabilities():
+    i, j = _samplePairs(None, 3, 4, 1)
+    assert list(zip(i.tolist(), j.tolist())) == \
+        [(a, b) for a in range(3) for b in range(4)]
+    for probability in (0, -1):
+        i, j = _samplePairs(numpy.random.default_rng(0), 3, 4, probability)
+        assert len(i) == len(j) == 0
+    i, j = _samplePairs(numpy.random.default_rng(0), 0, 4, 0.5)
+    assert len(i) == 0
+
+
+def test_sample_pairs_is_reproducible():
+    for probability in PROBABILITIES:
+        first = _samplePairs(numpy.random.default_rng(7), 300, 200,
+                             probability)
+        again = _samplePairs(numpy.random.default_rng(7), 300, 200,
+                             probability)
+        other = _samplePairs(numpy.random.default_rng(8), 300, 200,
+                             probability)
+        assert all(numpy.array_equal(a, b) for a, b in zip(first, again))
+        assert not all(numpy.array_equal(a, b) for a, b in zip(first, other))
+
+
+def test_sample_pairs_in_small_blocks(monkeypatch):
+    dense = _samplePairs(numpy.random.default_rng(3), 300, 200, 0.3)
+    monkeypatch.setattr(Neuron, "PAIR_BLOCK", 1000)
+    # rows are drawn in the same order whatever the block size
+    blocked = _samplePairs(numpy.random.default_rng(3), 300, 200, 0.3)
+    assert all(numpy.array_equal(a, b) for a, b in zip(dense, blocked))
+    for probability in (0.002, 0.01, 0.049):
+        i, j = _samplePairs(numpy.random.default_rng(3), 300, 200,
+                            probability)
+        assertValidPairs(i, j, 300, 200)
+        assert abs(len(i) - 60000 * probability) < \
+            5 * (60000 * probability) ** 0.5
+
+
+def edges(connected, Alist, Blist):
+    """ returns the (pre, post, weight) of Synapse objects or a store, as
+    positions in Alist and Blist
+    """
+    if isinstance(connected, Connectivity):
+        return [(Alist.index(connected.neurons[a]),
+                 Blist.index(connected.neurons[b]), w)
+                for a, b, w in zip(connected.pre.tolist(),
+                                   connected.post.tolist(),
+                                   connected.weight.tolist())]
+    return [(Alist.index(s.pre), Blist.index(s.post), s.weight)
+            for s in connected]
+
+
+def test_random_connections_from_a_generator():
+    Alist = [Neuron.Neuron(aname="a%d" % k) for k in range(30)]
+    Blist = [Neuron.Neuron(aname="b%d" % k) for k in range(40)]
+    calls = [(Synapse.randomConnect, dict(weight=0.5)),
+             (Synapse.randomConnect, dict(weight=0.5, probability=0.01)),
+             (Synapse.randomWeightConnect, dict()),
+             (Synapse.randomWeightRandomConnect, dict()),
+             (Synapse.randomWeightRandomConnect, dict(probability=0.01))]
+    for method, options in calls:
+        synapses = method(Alist, Blist, rng=numpy.random.default_rng(5),
+                          **options)
+        again = method(Alist, Blist, rng=numpy.random.default_rng(5),
+                       **options)
+        store = method(Alist, Blist, store=Connectivity(),
+                       rng=numpy.random.default_rng(5), **options)
+        found = edges(synapses, Alist, Blist)
+        assert found == edges(again, Alist, Blist)
+        assert found == edges(store, Alist, Blist)
+        pairs = [(a, b) for a, b, w in found]
+        assert pairs == sorted(set(pairs))
+        weights = numpy.array([w for a, b, w in found])
+        if method.__name__ == "randomConnect":
+            assert numpy.all(weights == 0.5)
+        else:
+            assert numpy.all((weights >= -1) & (weights < 1))
+        if method.__name__ == "randomWeightConnect":
+            assert len(found) == len(Alist) * len(Blist)
+        else:
+            probability = options.get("probability", 0.5)
+            assert abs(len(found) - 1200 * probability) < \
+                5 * (1200 * probability) ** 0.5
@@ -0,0 +1,109 @@
+import numpy
+
+import engine
+from engine import DelayRing
+from Neuron import LIFNeuron, Neuron, Simulator, Synapse
+from networks import randomNetwork, spikes, voltages
+
+
+def converging(vectorized):
+    """ a and b reach c in the same tau with weights that only add up to
+    its threshold when they are added to c's input one after the other
+    """
+    simulator = Simulator(finalT=5, vectorized=vectorized)
+    a, b, c = Neuron(aname="a"), Neuron(aname="b"), Neuron(aname="c")
+    for neuron in (a, b, c):
+        simulator.addNeuron(neuron)
+    simulator.addSynapse(Synapse(a, c, 0.2, 1))
+    simulator.addSynapse(Synapse(b, c, 0.7, 1))
+    simulator.appendInput(0, a, 1)
+    simulator.appendInput(0, b, 1)
+    simulator.appendInput(1, c, 0.1)
+    return simulator, c
+
+
+def test_arrivals_are_added_one_by_one_after_the_inputs():
+    for vectorized, eventDriven in ((False, False), (True, False),
+                                    (True, True)):
+        simulator, c = converging(vectorized)
+        simulator.main(eventDriven=eventDriven)
+        assert c.spikeTimes == [1]
+        assert c.voltageHistory == [0, 0, 1.0, 0, 0, 0]
+
+
+def test_ring_delivers_in_key_order():
+    ring = DelayRing(3)
+    ring.add(numpy.array([2, 2]), numpy.array([5, 1]), numpy.array([0, 0]),
+             numpy.array([0.7, 0.2]))
+    ring.add(numpy.array([2]), numpy.array([3]), numpy.array([1]),
+             numpy.array([1.0]))
+    taus, keys, posts, weights = ring.pending(0)
+    assert taus.tolist() == [2, 2, 2]
+    assert keys.tolist() == [1, 3, 5]
+    assert ring.nextArrival(1) == 2
+    out = numpy.array([0.1, 0])
+    ring.pop(2, out)
+    assert out.tolist() == [(0.1 + 0.2) + 0.7, 1.0]
+    assert ring.nextArrival(3) is None
+    assert len(ring.pending(2)[0]) == 0
+
+
+def test_leak_powers_of_float_steps():
+    simulator = Simulator(vectorized=True)
+    neuron = LIFNeuron(adecay=4, avoltage=1)
+    simulator.addNeuron(neuron)
+    anEngine = simulator.buildEngine()
+    assert anEngine.leakPowers(3.0).tolist() == [0.75 ** 3]
+    assert anEngine.leakPowers(numpy.array([[1.0], [2.0]])).tolist() == \
+        [[0.75], [0.75 ** 2]]
+    anEngine.skip(0, 2.0)
+    anEngine.sync()
+    assert neuron.voltageHistory == [1, 0.75, 0.75 ** 2]
+
+
+def test_kernel_gives_the_numpy_results(monkeypatch):
+    calls = []
+
+    def counted(*arguments):
+        calls.append(1)
+        return engine._updateNeurons(*arguments)
+
+    for seed in range(3):
+        for options in (dict(vectorized=True), dict(store=True)):
+            monkeypatch.setattr(engine, "kernel", False)
+            simulator, neurons = randomNetwork(seed, **options)
+            simulator.main()
+            expected = spikes(neurons), voltages(neurons)
+            monkeypatch.setattr(engine, "kernel", counted)
+            simulator, neurons = randomNetwork(seed, **options)
+            del calls[:]
+            simulator.main()
+            assert len(calls) == simulator.finalTau
+            assert (spikes(neurons), voltages(neurons)) == expected
+
+
+def test_numba_is_loaded_on_the_first_step(monkeypatch):
+    monkeypatch.setattr(engine, "kernel", None)
+    randomNetwork(0, vectorized=True)
+    assert engine.kernel is None
+    simulator, neurons = randomNetwork(0, vectorized=True)
+    simulator.main()
+    assert engine.kernel is not None
+
+
+def test_decay_changes_only_reach_the_engines_of_the_neuron():
+    simulator = Simulator(vectorized=True)
+    neuron = LIFNeuron(adecay=4, avoltage=1)
+    simulator.addNeuron(neuron)
+    anEngine = simulator.buildEngine()
+    anEngine.leakPowers(3.0)
+    leakTable = anEngine.leakTable
+    LIFNeuron(adecay=2)
+    assert not anEngine.decayStale
+    anEngine.skip(0, 1.0)
+    assert anEngine.leakTable is leakTable
+    neuron.decayConstant = 2
+    assert anEngine.decayStale
+    anEngine.skip(1, 1.0)
+    anEngine.sync()
+    assert neuron.voltageHistory == [1, 0.75, 0.75 * 0.5]
@@ -0,0 +1,178 @@
+"""Every way of running a network gives the spikes and voltages of the
+Neuron and Synapse objects run one tau at a time, except that event-driven
+runs leak in closed form and their voltages may differ by a few ULP (see
+ArrayEngine.skip). Saving and resuming are checked the same way in
+test_network.py.
+"""
+import numpy
+import pytest
+
+from batch import BatchSimulator
+from engine import BandedConnectivity, Connectivity
+from Neuron import MCPNeuron, Neuron, Simulator, Synapse
+from networks import randomNetwork, spikes, voltages
+
+SEEDS = range(4)
+
+
+def objectRun(seed, **options):
+    simulator, neurons = randomNetwork(seed, **options)
+    simulator.main()
+    return spikes(neurons), voltages(neurons)
+
+
+def assertSameRun(seed, networkOptions, runOptions):
+    expected = objectRun(seed)
+    simulator, neurons = randomNetwork(seed, **networkOptions)
+    simulator.main(**runOptions)
+    assert (spikes(neurons), voltages(neurons)) == expected
+
+
+def test_engine():
+    for seed in SEEDS:
+        assertSameRun(seed, dict(vectorized=True), {})
+        assertSameRun(seed, dict(store=True), {})
+
+
+def test_event_driven():
+    # the leak of seeds 16, 18 and 24 rounds differently in closed form
+    for seed in list(SEEDS) + [16, 18, 24]:
+        expectedSpikes, expectedVoltages = objectRun(seed)
+        for options in (dict(vectorized=True), dict(store=True)):
+            simulator, neurons = randomNetwork(seed, **options)
+            simulator.main(eventDriven=True)
+            assert spikes(neurons) == expectedSpikes
+            for history, expected in zip(voltages(neurons),
+                                         expectedVoltages):
+                assert numpy.allclose(history, expected, rtol=1e-12,
+                                      atol=1e-15)
+
+
+def test_partitioned():
+    for seed in SEEDS:
+        assertSameRun(seed, dict(vectorized=True), dict(workers=2))
+        assertSameRun(seed, dict(store=True), dict(workers=3))
+
+
+def test_batch():
+    for seed in SEEDS:
+        expectedSpikes, expectedVoltages = objectRun(seed)
+        simulator, neurons = randomNetwork(seed, vectorized=True)
+        batch = BatchSimulator(simulator, 3)
+        batch.main()
+        for trial in range(3):
+            assert [batch.spikeTimes(n, trial) for n in neurons] == \
+                expectedSpikes
+            # the voltageHistory of a Neuron starts with its initial voltage
+            assert [batch.voltageHistory(n, trial) for n in neurons] == \
+                [history[1:] for history in expectedVoltages]
+
+
+def bandedNetwork(seed, banded):
+    """ returns (simulator, neurons): Neuron and MCPNeuron instances joined
+    by a BandedConnectivity or, if not banded, by the Synapse objects of
+    its edges. The weights and inputs are multiples of 1/8, so that adding
+    them in any order gives the same sums.
+    """
+    rng = numpy.random.default_rng(seed)
+    simulator = Simulator(finalT=60, vectorized=banded)
+    neurons = [(Neuron if i % 2 else MCPNeuron)(
+        athreshold=1, arefractory=int(rng.integers(1, 3)), aname="N%d" % i)
+        for i in range(20)]
+    for neuron in neurons:
+        simulator.addNeuron(neuron)
+    band = BandedConnectivity(neurons, neurons, -2,
+                              [0.25, -0.125, 0.5, 0.375], 2)
+    if banded:
+        simulator.addConnectivity(band)
+    else:
+        pre, post, weight, delay = band.edges()
+        for i, j, w, d in zip(pre.tolist(), post.tolist(), weight.tolist(),
+                              delay.tolist()):
+            simulator.addSynapse(Synapse(band.neurons[i], band.neurons[j],
+                                         w, d))
+    times = rng.integers(0, 60, 80)
+    targets = rng.integers(0, 20, 80)
+    inputs = rng.integers(1, 10, 80) / 8
+    for t, i, v in zip(times.tolist(), targets.tolist(), inputs.tolist()):
+        simulator.appendInput(t, neurons[i], v)
+    return simulator, neurons
+
+
+def test_banded():
+    for seed in SEEDS:
+        simulator, neurons = bandedNetwork(seed, False)
+        simulator.main()
+        expected = spikes(neurons), voltages(neurons)
+        for options in ({}, dict(eventDriven=True), dict(workers=2)):
+            simulator, neurons = bandedNetwork(seed, True)
+            simulator.main(**options)
+            assert (spikes(neurons), voltages(neurons)) == expected
+
+
+def distanceNetwork(seed, form):
+    """ returns (simulator, neurons) of bandedNetwork's neurons and inputs,
+    joined by Synapse.connectWeightedByDistance as Synapse objects, a
+    Connectivity store or a BandedConnectivity, depending on form
+    """
+    rng = numpy.random.default_rng(seed)
+    simulator = Simulator(finalT=60, vectorized=form != "synapses")
+    neurons = [(Neuron if i % 2 else MCPNeuron)(
+        athreshold=1, arefractory=int(rng.integers(1, 3)), aname="N%d" % i)
+        for i in range(20)]
+    for neuron in neurons:
+        simulator.addNeuron(neuron)
+    # weights 0.875, 0.5 and 0.375, which add up exactly in any order
+    options = dict(minWeight=0.125, maxWeight=0.875, spread=2, d=2)
+    if form == "synapses":
+        for synapse in Synapse.connectWeightedByDistance(neurons, neurons,
+                                                         **options):
+            simulator.addSynapse(synapse)
+    elif form == "store":
+        simulator.addConnectivity(Synapse.connectWeightedByDistance(
+            neurons, neurons, store=Connectivity(), **options))
+    else:
+        simulator.addConnectivity(Synapse.connectWeightedByDistance(
+            neurons, neurons, banded=True, **options))
+    times = rng.integers(0, 60, 80)
+    targets = rng.integers(0, 20, 80)
+    inputs = rng.integers(1, 10, 80) / 8
+    for t, i, v in zip(times.tolist(), targets.tolist(), inputs.tolist()):
+        simulator.appendInput(t, neurons[i], v)
+    return simulator, neurons
+
+
+def test_connect_weighted_by_distance_forms():
+    for seed in SEEDS:
+        simulator, neurons = distanceNetwork(seed, "synapses")
+        simulator.main()
+        expected = spikes(neurons), voltages(neurons)
+        assert sum(map(len, expected[0]))
+        for form in ("store", "banded"):
+            simulator, neurons = distanceNetwork(seed, form)
+            simulator.main()
+            assert (spikes(neurons), voltages(neurons)) == expected
+
+
+def test_a_banded_connection_takes_no_store():
+    neurons = [Neuron() for i in range(4)]
+    with pytest.raises(ValueError):
+        Synapse.connectWeightedByDistance(neurons, neurons, spread=1,
+                                          store=Connectivity(), banded=True)
+
+
+def test_runs_on_the_engine_leave_the_mode_alone():
+    for options in (dict(eventDriven=True), dict(workers=2)):
+        expectedSpikes, expectedVoltages = objectRun(0)
+        simulator, neurons = randomNetwork(0)
+        finalTau = simulator.finalTau
+        simulator.finalTau = finalTau // 2
+        simulator.main(**options)
+        assert not simulator.vectorized and simulator.engine is None
+        simulator.finalTau = finalTau
+        simulator.startTau = simulator.nextTau
+        simulator.main()
+        assert simulator.engine is None
+        assert spikes(neurons) == expectedSpikes
+        for history, expected in zip(voltages(neurons), expectedVoltages):
+            assert numpy.allclose(history, expected, rtol=1e-12, atol=1e-15)
@@ -0,0 +1,141 @@
+import csv
+import json
+
+import pytest
+
+import monitor
+from monitor import Profiler, ProgressReporter
+from networks import randomNetwork
+
+
+class Clock(object):
+    """ stands for the time module of monitor """
+
+    def __init__(self):
+        self.now = 0
+
+    def monotonic(self):
+        return self.now
+
+
+def reported(monkeypatch, times, **options):
+    """ returns the taus a ProgressReporter reports when tau k is reached
+    at times[k] seconds
+    """
+    clock = Clock()
+    monkeypatch.setattr(monitor, "time", clock)
+    written = []
+    reporter = ProgressReporter(write=written.append, **options)
+    for tau, now in enumerate(times):
+        clock.now = now
+        reporter.update(tau, len(times))
+    return written
+
+
+def test_progress_is_reported_when_either_limit_is_reached(monkeypatch):
+    # taus 3 to 5 are slow and reach the seconds limit first, the others
+    # are fast and reach the ticks limit first
+    times = [0, 0.1, 0.2, 5, 10, 15, 15.1, 15.2, 15.3, 15.4, 15.5]
+    assert reported(monkeypatch, times, everyTicks=4, everySeconds=4) == \
+        [0, 3, 4, 5, 9]
+    assert reported(monkeypatch, times, everyTicks=4) == [0, 4, 8]
+    assert reported(monkeypatch, times, everySeconds=4) == [0, 3, 4, 5]
+    assert reported(monkeypatch, times[:4]) == [0, 1, 2, 3]
+
+
+def profiledRun(seed, networkOptions, runOptions):
+    """ returns (simulator, neurons) of randomNetwork(seed) run with a
+    Profiler
+    """
+    simulator, neurons = randomNetwork(seed, **networkOptions)
+    simulator.profiler = Profiler()
+    simulator.main(**runOptions)
+    return simulator, neurons
+
+
+def synapseEvents(simulator, neurons, delivered):
+    """ returns the number of synapse activations of the spikes of neurons;
+    if delivered, only of those that arrive before finalTau
+    """
+    count = 0
+    for synapse in simulator.synapseCheckList:
+        for tau in synapse.pre.spikeTimes:
+            if not delivered or tau + synapse.delay < simulator.finalTau:
+                count += 1
+    return count
+
+
+def test_profiler_counts():
+    for seed in range(3):
+        for vectorized in (False, True):
+            simulator, neurons = profiledRun(seed,
+                                             dict(vectorized=vectorized), {})
+            profiler = simulator.profiler
+            numSpikes = sum(len(n.spikeTimes) for n in neurons)
+            assert numSpikes
+            assert profiler.numTaus == len(profiler.series) == 80
+            assert profiler.totals["spikes"] == numSpikes
+            assert profiler.totals["inputs"] == 120
+            # the engine counts the edges of a spike when it schedules
+            # them, which, with a shortest delay of 1, is right away
+            assert profiler.totals["synapseEvents"] == \
+                synapseEvents(simulator, neurons, not vectorized)
+            assert [row[0] for row in profiler.series] == list(range(80))
+            for k, name in enumerate(Profiler.COLUMNS):
+                assert sum(row[k + 1] for row in profiler.series) == \
+                    pytest.approx(profiler.totals[name])
+
+
+def test_profiler_counts_skipped_taus():
+    simulator, neurons = profiledRun(0, dict(vectorized=True, numInputs=10),
+                                     dict(eventDriven=True))
+    profiler = simulator.profiler
+    assert profiler.numTaus == 80
+    assert len(profiler.series) < 80
+    assert profiler.totals["spikes"] == sum(len(n.spikeTimes)
+                                            for n in neurons)
+    assert profiler.totals["inputs"] == 10
+    taus = [row[0] for row in profiler.series] + [80]
+    for row, nextTau in zip(profiler.series, taus[1:]):
+        if row[5] > 0:
+            # a jump over the silent taus up to the next row
+            assert row[1:5] == (0, 0, 0, 0) and row[6:] == (0, 0, 0)
+        else:
+            assert nextTau == row[0] + 1
+    assert any(nextTau > tau + 1 for tau, nextTau in zip(taus, taus[1:]))
+
+
+def test_profiler_output(tmp_path):
+    simulator, neurons = profiledRun(1, dict(), {})
+    profiler = simulator.profiler
+    summary = profiler.summary().splitlines()
+    for name in Profiler.PHASES + Profiler.COUNTERS + ("total", "taus"):
+        assert [line for line in summary if line.split()[:1] == [name]]
+    spikesLine = [line for line in summary if line.startswith("spikes")][0]
+    assert int(spikesLine.split()[1]) == profiler.totals["spikes"]
+    assert summary[-1].split() == ["taus", "80"]
+
+    path = str(tmp_path / "profile.csv")
+    profiler.writeCsv(path)
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    assert tuple(rows[0]) == ("tau",) + Profiler.COLUMNS
+    assert len(rows) == 81
+    assert [int(row[0]) for row in rows[1:]] == list(range(80))
+    assert sum(int(row[-3]) for row in rows[1:]) == profiler.totals["spikes"]
+
+    path = str(tmp_path / "profile.json")
+    profiler.writeJson(path)
+    with open(path) as f:
+        written = json.load(f)
+    assert written["numTaus"] == 80
+    assert written["totals"] == profiler.totals
+    assert written["columns"] == ["tau"] + list(Profiler.COLUMNS)
+    assert len(written["series"]) == 80
+
+
+def test_profiling_is_not_supported_in_partitioned_runs():
+    simulator, neurons = randomNetwork(0, vectorized=True)
+    simulator.profiler = Profiler()
+    with pytest.raises(ValueError):
+        simulator.main(workers=2)
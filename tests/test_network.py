@@ -0,0 +1,71 @@
+import numpy
+
+from network import Checkpointer, loadNetwork, resume, saveNetwork
+from Neuron import Neuron, Simulator
+from networks import randomNetwork, spikes
+
+
+def test_input_times_are_saved_as_ints(tmp_path):
+    path = str(tmp_path / "network.npz")
+    simulator = Simulator(finalT=10)
+    a = Neuron(aname="a")
+    simulator.addNeuron(a)
+    simulator.appendInput(3.0, a, 1)
+    simulator.appendInput(4.5, a, 1)
+    simulator.appendInputs(numpy.array([6.0, 8.0]), [a, a], 1)
+    saveNetwork(simulator, path)
+    with numpy.load(path) as arrays:
+        assert arrays["inputTime"].dtype == numpy.int64
+        assert arrays["inputTime"].tolist() == [3, 6, 8]
+    for synapses in (False, True):
+        loaded = loadNetwork(path, synapses=synapses)
+        assert [type(t) for t, n, v in loaded.inputArray] == [int] * 3
+        loaded.main(eventDriven=True)
+        assert loaded.neuronCheckList[0].spikeTimes == [3, 6, 8]
+
+
+def continued(path, seed, splitTau, loadVectorized, synapses, **options):
+    """ returns the spikes of randomNetwork(seed, **options) run to
+    splitTau, saved to path, loaded into a new Simulator and run to its end
+    """
+    simulator, neurons = randomNetwork(seed, **options)
+    finalTau = simulator.finalTau
+    simulator.finalTau = splitTau
+    simulator.main()
+    saveNetwork(simulator, path)
+    loaded = loadNetwork(path, Simulator(finalT=finalTau,
+                                         vectorized=loadVectorized),
+                         synapses=synapses)
+    loaded.main()
+    return [before + after.spikeTimes for before, after in
+            zip(spikes(neurons), loaded.neuronCheckList)]
+
+
+def test_input_in_flight_survives_a_change_of_mode(tmp_path):
+    path = str(tmp_path / "network.npz")
+    for seed in range(3):
+        simulator, neurons = randomNetwork(seed)
+        simulator.main()
+        expected = spikes(neurons)
+        for vectorized in (False, True):
+            for store in (False, True):
+                for synapses in (False, True):
+                    assert continued(path, seed, 41, vectorized, synapses,
+                                     vectorized=not vectorized,
+                                     store=store) == expected
+
+
+def test_resume_finishes_the_interrupted_run(tmp_path):
+    path = str(tmp_path / "checkpoint.npz")
+    for seed in range(3):
+        for vectorized in (False, True):
+            for eventDriven in (False, True):
+                simulator, neurons = randomNetwork(seed, vectorized=vectorized)
+                checkpointer = Checkpointer(path, everyTicks=41)
+                simulator.checkpointer = checkpointer
+                simulator.main(eventDriven=eventDriven)
+                assert checkpointer.numSaved == 1
+                resumed = resume(path, eventDriven=eventDriven)
+                assert [[t for t in times if t >= checkpointer.lastTau]
+                        for times in spikes(neurons)] == \
+                    [n.spikeTimes for n in resumed.neuronCheckList]
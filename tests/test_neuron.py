@@ -0,0 +1,13 @@
+import pytest
+
+from Neuron import LIFNeuron
+
+
+def test_zero_decay_constant_is_rejected():
+    with pytest.raises(ValueError, match="must not be 0"):
+        LIFNeuron(adecay=0, aname="a")
+    neuron = LIFNeuron(adecay=2, aname="b")
+    with pytest.raises(ValueError, match="decayConstant of b"):
+        neuron.decayConstant = 0
+    assert neuron.decayConstant == 2
+    assert neuron.decayFactor == 0.5
@@ -0,0 +1,112 @@
+import json
+import os
+
+import numpy
+
+from recording import RecordingReader, Recorder, StreamingRecorder
+from networks import randomNetwork, spikes
+
+MODES = ((dict(), dict()), (dict(vectorized=True), dict()),
+         (dict(store=True), dict()),
+         (dict(vectorized=True), dict(eventDriven=True)))
+
+
+def recordedRun(seed, networkOptions, runOptions, every=1, chosen=None,
+                variables=("voltage",)):
+    """ returns (neurons, recorder) of randomNetwork(seed) run with a
+    Recorder of the neurons at the positions chosen, or of all of them
+    """
+    simulator, neurons = randomNetwork(seed, **networkOptions)
+    if chosen is not None:
+        neurons = [neurons[i] for i in chosen]
+    recorder = simulator.addRecorder(Recorder(neurons, variables, every))
+    simulator.main(**runOptions)
+    return neurons, recorder
+
+
+def test_voltages_agree_with_voltage_history():
+    for seed in range(3):
+        for networkOptions, runOptions in MODES:
+            neurons, recorder = recordedRun(seed, networkOptions, runOptions)
+            assert recorder.sampleTimes().tolist() == list(range(80))
+            # voltageHistory starts with the initial voltage
+            assert recorder.samples().T.tolist() == \
+                [n.voltageHistory[1:] for n in neurons]
+            assert [recorder.spikeTimes(n).tolist() for n in neurons] == \
+                spikes(neurons)
+
+
+def test_samples_at_spikes_are_taken_before_the_reset():
+    neurons, recorder = recordedRun(0, dict(), dict())
+    taus, positions = recorder.spikes()
+    assert len(taus)
+    voltages = recorder.samples()[taus, positions]
+    thresholds = numpy.array([neurons[p].threshold for p in positions])
+    assert numpy.all(voltages >= thresholds)
+
+
+def test_every_and_chosen_neurons():
+    chosen = [4, 0, 17]
+    for networkOptions, runOptions in MODES:
+        neurons, recorder = recordedRun(1, networkOptions, runOptions,
+                                        every=7, chosen=chosen,
+                                        variables=("voltage", "refractCount"))
+        assert recorder.neurons == neurons
+        assert recorder.sampleTimes().tolist() == list(range(0, 80, 7))
+        assert recorder.samples().shape == (12, 3)
+        assert recorder.samples().T.tolist() == \
+            [n.voltageHistory[1::7] for n in neurons]
+        assert recorder.samples("refractCount").shape == (12, 3)
+        assert [recorder.spikeTimes(n).tolist() for n in neurons] == \
+            spikes(neurons)
+
+
+def test_recorder_without_histories():
+    for networkOptions, runOptions in MODES:
+        expected, unused = recordedRun(2, networkOptions, runOptions)
+        neurons, recorder = recordedRun(2, dict(networkOptions,
+                                                recordHistory=False),
+                                        runOptions)
+        assert [n.voltageHistory for n in neurons] == [[0]] * len(neurons)
+        assert spikes(neurons) == [[]] * len(neurons)
+        assert recorder.samples().T.tolist() == \
+            [n.voltageHistory[1:] for n in expected]
+        assert [recorder.spikeTimes(n).tolist() for n in neurons] == \
+            spikes(expected)
+
+
+def test_streaming_round_trip(tmp_path):
+    for networkOptions, runOptions in MODES:
+        unused, expected = recordedRun(0, networkOptions, runOptions, every=2,
+                                       variables=("voltage", "refractCount"))
+        simulator, neurons = randomNetwork(0, **networkOptions)
+        path = str(tmp_path / "recording")
+        recorder = simulator.addRecorder(StreamingRecorder(
+            path, neurons, ("voltage", "refractCount"), every=2, chunkSize=7,
+            spikeChunkSize=5))
+        simulator.main(**runOptions)
+        reader = RecordingReader(path)
+        with open(os.path.join(path, "index.json")) as f:
+            index = json.load(f)
+        assert len(index["sampleChunks"]) == 6
+        assert [c["rows"] for c in index["sampleChunks"]] == [7] * 5 + [5]
+        assert len(index["spikeChunks"]) >= 3
+        assert reader.names == [n.name for n in neurons]
+        assert reader.every == 2
+        assert numpy.array_equal(reader.sampleTimes(),
+                                 expected.sampleTimes())
+        for variable in ("voltage", "refractCount"):
+            assert numpy.array_equal(reader.samples(variable),
+                                     expected.samples(variable))
+            for k in (0, 13):
+                assert numpy.array_equal(
+                    reader.samplesOf(neurons[k], variable),
+                    expected.samplesOf(expected.neurons[k], variable))
+        for read, kept in zip(reader.spikes(), expected.spikes()):
+            assert numpy.array_equal(read, kept)
+        for k in range(len(neurons)):
+            assert numpy.array_equal(reader.spikeTimes(k),
+                                     expected.spikeTimes(expected.neurons[k]))
+        times, samples = next(reader.sampleChunks())
+        assert isinstance(samples, numpy.memmap)
+        assert recorder.reader().names == reader.names
@@ -0,0 +1,220 @@
+import random
+import threading
+import time
+
+import numpy
+import pytest
+
+import graphics
+from Neuron import GraphicSimulator, Neuron, Synapse
+from rendering import COLORS, FrameBuffer, FrameRasterizer, PngWriter,\
+    runRendered
+
+
+class StubWindow(object):
+    """ stands in for graphics.GraphWin: keeps the options of the items
+    drawn on it, and closes itself at its closeAt-th update
+    """
+    closeAt = None
+
+    def __init__(self, title="", width=200, height=200, autoflush=True):
+        self.autoflush = autoflush
+        self.items = {}
+        self.tagged = []
+        self.numUpdates = 0
+        self.closed = False
+
+    def isClosed(self):
+        return self.closed
+
+    def isOpen(self):
+        return not self.closed
+
+    def toScreen(self, x, y):
+        return x, y
+
+    def create_oval(self, x1, y1, x2, y2, options):
+        self.items[len(self.items) + 1] = dict(options, tags=set())
+        return len(self.items)
+
+    create_line = create_oval
+
+    def addItem(self, item):
+        pass
+
+    def dtag(self, tag):
+        for item in self.items.values():
+            item["tags"].discard(tag)
+
+    def addtag_withtag(self, tag, item):
+        self.tagged.append(item)
+        self.items[item]["tags"].add(tag)
+
+    def itemconfigure(self, tag, **options):
+        for item in self.items.values():
+            if tag in item["tags"]:
+                item.update(options)
+
+    def update(self):
+        assert not self.closed
+        self.numUpdates += 1
+        if self.numUpdates == self.closeAt:
+            self.closed = True
+
+
+def test_closing_the_display_stops_the_simulation():
+    frames = FrameBuffer(1)
+    stopped = threading.Event()
+    drawn = []
+
+    def simulate():
+        currentTau = 0
+        while not stopped.is_set():
+            frames.publish(currentTau, [True])
+            currentTau += 1
+            stopped.wait(0.001)
+
+    runRendered(simulate, frames, lambda tau, fired: drawn.append(tau),
+                fps=1000, isOpen=lambda: len(drawn) < 3, stop=stopped.set)
+    assert stopped.is_set()
+    assert len(drawn) == 3
+    assert "simulation" not in [t.name for t in threading.enumerate()]
+
+
+def test_the_display_is_updated_while_nothing_is_published():
+    frames = FrameBuffer(1)
+    stopped = threading.Event()
+    idle = []
+    runRendered(lambda: stopped.wait(10), frames,
+                lambda tau, fired: None, fps=1000,
+                isOpen=lambda: len(idle) < 5, stop=stopped.set,
+                idle=lambda: idle.append(1))
+    assert len(idle) == 5
+
+
+def test_closing_the_window_ends_a_long_simulation(monkeypatch):
+    monkeypatch.setattr(graphics, "GraphWin", StubWindow)
+    # a window that is only updated when a frame is drawn, once per tau,
+    # would close after 10 taus, i.e. 5 seconds
+    monkeypatch.setattr(StubWindow, "closeAt", 10)
+    simulator = GraphicSimulator(t=0.5, finalT=10 ** 6, fps=100)
+    simulator.addNeuron(Neuron(aname="a"))
+    start = time.monotonic()
+    simulator.main()
+    assert time.monotonic() - start < 2
+    assert simulator.stopped
+    assert simulator.nextTau <= 2
+    assert "simulation" not in [t.name for t in threading.enumerate()]
+
+
+def test_only_changed_neurons_are_recolored(monkeypatch):
+    monkeypatch.setattr(graphics, "GraphWin", StubWindow)
+    simulator = GraphicSimulator()
+    neurons = [Neuron(aname=name) for name in "abcd"]
+    for neuron in neurons:
+        simulator.addNeuron(neuron)
+    simulator.makeG()
+    window = simulator.win
+    ids = [simulator.circles[n].id for n in neurons]
+
+    def fills():
+        return [window.items[i]["fill"] for i in ids]
+
+    simulator.drawFrame(0, numpy.array([True, False, True, False]))
+    assert window.tagged == [ids[0], ids[2]]
+    assert fills() == ["red", "black", "red", "black"]
+    del window.tagged[:]
+    simulator.drawFrame(1, numpy.array([True, True, False, False]))
+    assert sorted(window.tagged) == [ids[1], ids[2]]
+    assert fills() == ["red", "red", "black", "black"]
+    assert [window.items[i]["outline"] for i in ids] == fills()
+    del window.tagged[:]
+    simulator.drawFrame(2, numpy.array([True, True, False, False]))
+    assert window.tagged == []
+
+
+class FrameList(object):
+    """ a writer that keeps the frames it is given """
+
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    def write(self, frame):
+        self.frames.append(frame.copy())
+
+    def close(self):
+        self.closed = True
+
+
+def recordedSimulator(finalTau):
+    """ returns (simulator, neurons): three neurons that fire at taus 1,
+    2 and 7 for a, 2 for b and never for c, with a synapse from a to c too
+    weak to fire it
+    """
+    # the layout places the circles at random heights; these stay inside
+    # the frame
+    random.seed(3)
+    simulator = GraphicSimulator(finalT=finalTau, l=400, h=200)
+    a, b, c = Neuron(aname="a"), Neuron(aname="b"), Neuron(aname="c")
+    for neuron in (a, b, c):
+        simulator.addNeuron(neuron)
+    simulator.addSynapse(Synapse(a, c, 0.1, 1))
+    for aTime, aNeuron in ((1, a), (2, a), (2, b), (7, a)):
+        simulator.appendInput(aTime, aNeuron, 1)
+    return simulator, [a, b, c]
+
+
+def colorsAt(frame, simulator, neurons):
+    """ returns the color name of the pixel just above the center of the
+    circle of each neuron, clear of the synapse lines
+    """
+    names = dict((rgb, name) for name, rgb in COLORS.items())
+    centers = [simulator.circles[n].getCenter() for n in neurons]
+    return [names[tuple(frame[int(round(p.getY())) - 3,
+                              int(round(p.getX()))].tolist())]
+            for p in centers]
+
+
+def test_recorded_frames():
+    for eventDriven in (False, True):
+        for ticksPerFrame in (1, 2, 3):
+            simulator, neurons = recordedSimulator(10)
+            writer = FrameList()
+            simulator.main(writer=writer, eventDriven=eventDriven,
+                           ticksPerFrame=ticksPerFrame)
+            assert writer.closed
+            # every tau is in a frame, whether it was simulated or skipped
+            assert len(writer.frames) == -(-10 // ticksPerFrame)
+            assert all(f.shape == (200, 400, 3) for f in writer.frames)
+            for k, frame in enumerate(writer.frames):
+                taus = range(k * ticksPerFrame, (k + 1) * ticksPerFrame)
+                expected = ["red" if any(t in n.spikeTimes for t in taus)
+                            else "black" for n in neurons]
+                assert colorsAt(frame, simulator, neurons) == expected
+            assert [n.spikeTimes for n in neurons] == [[1, 2, 7], [2], []]
+
+
+def test_rasterizer():
+    rasterizer = FrameRasterizer(20, 10, [(4, 4), (14, 4)], [2, 2],
+                                 [(0, 9, 19, 9), (15, 0, 15, 9)],
+                                 ["blue", "green"], indices=[1, 0])
+    frame = rasterizer.render(numpy.array([True, False]))
+    assert tuple(frame[4, 4]) == COLORS["black"]
+    assert tuple(frame[4, 14]) == COLORS["red"]
+    assert tuple(frame[4, 9]) == COLORS["white"]
+    assert [tuple(p) for p in frame[9, :15]] == [COLORS["blue"]] * 15
+    # lines are drawn over the circles
+    assert [tuple(p) for p in frame[:, 15]] == [COLORS["green"]] * 10
+    assert rasterizer.label[4, 4] == 1 and rasterizer.label[4, 14] == 0
+    assert rasterizer.label[4, 15] == -1
+
+
+def test_png_writer(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    simulator, neurons = recordedSimulator(4)
+    writer = PngWriter(str(tmp_path / "frame%03d.png"))
+    simulator.main(writer=writer)
+    assert writer.numWritten == 4
+    image = numpy.asarray(Image.open(str(tmp_path / "frame001.png")))
+    assert colorsAt(image, simulator, neurons) == ["red", "black", "black"]
@@ -0,0 +1,52 @@
+import pytest
+
+from Neuron import InputSchedule, LIFNeuron, Neuron, Simulator, Synapse
+
+
+def chain(vectorized):
+    simulator = Simulator(finalT=12, vectorized=vectorized)
+    a = LIFNeuron(aname="a", adecay=4)
+    b = Neuron(aname="b")
+    simulator.addNeuron(a)
+    simulator.addNeuron(b)
+    simulator.addSynapse(Synapse(a, b, 1, 2))
+    return simulator, a, b
+
+
+def test_float_input_times():
+    results = []
+    for vectorized, eventDriven in ((False, False), (True, False),
+                                    (True, True)):
+        simulator, a, b = chain(vectorized)
+        simulator.appendInput(5.0, a, 2)
+        simulator.appendInput(7.5, a, 2)
+        simulator.appendInputs([2.0, 9.0], [a, a], 0.5)
+        simulator.main(eventDriven=eventDriven)
+        results.append((a.spikeTimes, b.spikeTimes, a.voltageHistory))
+    assert results[0][:2] == ([5], [7])
+    assert results[1] == results[0]
+    assert results[2] == results[0]
+
+
+def test_input_times_are_kept_as_ints():
+    schedule = InputSchedule()
+    a = Neuron(aname="a")
+    schedule.append(4.0, a, 1)
+    schedule.extend([3.0, 6.0], [a, a], 1)
+    assert [type(t) for t, n, v in schedule.remaining()] == [int] * 3
+    assert schedule.nextTime() == 3
+    schedule.append(2.5, a, 1)
+    assert schedule.nextTime() == 3
+    assert schedule.popDue(3) == [(a, 1)]
+
+
+def test_input_array_is_a_read_only_snapshot():
+    simulator = Simulator()
+    a = Neuron(aname="a")
+    simulator.appendInput(3, a, 1)
+    simulator.appendInput(1, a, 2)
+    assert simulator.inputArray == ((1, a, 2), (3, a, 1))
+    with pytest.raises(AttributeError):
+        simulator.inputArray.append((4, a, 1))
+    simulator.inputArray = [(5, a, 1), (2, a, 3)]
+    assert simulator.inputArray == ((2, a, 3), (5, a, 1))
@@ -0,0 +1,70 @@
+from engine import Connectivity
+from Neuron import Neuron, Simulator, Synapse
+from sweep import networkDigest, runOne, sweep
+
+
+def build(weight=1, names=("a", "b"), delay=2):
+    simulator = Simulator(finalT=10)
+    a, b = Neuron(aname=names[0]), Neuron(aname=names[1])
+    simulator.addNeuron(a)
+    simulator.addNeuron(b)
+    simulator.addSynapse(Synapse(a, b, weight, delay))
+    simulator.appendInput(1, a, 1)
+    return simulator
+
+
+def buildStores(sizes=(2, 1)):
+    """ three edges a -> b, split into stores of the given sizes """
+    simulator = Simulator(finalT=10)
+    a, b = Neuron(aname="a"), Neuron(aname="b")
+    simulator.addNeuron(a)
+    simulator.addNeuron(b)
+    for size in sizes:
+        store = Connectivity()
+        store.addEdges([0] * size, [1] * size, 0.5, 1)
+        store.indicesOf([a, b])
+        simulator.addConnectivity(store)
+    return simulator
+
+
+def test_network_digest_covers_the_structure():
+    assert networkDigest(build()) == networkDigest(build())
+    digests = set([networkDigest(build()), networkDigest(build(weight=2)),
+                   networkDigest(build(names=("c", "d"))),
+                   networkDigest(build(delay=1)),
+                   networkDigest(buildStores((2, 1))),
+                   networkDigest(buildStores((1, 2)))])
+    assert len(digests) == 6
+
+
+def test_cached_runs_of_other_networks_are_not_reused(tmp_path):
+    first = runOne(build, {}, str(tmp_path))
+    again = runOne(build, {}, str(tmp_path))
+    renamed = runOne(build, {"names": ("c", "d")}, str(tmp_path))
+    delayed = runOne(build, {"delay": 1}, str(tmp_path))
+    assert not first["cached"] and again["cached"]
+    assert again["names"] == ["a", "b"]
+    assert again["firstSpikes"] == first["firstSpikes"] == [1, 3]
+    assert not renamed["cached"] and renamed["names"] == ["c", "d"]
+    assert not delayed["cached"] and delayed["firstSpikes"] == [1, 2]
+
+
+def buildUnnamed(weight=1):
+    simulator = Simulator(finalT=10)
+    a, b = Neuron(), Neuron()
+    simulator.addNeuron(a)
+    simulator.addNeuron(b)
+    simulator.addSynapse(Synapse(a, b, weight, 2))
+    simulator.appendInput(1, a, 1)
+    return simulator
+
+
+def test_unnamed_neurons_hit_the_cache(tmp_path):
+    grid = {"weight": [1, 2]}
+    first = sweep(buildUnnamed, grid, str(tmp_path), workers=1)
+    again = sweep(buildUnnamed, grid, str(tmp_path), workers=1)
+    assert [s["cached"] for s in first] == [False, False]
+    assert [s["cached"] for s in again] == [True, True]
+    assert [s["firstSpikes"] for s in again] == [[1, 3], [1, 3]]
+    pooled = sweep(buildUnnamed, grid, str(tmp_path), workers=2)
+    assert [s["cached"] for s in pooled] == [True, True]